@@ -1,6 +1,5 @@
 import json
 import logging
-import boto3
 from datetime import datetime, timedelta
 
 logger = logging.getLogger()
@@ -11,11 +10,17 @@ sys.path.insert(0, '/opt/python')
 
 from shared.db_service import DatabaseService
 from shared.auth import authenticate_user
-from shared.response import api_response, error_response
+from shared.response import (
+    api_response, error_response, encode_cursor, decode_cursor, ndjson_response, wants_ndjson
+)
 from shared.config import get_config
 
 def main(event, context):
     """Main handler for admin endpoints"""
+    # Scheduled invocation (EventBridge) - no JWT, not reachable via API Gateway
+    if event.get('action') == 'silent-device-sweep':
+        return sweep_silent_devices(event)
+
     http_method = event.get('requestContext', {}).get('http', {}).get('method', 'GET')
     path = event.get('rawPath', '')
 
@@ -39,28 +44,40 @@ def main(event, context):
         return change_user_type(event, auth)
     elif '/images' in path:
         return get_image_access(event, auth)
+    elif '/silent-devices' in path:
+        return get_silent_devices(event, auth)
     else:
         return error_response(404, "Admin endpoint not found")
 
 def get_all_users(event, auth):
-    """GET /api/manage/users - List all users"""
+    """
+    GET /api/manage/users - List all users
+    With ?format=ndjson (or Accept: application/x-ndjson) the user table is
+    streamed from a server-side cursor as one JSON user per line.
+    """
     try:
         db = DatabaseService()
-        users = db.get_all_users()
 
-        # Remove password hashes
-        for user in users:
-            del user['password_hash']
+        if wants_ndjson(event):
+            return ndjson_response(_without_password(db.iter_all_users()), event=event)
+
+        users = list(_without_password(db.get_all_users()))
 
         return api_response(200, {
             "users": users,
             "count": len(users)
-        })
+        }, event=event)
 
     except Exception as e:
         logger.exception(f"Get all users error: {e}")
         return error_response(500, f"Failed to get users: {str(e)}")
 
+def _without_password(users):
+    """Drop password hashes (mapped to 'password' by the user formatter)"""
+    for user in users:
+        user.pop('password', None)
+        yield user
+
 def change_user_type(event, auth):
     """PUT /api/manage/change-user-type - Change user type (Admin/Standard)"""
     try:
@@ -75,21 +92,22 @@ def change_user_type(event, auth):
         if new_user_type not in ['Admin', 'Standard']:
             return error_response(400, "userType must be 'Admin' or 'Standard'")
 
-        db = DatabaseService()
-
-        # Verify target user exists
-        user = db.find_user_by_id(target_user_id)
-        if not user:
-            return error_response(404, "User not found")
-
         # Prevent self-demotion
         if target_user_id == auth['userId'] and new_user_type == 'Standard':
             return error_response(403, "Cannot demote yourself")
 
-        updated_user = db.update_user(target_user_id, {'userType': new_user_type})
+        db = DatabaseService()
+
+        with db.transaction():
+            # Verify target user exists
+            user = db.find_user_by_id(target_user_id)
+            if not user:
+                return error_response(404, "User not found")
+
+            updated_user = db.update_user(target_user_id, {'type': new_user_type})
 
         if updated_user:
-            del updated_user['password_hash']
+            updated_user.pop('password', None)
             return api_response(200, {
                 "message": f"User type changed to {new_user_type}",
                 "user": updated_user
@@ -113,17 +131,18 @@ def transfer_device(event, auth):
 
         db = DatabaseService()
 
-        # Verify device exists
-        device = db.find_device_by_id(device_id)
-        if not device:
-            return error_response(404, "Device not found")
+        with db.transaction():
+            # Verify device exists
+            device = db.find_device_by_id(device_id)
+            if not device:
+                return error_response(404, "Device not found")
 
-        # Verify new user exists
-        new_user = db.find_user_by_id(new_user_id)
-        if not new_user:
-            return error_response(404, "Target user not found")
+            # Verify new user exists
+            new_user = db.find_user_by_id(new_user_id)
+            if not new_user:
+                return error_response(404, "Target user not found")
 
-        transferred_device = db.transfer_device(device_id, new_user_id)
+            transferred_device = db.transfer_device(device_id, new_user_id)
 
         if transferred_device:
             return api_response(200, {
@@ -146,6 +165,8 @@ def get_image_access(event, auth):
         if not image_key:
             return error_response(400, "Image key required")
 
+        import boto3  # deferred: only the image endpoint talks to S3
+
         config = get_config()
         s3_client = boto3.client('s3')
 
@@ -167,3 +188,78 @@ def get_image_access(event, auth):
     except Exception as e:
         logger.exception(f"Get image access error: {e}")
         return error_response(500, f"Failed to get image access: {str(e)}")
+
+def get_silent_devices(event, auth):
+    """GET /api/manage/silent-devices - Devices silent longer than N minutes"""
+    try:
+        params = event.get('queryStringParameters', {}) or {}
+        config = get_config()
+
+        minutes = int(params.get('minutes', config['SILENT_DEVICE_MINUTES']))
+        limit = min(int(params.get('limit', 100)), 500)
+        if minutes < 1 or limit < 1:
+            return error_response(400, "minutes and limit must be positive")
+
+        after = None
+        if params.get('cursor'):
+            try:
+                after = decode_cursor(params['cursor'])
+                if len(after) != 2 or not all(isinstance(part, str) for part in after):
+                    raise ValueError("Invalid cursor")
+                # (last_seen_at, device_id)
+                datetime.fromisoformat(after[0].replace('Z', '+00:00'))
+            except ValueError:
+                return error_response(400, "Invalid cursor")
+
+        db = DatabaseService()
+        devices = db.get_silent_devices(minutes, limit, after)
+
+        next_cursor = None
+        if len(devices) == limit:
+            last = devices[-1]
+            next_cursor = encode_cursor(last['lastSeen'], last['deviceId'])
+
+        return api_response(200, {
+            "devices": devices,
+            "count": len(devices),
+            "silentMinutes": minutes,
+            "nextCursor": next_cursor
+        }, event=event)
+
+    except Exception as e:
+        logger.exception(f"Get silent devices error: {e}")
+        return error_response(500, f"Failed to get silent devices: {str(e)}")
+
+def sweep_silent_devices(event):
+    """Scheduled sweep - create alert logs for newly silent devices, drop expired window state"""
+    try:
+        config = get_config()
+        minutes = int(event.get('minutes', config['SILENT_DEVICE_MINUTES']))
+        batch_size = int(event.get('batchSize', 100))
+        max_batches = int(event.get('maxBatches', 20))
+
+        db = DatabaseService()
+        alerts_created = 0
+
+        for _ in range(max_batches):
+            alerts = db.create_silence_alerts(minutes, batch_size)
+            alerts_created += len(alerts)
+            if len(alerts) < batch_size:
+                break
+
+        logger.info(f"Silent device sweep created {alerts_created} alerts")
+
+        # Window states of devices that stopped reporting (see condition_windows)
+        windows_expired = db.delete_expired_condition_windows()
+
+        return {
+            "statusCode": 200,
+            "body": json.dumps({"alerts_created": alerts_created, "windows_expired": windows_expired})
+        }
+
+    except Exception as e:
+        logger.exception(f"Silent device sweep error: {e}")
+        return {
+            "statusCode": 500,
+            "body": json.dumps({"error": str(e)})
+        }
@@ -1,5 +1,9 @@
+import os
 import json
+import time
 import logging
+from contextlib import nullcontext
+from datetime import datetime
 
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
@@ -9,14 +13,36 @@ sys.path.insert(0, '/opt/python')
 
 from shared.db_service import DatabaseService
 from shared.auth import authenticate_user
-from shared.response import api_response, error_response
+from shared.response import (
+    api_response, error_response, ndjson_response, wants_ndjson, encode_cursor, decode_cursor
+)
+
+# Longest a feed request waits for new rows (under the 30s function and API Gateway limits)
+FEED_MAX_WAIT_SECONDS = float(os.environ.get("FEED_MAX_WAIT_SECONDS", "20"))
+# Feed requests allowed to wait at once, across all containers. Each one
+# holds a database connection for up to FEED_MAX_WAIT_SECONDS, so keep this
+# well below the instance's max_connections (about 80 on db.t3.micro) less
+# what the other functions need. Beyond it, requests answer right away
+# with Retry-After (short polling).
+FEED_MAX_WAITERS = int(os.environ.get("FEED_MAX_WAITERS", "20"))
+# pg_stat_activity application_name of waiting feed requests
+FEED_APPLICATION_NAME = "alert-feed-wait"
+# Re-query interval while waiting; a NOTIFY wakes the wait sooner
+FEED_POLL_SECONDS = float(os.environ.get("FEED_POLL_SECONDS", "2"))
+# Wait on LISTEN/NOTIFY (off behind poolers without session LISTEN, e.g.
+# transaction-mode pgbouncer: waits then just poll)
+FEED_LISTEN = os.environ.get("FEED_LISTEN", "true").lower() == "true"
+FEED_MAX_LIMIT = 1000
 
 def main(event, context):
     """Main handler for alert logs endpoints"""
     http_method = event.get('requestContext', {}).get('http', {}).get('method', 'GET')
+    path = event.get('rawPath', '')
 
     if http_method == 'OPTIONS':
         return api_response(200, {})
+    elif http_method == 'GET' and path.endswith('/feed'):
+        return get_alert_feed(event)
     elif http_method == 'GET':
         return get_alert_logs(event)
     elif http_method == 'DELETE':
@@ -25,32 +51,118 @@ def main(event, context):
         return error_response(405, "Method not allowed")
 
 def get_alert_logs(event):
-    """GET /api/alertlogs - Get alert history"""
+    """
+    GET /api/alertlogs - Get alert history
+    Paged by limit/offset; ?format=ndjson (or Accept: application/x-ndjson)
+    exports the full history, streamed from a server-side cursor.
+    """
     auth = authenticate_user(event)
     if not auth:
         return error_response(401, "Authentication required")
 
     try:
         params = event.get('queryStringParameters', {}) or {}
+        device_id = params.get('deviceId')
+
+        db = DatabaseService()
+
+        if wants_ndjson(event):
+            return ndjson_response(db.iter_alert_logs(auth['userId'], device_id), event=event)
 
         # Pagination
         limit = int(params.get('limit', 100))
         offset = int(params.get('offset', 0))
 
-        db = DatabaseService()
-        logs = db.get_user_alert_logs(auth['userId'], limit, offset)
+        logs = db.get_alert_logs(auth['userId'], device_id, limit, offset)
 
         return api_response(200, {
             "alertLogs": logs,
             "count": len(logs),
             "limit": limit,
             "offset": offset
-        })
+        }, event=event)
 
     except Exception as e:
         logger.exception(f"Get alert logs error: {e}")
         return error_response(500, f"Failed to get alert logs: {str(e)}")
 
+def get_alert_feed(event):
+    """
+    GET /api/alertlogs/feed - Alert logs created or updated since `cursor`
+    Call it without a cursor (before loading history) to get the current
+    position. ?wait=N long-polls up to N seconds until there is something
+    new, unless FEED_MAX_WAITERS requests already are: then it answers at
+    once with Retry-After. ?readings=true adds each device's latest reading
+    newer than `readingsSince`. Pass the returned cursor/readingsSince to the
+    next call; hasMore means call again right away.
+    """
+    auth = authenticate_user(event)
+    if not auth:
+        return error_response(401, "Authentication required")
+
+    try:
+        params = event.get('queryStringParameters', {}) or {}
+        device_id = params.get('deviceId')
+        user_id = auth['userId']
+
+        after = None
+        if params.get('cursor'):
+            try:
+                feed_xid, alert_id = decode_cursor(params['cursor'])
+                after = (int(feed_xid), str(alert_id))
+            except (ValueError, TypeError):
+                return error_response(400, "Invalid cursor")
+
+        readings = params.get('readings') == 'true'
+        readings_since = params.get('readingsSince')
+        if readings_since:
+            try:
+                datetime.fromisoformat(readings_since.replace('Z', '+00:00'))
+            except ValueError:
+                return error_response(400, "Invalid readingsSince")
+
+        limit = max(1, min(int(params.get('limit', 100)), FEED_MAX_LIMIT))
+        wait = max(0.0, min(float(params.get('wait', 0)), FEED_MAX_WAIT_SECONDS))
+
+        db = DatabaseService()
+        waiting = wait > 0 and after is not None
+        headers = None
+
+        # The slot's connection is held (and LISTENs) until the wait ends
+        with db.listening('alert_feed') if waiting and FEED_LISTEN else nullcontext():
+            with db.session_slot(FEED_APPLICATION_NAME, FEED_MAX_WAITERS) if waiting else nullcontext(False) as slot:
+                if waiting and not slot:
+                    # Connection budget for waiting requests used up: short poll
+                    wait = 0
+                    headers = {"Retry-After": str(max(1, round(FEED_POLL_SECONDS)))}
+                deadline = time.monotonic() + wait
+
+                while True:
+                    logs, position, more = db.get_alert_feed(user_id, after, limit, device_id)
+                    latest = db.get_latest_readings(user_id, readings_since, device_id) if readings else []
+                    remaining = deadline - time.monotonic()
+                    if logs or latest or after is None or remaining <= 0:
+                        break
+                    # Nothing before `position` is left to return
+                    after = position
+                    # Commits, so the wait does not hold a transaction open
+                    db.wait_for_notify(user_id, min(remaining, FEED_POLL_SECONDS))
+
+        body = {
+            "alertLogs": logs,
+            "count": len(logs),
+            "cursor": encode_cursor(*position),
+            "hasMore": more
+        }
+        if readings:
+            body["readings"] = latest
+            body["readingsSince"] = max([r['event_date'] for r in latest], default=readings_since)
+        return api_response(200, body, headers, event=event)
+
+    except Exception as e:
+        logger.exception(f"Get alert feed error: {e}")
+        return error_response(500, f"Failed to get alert feed: {str(e)}")
+
 def delete_alert_log(event):
     """DELETE /api/alertlogs - Delete/clear alert log"""
     auth = authenticate_user(event)
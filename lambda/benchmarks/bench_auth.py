@@ -0,0 +1,53 @@
+"""
+Auth micro-benchmark
+====================
+Per-request cost of authenticate_user with a cold token cache (full
+jwt.decode HMAC verification every call) versus a warm cache.
+
+Usage (from lambda/):
+    python benchmarks/bench_auth.py [iterations]
+"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from shared import auth
+
+CONFIG = {
+    "JWT_SECRET": "benchmark-secret",
+    "JWT_ALGORITHM": "HS256",
+    "JWT_EXPIRY_HOURS": 24,
+}
+
+
+def run(iterations: int) -> None:
+    # Local config in place of Secrets Manager
+    auth.get_config = lambda: CONFIG
+
+    token = auth.create_token("00000000-0000-0000-0000-000000000001", "user")
+    event = {"headers": {"Authorization": f"Bearer {token}"}}
+
+    start = time.perf_counter()
+    for _ in range(iterations):
+        auth.clear_token_cache()
+        assert auth.authenticate_user(event)
+    uncached = (time.perf_counter() - start) / iterations
+
+    auth.clear_token_cache()
+    auth.authenticate_user(event)
+    start = time.perf_counter()
+    for _ in range(iterations):
+        assert auth.authenticate_user(event)
+    cached = (time.perf_counter() - start) / iterations
+
+    print(f"iterations:     {iterations}")
+    print(f"jwt.decode:     {uncached * 1e6:8.2f} us/request")
+    print(f"token cache:    {cached * 1e6:8.2f} us/request")
+    print(f"speedup:        {uncached / cached:8.1f}x")
+
+
+if __name__ == "__main__":
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 20000)
@@ -0,0 +1,70 @@
+"""
+Batch condition evaluation benchmark
+====================================
+Times the numpy evaluator (alert_rules.evaluate_batch) against the scalar
+check_condition loop on a realistic batch where few pairs trigger. That
+both trigger the same (reading, condition, message) triples is checked by
+tests/test_alert_rules.py.
+
+Usage (from lambda/):
+    python benchmarks/bench_conditions.py [readings] [conditions]
+"""
+
+import os
+import sys
+import time
+import random
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from shared import alert_rules
+from shared.row_format import ConditionRow
+
+VALUE_TYPES = list(alert_rules.SENSOR_MAPPINGS.values())
+DEVICES = [f"device-{i:03d}" for i in range(20)]
+
+
+def realistic_batch(readings: int, conditions: int):
+    """Readings mostly inside the condition bands, as in production"""
+    batch = [
+        (random.choice(DEVICES), value_type, round(random.gauss(20, 4), 2))
+        for value_type in random.choices(VALUE_TYPES, k=readings)
+    ]
+    by_type = {
+        value_type: [
+            ConditionRow("cond", "condition", "user", random.choice(DEVICES + [""]), value_type,
+                         round(random.uniform(5, 10), 1), round(random.uniform(30, 35), 1), None,
+                         None, random.choice(["device", "general"]), ["Log"])
+            for _ in range(conditions)
+        ]
+        for value_type in VALUE_TYPES
+    }
+    return batch, by_type
+
+
+def timed(fn, repeat: int = 3) -> float:
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def run(readings: int, conditions: int) -> None:
+    if alert_rules._load_numpy() is None:
+        raise SystemExit("numpy is not installed")
+    random.seed(42)
+
+    batch, by_type = realistic_batch(readings, conditions)
+    scalar = timed(lambda: alert_rules.evaluate_batch(batch, by_type, vectorized=False))
+    vector = timed(lambda: alert_rules.evaluate_batch(batch, by_type))
+    triggered = len(alert_rules.evaluate_batch(batch, by_type))
+    print(f"{readings} readings x {conditions} conditions per valueType ({triggered} triggered)")
+    print(f"  scalar:     {scalar * 1e3:8.1f} ms")
+    print(f"  vectorized: {vector * 1e3:8.1f} ms  ({scalar / vector:.1f}x)")
+
+
+if __name__ == "__main__":
+    args = [int(arg) for arg in sys.argv[1:]]
+    run(*(args + [5000, 50][len(args):]))
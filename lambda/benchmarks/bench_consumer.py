@@ -0,0 +1,219 @@
+"""
+Consumer throughput benchmark
+=============================
+Runs a batch of telemetry messages through the sync consumer
+(consumers/handler.py) serially and in "threads" mode, and through the
+asyncio pipeline (shared/async_consumer.py), against in-process stand-ins for the queue and database that only add a
+fixed latency per round trip. This compares how well each path overlaps
+network waits, not driver speed; measure against real brokers before
+tuning CONSUMER_WORKERS.
+
+Usage (from lambda/):
+    python benchmarks/bench_consumer.py [messages] [latency_ms]
+"""
+
+import os
+import sys
+import json
+import time
+import uuid
+import random
+import asyncio
+import importlib.util
+from contextlib import contextmanager, asynccontextmanager
+
+LAMBDA_DIR = os.path.join(os.path.dirname(__file__), '..')
+sys.path.insert(0, LAMBDA_DIR)
+
+from shared import async_consumer, cache
+
+spec = importlib.util.spec_from_file_location("consumer_handler", os.path.join(LAMBDA_DIR, "consumers", "handler.py"))
+consumer_handler = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(consumer_handler)
+
+CONDITION_COLUMNS = (
+    "id", "type", "user_id", "device_id", "value_type", "min_value", "max_value",
+    "exact_value", "unit", "scope", "notification_methods",
+)
+
+
+class Record(tuple):
+    """asyncpg.Record stand-in: positional access plus keys()"""
+    def keys(self):
+        return CONDITION_COLUMNS
+
+
+def condition_rows(value_type: str) -> list:
+    return [
+        Record((str(uuid.uuid4()), "condition", str(uuid.uuid4()), None, value_type,
+                5.0, 30.0, None, None, "general", ["Log"]))
+        for _ in range(3)
+    ]
+
+
+def messages(count: int) -> list:
+    return [
+        {
+            "type": "telemetry",
+            "userId": str(uuid.uuid4()),
+            "data": {
+                "id": str(uuid.uuid4()),
+                "device_id": f"device-{i % 20:04d}",
+                "timestamp": "2026-10-19T12:00:00+00:00",
+                "temperature": random.uniform(0, 40),
+                "humidity": random.uniform(20, 80),
+            },
+        }
+        for i in range(count)
+    ]
+
+
+# ---- sync stand-ins ----
+
+class SyncDB:
+    def __init__(self, latency: float):
+        self.latency = latency
+
+    @contextmanager
+    def transaction(self):
+        yield self
+
+    def insert_telemetry(self, telemetry_data):
+        time.sleep(self.latency)
+        return {"eventId": telemetry_data["eventId"]}
+
+    def get_conditions_by_value_type(self, value_type, as_rows=False):
+        time.sleep(self.latency)
+        fmt = async_consumer.formatter('condition_row', [(c,) for c in CONDITION_COLUMNS])
+        return [fmt(row) for row in condition_rows(value_type)]
+
+    def get_cache_versions(self):
+        time.sleep(self.latency)
+        return {}
+
+    def create_alert_log(self, alert_data):
+        time.sleep(self.latency)
+        return alert_data
+
+    def get_sensor_baselines(self, pairs):
+        time.sleep(self.latency)
+        return {}
+
+    def save_sensor_baselines(self, rows):
+        if rows:
+            time.sleep(self.latency)
+
+    def resolve_alert_logs(self, alert_ids):
+        if alert_ids:
+            time.sleep(self.latency)
+
+
+def run_sync(batch: list, latency: float) -> float:
+    db = SyncDB(latency)
+    start = time.perf_counter()
+    for message in batch:
+        time.sleep(latency)  # basic_get round trip
+        with db.transaction():
+            consumer_handler.process_message(message, db)
+    return time.perf_counter() - start
+
+
+def run_threads(batch: list, latency: float, workers: int) -> float:
+    consumer_handler.DatabaseService = lambda: SyncDB(latency)
+    start = time.perf_counter()
+    time.sleep(latency * len(batch))  # basic_get round trips happen up front
+    processed, _, errors = consumer_handler.process_parallel(batch, workers)
+    assert processed == len(batch), errors
+    return time.perf_counter() - start
+
+
+# ---- async stand-ins ----
+
+class AsyncMessage:
+    def __init__(self, body: bytes, latency: float):
+        self.body = body
+        self.latency = latency
+
+    async def ack(self):
+        await asyncio.sleep(self.latency)
+
+    async def nack(self, requeue=True):
+        await asyncio.sleep(self.latency)
+
+
+class AsyncQueue:
+    def __init__(self, batch: list, latency: float):
+        self.pending = [AsyncMessage(json.dumps(m).encode(), latency) for m in batch]
+        self.latency = latency
+
+    async def get(self, no_ack=False, fail=True):
+        await asyncio.sleep(self.latency)
+        return self.pending.pop(0) if self.pending else None
+
+
+class AsyncConnection:
+    def __init__(self, latency: float):
+        self.latency = latency
+
+    async def execute(self, query, *args):
+        await asyncio.sleep(self.latency)
+
+    async def fetch(self, query, *args):
+        await asyncio.sleep(self.latency)
+        return condition_rows(*args) if args else []
+
+    async def executemany(self, query, rows):
+        await asyncio.sleep(self.latency)
+
+    @asynccontextmanager
+    async def transaction(self):
+        yield
+
+
+class AsyncPool:
+    def __init__(self, size: int, latency: float):
+        self.connections = asyncio.Semaphore(size)
+        self.latency = latency
+
+    @asynccontextmanager
+    async def acquire(self):
+        async with self.connections:
+            yield AsyncConnection(self.latency)
+
+
+def run_async(batch: list, latency: float, workers: int) -> float:
+    async def go():
+        consumer = async_consumer.AsyncConsumer(AsyncQueue(batch, latency), AsyncPool(workers, latency), workers)
+        result = await consumer.run(len(batch))
+        assert result["processed"] == len(batch), result
+    start = time.perf_counter()
+    asyncio.run(go())
+    return time.perf_counter() - start
+
+
+def cold(runner, *args) -> float:
+    """Time a run from an empty condition cache, as after a deploy"""
+    cache.conditions.clear()
+    return runner(*args)
+
+
+def run(count: int, latency_ms: float) -> None:
+    batch = messages(count)
+    latency = latency_ms / 1000
+    cpus = os.cpu_count() or 1
+    print(f"{count} messages, {latency_ms:.1f} ms per round trip, {cpus} vCPUs")
+
+    sync = cold(run_sync, batch, latency)
+    print(f"  sync:              {sync:7.2f}s  {count / sync:8.1f} msg/s")
+    for workers in sorted({1, 2, 4, cpus, 2 * cpus}):
+        elapsed = cold(run_threads, batch, latency, workers)
+        label = f"threads={workers}:"
+        print(f"  {label:<19}{elapsed:7.2f}s  {count / elapsed:8.1f} msg/s  ({sync / elapsed:.1f}x)")
+    for workers in (1, 4, 8):
+        elapsed = cold(run_async, batch, latency, workers)
+        print(f"  async workers={workers}:   {elapsed:7.2f}s  {count / elapsed:8.1f} msg/s  ({sync / elapsed:.1f}x)")
+
+
+if __name__ == "__main__":
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 200,
+        float(sys.argv[2]) if len(sys.argv) > 2 else 2.0)
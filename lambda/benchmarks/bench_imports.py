@@ -0,0 +1,120 @@
+"""
+Cold-start import profile
+=========================
+Imports each handler in a fresh interpreter under `python -X importtime`
+and reports total import time plus the slowest top-level packages.
+Exits non-zero when a handler goes over its budget, so it can gate CI.
+
+Usage (from lambda/):
+    python benchmarks/bench_imports.py [--runs N] [--top N] [handler ...]
+
+Budgets (ms) can be overridden with IMPORT_BUDGET_MS (all handlers) or
+IMPORT_BUDGET_MS_<HANDLER> (e.g. IMPORT_BUDGET_MS_CONDITIONS=150).
+"""
+
+import os
+import re
+import sys
+import argparse
+import subprocess
+from collections import defaultdict
+
+LAMBDA_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+HANDLERS = ["users", "devices", "telemetry", "conditions", "alertlogs", "admin", "consumers"]
+
+# Milliseconds of import time allowed per handler (median of runs)
+DEFAULT_BUDGETS_MS = {
+    "users": 200,
+    "devices": 200,
+    "telemetry": 250,
+    "conditions": 200,
+    "alertlogs": 200,
+    "admin": 200,
+    "consumers": 250,
+}
+
+# Modules that must not be imported at load time by the given handler
+FORBIDDEN = {
+    "conditions": ["pika", "bcrypt", "boto3"],
+    "alertlogs": ["pika", "bcrypt", "boto3"],
+    "devices": ["pika", "bcrypt", "boto3"],
+    "admin": ["pika", "bcrypt", "boto3"],
+}
+
+IMPORTTIME_LINE = re.compile(r"import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)")
+
+
+def profile_handler(name: str) -> dict:
+    """Import one handler in a fresh interpreter and parse -X importtime output"""
+    env = dict(os.environ, PYTHONPATH=LAMBDA_DIR, PYTHONDONTWRITEBYTECODE="1")
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import handler"],
+        cwd=os.path.join(LAMBDA_DIR, name),
+        env=env,
+        capture_output=True,
+        text=True,
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(f"{name}: import failed\n{proc.stderr[-2000:]}")
+
+    packages = defaultdict(int)
+    modules = set()
+    total_us = 0
+    for line in proc.stderr.splitlines():
+        match = IMPORTTIME_LINE.match(line)
+        if not match:
+            continue
+        self_us, cumulative_us, indent, module = match.groups()
+        modules.add(module)
+        packages[module.split(".")[0]] += int(self_us)
+        if module == "handler":
+            total_us = int(cumulative_us)
+
+    return {"total_us": total_us, "packages": packages, "modules": modules}
+
+
+def budget_for(name: str) -> float:
+    override = os.environ.get(f"IMPORT_BUDGET_MS_{name.upper()}") or os.environ.get("IMPORT_BUDGET_MS")
+    return float(override) if override else DEFAULT_BUDGETS_MS[name]
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("handlers", nargs="*", default=HANDLERS)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=5)
+    args = parser.parse_args()
+
+    failures = []
+    for name in args.handlers:
+        runs = [profile_handler(name) for _ in range(args.runs)]
+        runs.sort(key=lambda r: r["total_us"])
+        median = runs[len(runs) // 2]
+        total_ms = median["total_us"] / 1000
+        budget = budget_for(name)
+
+        status = "ok" if total_ms <= budget else "OVER BUDGET"
+        print(f"{name:<11} {total_ms:8.1f} ms  (budget {budget:.0f} ms)  {status}")
+        heaviest = sorted(median["packages"].items(), key=lambda kv: kv[1], reverse=True)
+        for package, self_us in heaviest[:args.top]:
+            print(f"    {package:<24} {self_us / 1000:8.1f} ms")
+
+        if total_ms > budget:
+            failures.append(f"{name}: {total_ms:.1f} ms > {budget:.0f} ms")
+
+        leaked = [m for m in FORBIDDEN.get(name, []) if m in median["modules"]]
+        if leaked:
+            print(f"    eagerly imports: {', '.join(leaked)}")
+            failures.append(f"{name}: eagerly imports {', '.join(leaked)}")
+
+    if failures:
+        print("\nImport budget check failed:")
+        for failure in failures:
+            print(f"  - {failure}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
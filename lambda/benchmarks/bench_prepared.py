@@ -0,0 +1,94 @@
+"""
+Prepared statement benchmark
+============================
+Runs the hot DatabaseService statements against a real PostgreSQL
+database with DB_PREPARED_STATEMENTS on and off, on one reused
+connection. Writes happen inside a transaction that is rolled back.
+
+Connection settings come from the standard libpq variables
+(PGHOST, PGPORT, PGDATABASE, PGUSER, PGPASSWORD, PGSSLMODE).
+
+Usage (from lambda/):
+    python benchmarks/bench_prepared.py DEVICE_ID [iterations]
+"""
+
+import os
+import sys
+import time
+import uuid
+from datetime import datetime, timezone
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from shared import db_service
+
+CONFIG = {
+    "DB_HOST": os.environ.get("PGHOST", "localhost"),
+    "DB_PORT": int(os.environ.get("PGPORT", "5432")),
+    "DB_NAME": os.environ.get("PGDATABASE", "iotaccessibility"),
+    "DB_USERNAME": os.environ.get("PGUSER", "postgres"),
+    "DB_PASSWORD": os.environ.get("PGPASSWORD", ""),
+    "SECRETS_VERSION": "benchmark",
+}
+
+
+class Rollback(Exception):
+    pass
+
+
+def run_statements(db, device_id: str, user_id: str, iterations: int) -> float:
+    start = time.perf_counter()
+    try:
+        with db.transaction():
+            for _ in range(iterations):
+                db.find_user_by_device(device_id)
+                db.get_conditions_by_value_type("temperature", as_rows=True)
+                db.insert_telemetry({
+                    "eventId": str(uuid.uuid4()),
+                    "deviceId": device_id,
+                    "userId": user_id,
+                    "event_date": datetime.now(timezone.utc),
+                    "values": [{"valueType": "temperature", "value": 21.5}],
+                })
+                db.create_alert_log({
+                    "deviceId": device_id,
+                    "user_id": user_id,
+                    "message": "benchmark",
+                    "condition": {},
+                    "telemetry_data": [],
+                    "timestamp": datetime.now(timezone.utc),
+                })
+            raise Rollback()
+    except Rollback:
+        pass
+    return (time.perf_counter() - start) / iterations
+
+
+def run(device_id: str, iterations: int) -> None:
+    # Local config in place of Secrets Manager
+    db_service.get_config = lambda: CONFIG
+
+    db = db_service.DatabaseService()
+    db.connection_params['sslmode'] = os.environ.get("PGSSLMODE", "prefer")
+    owner = db.find_user_by_device(device_id)
+    if not owner:
+        raise SystemExit(f"device {device_id} not found")
+
+    results = {}
+    for prepared in (False, True, False, True):  # interleaved to even out caching
+        db.prepared = prepared
+        results.setdefault(prepared, []).append(
+            run_statements(db, device_id, owner["userId"], iterations)
+        )
+
+    plain, prep = min(results[False]), min(results[True])
+    print(f"4 hot statements x{iterations}")
+    print(f"  unprepared: {plain * 1e3:8.3f} ms per round")
+    print(f"  prepared:   {prep * 1e3:8.3f} ms per round  ({plain / prep:.2f}x)")
+    db_service.close_idle_connections()
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        raise SystemExit(__doc__)
+    run(sys.argv[1], int(sys.argv[2]) if len(sys.argv) > 2 else 1000)
@@ -0,0 +1,100 @@
+"""
+Response serialization benchmark
+================================
+Serializes realistic telemetry and alert-log pages with the stdlib
+encoder (json.dumps + CustomEncoder) and with api_response's fast path,
+and reports payload sizes with and without compression.
+
+Usage (from lambda/):
+    python benchmarks/bench_response.py [rows ...]
+"""
+
+import os
+import sys
+import json
+import time
+import uuid
+import random
+from decimal import Decimal
+from datetime import datetime, timedelta, timezone
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from shared import response
+
+VALUE_TYPES = ["temperature", "humidity", "pressure", "light", "sound", "airQuality", "battery"]
+
+
+def telemetry_page(rows: int) -> dict:
+    """Rows as the telemetry endpoint returns them (raw datetimes/UUIDs/Decimals)"""
+    now = datetime.now(timezone.utc)
+    device_id = "device-0001"
+    user_id = uuid.uuid4()
+    return {
+        "telemetry": [
+            {
+                "eventId": uuid.uuid4(),
+                "deviceId": device_id,
+                "userId": user_id,
+                "event_date": now - timedelta(seconds=30 * i),
+                "values": [
+                    {"valueType": vt, "value": Decimal(f"{random.uniform(0, 100):.2f}")}
+                    for vt in VALUE_TYPES
+                ],
+                "imageUrl": None,
+            }
+            for i in range(rows)
+        ],
+        "count": rows,
+    }
+
+
+def alert_log_page(rows: int) -> dict:
+    now = datetime.now(timezone.utc)
+    return {
+        "alertLogs": [
+            {
+                "_id": uuid.uuid4(),
+                "deviceId": "device-0001",
+                "user_id": uuid.uuid4(),
+                "message": f"temperature ({30 + i % 10}.0) above maximum (30.0)",
+                "condition": {"valueType": "temperature", "maxValue": Decimal("30.00"), "scope": "device"},
+                "telemetry_data": [{"valueType": "temperature", "value": Decimal("31.50")}],
+                "timestamp": now - timedelta(minutes=i),
+            }
+            for i in range(rows)
+        ],
+        "count": rows,
+    }
+
+
+def timed(fn, repeat: int) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat
+
+
+def run(sizes) -> None:
+    event = {"headers": {"accept-encoding": "gzip, deflate, br"}}
+    print(f"fast backend: {'orjson' if response.orjson else 'json'}; "
+          f"brotli: {'yes' if response.brotli else 'no'}")
+    print(f"{'page':<18} {'stdlib':>10} {'fast':>10} {'speedup':>8} {'raw KB':>8} {'sent KB':>8} {'+compress':>10}")
+
+    for name, builder in (("telemetry", telemetry_page), ("alertlogs", alert_log_page)):
+        for rows in sizes:
+            body = builder(rows)
+            repeat = max(3, 20000 // rows)
+
+            stdlib = timed(lambda: json.dumps(body, cls=response.CustomEncoder), repeat)
+            fast = timed(lambda: response.dumps(body), repeat)
+            compressed = timed(lambda: response.api_response(200, body, event=event), repeat)
+
+            raw = len(response.dumps(body))
+            sent = len(response.api_response(200, body, event=event)["body"])
+            print(f"{name + ' x' + str(rows):<18} {stdlib * 1e3:8.2f}ms {fast * 1e3:8.2f}ms "
+                  f"{stdlib / fast:7.1f}x {raw / 1024:8.1f} {sent / 1024:8.1f} {compressed * 1e3:8.2f}ms")
+
+
+if __name__ == "__main__":
+    run([int(arg) for arg in sys.argv[1:]] or [100, 1000])
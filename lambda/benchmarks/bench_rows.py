@@ -0,0 +1,110 @@
+"""
+Row formatting benchmark
+========================
+Formats synthetic telemetry and condition result sets the old way
+(RealDictCursor-style dict rows + per-row formatting) and with the
+compiled tuple formatters in shared.row_format.
+
+Usage (from lambda/):
+    python benchmarks/bench_rows.py [rows]
+"""
+
+import os
+import sys
+import time
+import uuid
+import random
+from decimal import Decimal
+from datetime import datetime, timedelta, timezone
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from shared import row_format
+
+TELEMETRY_COLUMNS = ("event_id", "device_id", "user_id", "event_date", "values", "image_url", "created_at")
+CONDITION_COLUMNS = (
+    "id", "type", "user_id", "device_id", "value_type", "min_value", "max_value",
+    "exact_value", "unit", "scope", "notification_methods", "created_at", "updated_at",
+)
+
+
+class Description:
+    """Minimal stand-in for a psycopg2 cursor.description entry"""
+    def __init__(self, name):
+        self.name = name
+
+    def __getitem__(self, index):
+        return self.name
+
+
+def telemetry_rows(rows: int) -> list:
+    now = datetime.now(timezone.utc)
+    user_id = uuid.uuid4()
+    return [
+        (uuid.uuid4(), "device-0001", user_id, now - timedelta(seconds=30 * i),
+         [{"valueType": "temperature", "value": round(random.uniform(0, 40), 2)}], None, now)
+        for i in range(rows)
+    ]
+
+
+def condition_rows(rows: int) -> list:
+    now = datetime.now(timezone.utc)
+    return [
+        (uuid.uuid4(), "condition", str(uuid.uuid4()), f"device-{i % 50:04d}", "temperature",
+         Decimal("5.00"), Decimal("30.00"), None, "C", "device", ["Log"], now, now)
+        for i in range(rows)
+    ]
+
+
+def format_telemetry_dict(row: dict) -> dict:
+    """Per-row formatting as done before row_format"""
+    return {
+        'eventId': str(row['event_id']),
+        'deviceId': row['device_id'],
+        'userId': str(row['user_id']),
+        'event_date': row['event_date'].isoformat() if row['event_date'] else None,
+        'values': row.get('values', []),
+        'imageUrl': row.get('image_url'),
+    }
+
+
+def format_condition_dict(row: dict) -> dict:
+    return {
+        '_id': str(row['id']),
+        'type': row.get('type'),
+        'userId': row.get('user_id', ''),
+        'deviceId': row.get('device_id', ''),
+        'valueType': row['value_type'],
+        'minValue': float(row['min_value']) if row.get('min_value') is not None else None,
+        'maxValue': float(row['max_value']) if row.get('max_value') is not None else None,
+        'exactValue': float(row['exact_value']) if row.get('exact_value') is not None else None,
+        'unit': row.get('unit'),
+        'scope': row.get('scope', 'general'),
+        'notificationMethods': row.get('notification_methods', ['Log']),
+    }
+
+
+def timed(fn) -> float:
+    start = time.perf_counter()
+    fn()
+    return time.perf_counter() - start
+
+
+def run(rows: int) -> None:
+    cases = (
+        ("telemetry", TELEMETRY_COLUMNS, telemetry_rows(rows), format_telemetry_dict, "telemetry"),
+        ("condition", CONDITION_COLUMNS, condition_rows(rows), format_condition_dict, "condition"),
+        ("condition (rows)", CONDITION_COLUMNS, condition_rows(rows), format_condition_dict, "condition_row"),
+    )
+    print(f"{'result set':<26} {'dict rows':>10} {'compiled':>10} {'speedup':>8}")
+    for name, columns, tuples, dict_formatter, kind in cases:
+        description = [Description(c) for c in columns]
+
+        # RealDictCursor builds a dict per row before formatting
+        old = timed(lambda: [dict_formatter(dict(zip(columns, row))) for row in tuples])
+        new = timed(lambda: list(map(row_format.formatter(kind, description), tuples)))
+        print(f"{name + ' x' + str(rows):<26} {old * 1e3:8.1f}ms {new * 1e3:8.1f}ms {old / new:7.1f}x")
+
+
+if __name__ == "__main__":
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 100000)
@@ -3,7 +3,7 @@ set -e
 
 SCRIPT_DIR="$(cd "$(dirname "${BASH_SOURCE[0]}")" && pwd)"
 BUILD_DIR="$SCRIPT_DIR/build"
-FUNCTIONS=("users" "devices" "telemetry" "conditions" "alertlogs" "admin" "consumers")
+FUNCTIONS=("users" "devices" "telemetry" "conditions" "alertlogs" "admin" "consumers" "notifications")
 
 echo "🔨 Building Lambda packages..."
 
@@ -23,6 +23,11 @@ pip install \
     PyJWT==2.8.0 \
     bcrypt==4.1.2 \
     boto3==1.34.0 \
+    orjson==3.9.10 \
+    aio-pika==9.4.1 \
+    asyncpg==0.29.0 \
+    numpy==1.26.4 \
+    Brotli==1.1.0 \
     -t "$BUILD_DIR/layer/python/" \
     --quiet --upgrade
 
@@ -8,9 +8,11 @@ logger.setLevel(logging.INFO)
 import sys
 sys.path.insert(0, '/opt/python')
 
+import psycopg2
 from shared.db_service import DatabaseService
 from shared.auth import authenticate_user
-from shared.response import api_response, error_response
+from shared.alert_rules import AGGREGATES
+from shared.response import api_response, error_response, make_etag, etag_matches, not_modified_response
 
 def main(event, context):
     """Main handler for condition endpoints"""
@@ -29,6 +31,44 @@ def main(event, context):
     else:
         return error_response(405, "Method not allowed")
 
+# Optional Azure condition fields accepted on create (valueType is required)
+CONDITION_FIELDS = (
+    'minValue', 'maxValue', 'exactValue', 'unit', 'scope', 'notificationMethods',
+    'aggregate', 'windowSeconds', 'cooldownSeconds', 'hysteresis'
+)
+
+def _is_number(value) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+def validate_condition(fields: dict, creating: bool) -> str:
+    """
+    Error message for invalid condition fields, or None. Mirrors the table's
+    check constraints so bad input is a 400 rather than a failed INSERT/UPDATE.
+    """
+    if creating and not fields.get('valueType'):
+        return "Missing required field: valueType"
+
+    for key in ('minValue', 'maxValue', 'exactValue', 'hysteresis'):
+        if fields.get(key) is not None and not _is_number(fields[key]):
+            return f"{key} must be a number"
+    for key in ('windowSeconds', 'cooldownSeconds'):
+        if fields.get(key) is not None and (not isinstance(fields[key], int) or isinstance(fields[key], bool)):
+            return f"{key} must be an integer"
+
+    aggregate = fields.get('aggregate')
+    if aggregate is not None and aggregate not in AGGREGATES:
+        return f"Invalid aggregate. Use: {', '.join(AGGREGATES)}"
+    window = fields.get('windowSeconds')
+    if window is not None and window <= 0:
+        return "windowSeconds must be greater than 0"
+    if aggregate is not None and window is None and (creating or 'windowSeconds' in fields):
+        return "windowSeconds is required with aggregate"
+
+    for key in ('cooldownSeconds', 'hysteresis'):
+        if fields.get(key) is not None and fields[key] < 0:
+            return f"{key} must not be negative"
+    return None
+
 def create_condition(event):
     """POST /api/conditions - Create alert condition"""
     auth = authenticate_user(event)
@@ -38,47 +78,37 @@ def create_condition(event):
     try:
         body = json.loads(event.get('body', '{}'))
 
-        condition_name = body.get('conditionName')
-        parameter = body.get('parameter')
-        operator = body.get('operator')
-        threshold = body.get('threshold')
+        error = validate_condition(body, creating=True)
+        if error:
+            return error_response(400, error)
 
-        if not all([condition_name, parameter, operator, threshold is not None]):
-            return error_response(400, "Missing required fields: conditionName, parameter, operator, threshold")
+        db = DatabaseService()
 
-        # Validate operator
-        valid_operators = ['>', '<', '>=', '<=', '==', '!=']
-        if operator not in valid_operators:
-            return error_response(400, f"Invalid operator. Use: {', '.join(valid_operators)}")
+        with db.transaction():
+            # If deviceId provided, verify ownership
+            device_id = body.get('deviceId')
+            if device_id:
+                device_owner = db.find_user_by_device(device_id)
+                if not device_owner or device_owner['userId'] != auth['userId']:
+                    return error_response(403, "Device not found or not owned by user")
 
-        db = DatabaseService()
+            condition_data = {
+                "id": str(uuid.uuid4()),
+                "userId": auth['userId'],
+                "deviceId": device_id or '',
+                "valueType": body['valueType']
+            }
+            condition_data.update({k: body[k] for k in CONDITION_FIELDS if body.get(k) is not None})
 
-        # If deviceId provided, verify ownership
-        device_id = body.get('deviceId')
-        if device_id:
-            device_owner = db.find_user_by_device(device_id)
-            if not device_owner or device_owner != auth['userId']:
-                return error_response(403, "Device not found or not owned by user")
-
-        condition_data = {
-            "id": str(uuid.uuid4()),
-            "user_id": auth['userId'],
-            "device_id": device_id,
-            "condition_name": condition_name,
-            "parameter": parameter,
-            "operator": operator,
-            "threshold": threshold,
-            "notification_methods": body.get('notificationMethods', ['email']),
-            "is_active": body.get('isActive', True)
-        }
-
-        condition = db.create_condition(condition_data)
+            condition = db.create_condition(condition_data)
 
         return api_response(201, {
             "message": "Condition created successfully",
             "condition": condition
         })
 
+    except psycopg2.IntegrityError as e:
+        return error_response(400, f"Invalid condition: {e.diag.message_primary}")
     except Exception as e:
         logger.exception(f"Create condition error: {e}")
         return error_response(500, f"Failed to create condition: {str(e)}")
@@ -91,12 +121,19 @@ def get_conditions(event):
 
     try:
         db = DatabaseService()
-        conditions = db.get_user_conditions(auth['userId'])
+
+        with db.transaction():
+            # Answer unchanged polls from the version query alone
+            etag = make_etag('conditions', *db.get_user_conditions_version(auth['userId']))
+            if etag_matches(event, etag):
+                return not_modified_response(etag)
+
+            conditions = db.get_user_conditions(auth['userId'])
 
         return api_response(200, {
             "conditions": conditions,
             "count": len(conditions)
-        })
+        }, event=event, etag=etag)
 
     except Exception as e:
         logger.exception(f"Get conditions error: {e}")
@@ -122,23 +159,30 @@ def update_condition(event):
         if not update_data:
             return error_response(400, "No update data provided")
 
-        # Validate operator if provided
-        if 'operator' in update_data:
-            valid_operators = ['>', '<', '>=', '<=', '==', '!=']
-            if update_data['operator'] not in valid_operators:
-                return error_response(400, f"Invalid operator. Use: {', '.join(valid_operators)}")
+        error = validate_condition(update_data, creating=False)
+        if error:
+            return error_response(400, error)
 
         db = DatabaseService()
-        updated_condition = db.update_condition(condition_id, auth['userId'], update_data)
+
+        # Ownership check and update in one statement
+        condition_exists, updated_condition = db.update_condition_owned(
+            condition_id, auth['userId'], update_data
+        )
 
         if updated_condition:
             return api_response(200, {
                 "message": "Condition updated successfully",
                 "condition": updated_condition
             })
+        elif condition_exists:
+            return error_response(403, "Condition not owned by user")
         else:
-            return error_response(404, "Condition not found or access denied")
+            return error_response(404, "Condition not found")
 
+    except psycopg2.IntegrityError as e:
+        # e.g. an aggregate set on a condition that has no windowSeconds
+        return error_response(400, f"Invalid condition: {e.diag.message_primary}")
     except Exception as e:
         logger.exception(f"Update condition error: {e}")
         return error_response(500, f"Failed to update condition: {str(e)}")
@@ -161,12 +205,16 @@ def delete_condition(event):
             return error_response(400, "conditionId required")
 
         db = DatabaseService()
-        success = db.delete_condition(condition_id, auth['userId'])
+
+        # Ownership check and delete in one statement
+        condition_exists, success = db.delete_condition_owned(condition_id, auth['userId'])
 
         if success:
             return api_response(200, {"message": "Condition deleted successfully"})
+        elif condition_exists:
+            return error_response(403, "Condition not owned by user")
         else:
-            return error_response(404, "Condition not found or access denied")
+            return error_response(404, "Condition not found")
 
     except Exception as e:
         logger.exception(f"Delete condition error: {e}")
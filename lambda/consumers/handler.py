@@ -9,8 +9,13 @@ Processes telemetry messages from RabbitMQ queue:
 Triggered by: CloudWatch Events (scheduled polling) or direct invocation
 """
 
+import os
 import json
+import uuid
 import logging
+from contextlib import contextmanager
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timezone
 
 logger = logging.getLogger()
@@ -21,6 +26,27 @@ sys.path.insert(0, '/opt/python')
 
 from shared.db_service import DatabaseService
 from shared.rabbitmq_service import RabbitMQService
+from shared.cache import condition_sets
+from shared.alert_rules import (
+    SENSOR_MAPPINGS, telemetry_values, condition_applies, alert_record, check_condition, evaluate_batch,
+    evaluate_windows, Baselines, Debouncer, is_debounced, reading_epoch
+)
+
+# "sync": one message at a time; "threads": per-device partitions on a
+# thread pool; "sql": whole batch stored and evaluated in one statement;
+# "async": the asyncio pipeline (shared/async_consumer.py)
+CONSUMER_MODE = os.environ.get("CONSUMER_MODE", "sync")
+# Worker threads in "threads" mode (each uses its own DB connection; set
+# DB_MAX_IDLE_CONNECTIONS to match so they stay pooled between invocations)
+CONSUMER_THREADS = int(os.environ.get("CONSUMER_THREADS", "4"))
+# Messages taken from the queue per invocation
+CONSUMER_BATCH_SIZE = int(os.environ.get("CONSUMER_BATCH_SIZE", "10"))
+# Partitions of at least this many messages are evaluated up front as one
+# batch (numpy-vectorized when installed) instead of per message
+CONSUMER_VECTORIZE_MIN_BATCH = int(os.environ.get("CONSUMER_VECTORIZE_MIN_BATCH", "50"))
+
+# Last-fired state of debounced conditions; lives as long as the warm container
+_debouncer = Debouncer()
 
 
 def main(event, context):
@@ -30,12 +56,14 @@ def main(event, context):
     """
     logger.info("Starting RabbitMQ consumer...")
 
+    if CONSUMER_MODE == 'async':
+        return consume_async()
+
     try:
         rabbitmq = RabbitMQService()
-        db = DatabaseService()
 
-        # Receive messages from queue (batch of up to 10)
-        messages = rabbitmq.receive_messages(max_messages=10)
+        # Receive messages (batch of up to CONSUMER_BATCH_SIZE), priority lane first
+        messages = rabbitmq.receive_messages(max_messages=CONSUMER_BATCH_SIZE, prioritized=True)
 
         if not messages:
             logger.info("No messages in queue")
@@ -44,18 +72,12 @@ def main(event, context):
                 "body": json.dumps({"processed": 0, "message": "No messages to process"})
             }
 
-        processed = 0
-        alerts_triggered = 0
-        errors = []
-
-        for message in messages:
-            try:
-                result = process_message(message, db)
-                processed += 1
-                alerts_triggered += result.get('alerts_triggered', 0)
-            except Exception as e:
-                logger.exception(f"Error processing message: {e}")
-                errors.append(str(e))
+        if CONSUMER_MODE == 'threads':
+            processed, alerts_triggered, errors = process_parallel(messages, CONSUMER_THREADS)
+        elif CONSUMER_MODE == 'sql':
+            processed, alerts_triggered, errors = process_batch_sql(messages)
+        else:
+            processed, alerts_triggered, errors = process_partition(messages)
 
         logger.info(f"Processed {processed} messages, triggered {alerts_triggered} alerts")
 
@@ -76,12 +98,165 @@ def main(event, context):
         }
 
 
-def process_message(message: dict, db: DatabaseService) -> dict:
+def process_partition(messages: list, db: DatabaseService = None) -> tuple:
+    """
+    Process messages in order on one DatabaseService (one connection).
+    Returns (processed, alerts_triggered, errors).
+    """
+    db = db or DatabaseService()
+    processed = 0
+    alerts_triggered = 0
+    errors = []
+
+    planned = None
+    stateful = None
+    if len(messages) >= CONSUMER_VECTORIZE_MIN_BATCH:
+        try:
+            planned, stateful = plan_alerts(messages, db)
+        except Exception as e:
+            logger.warning(f"Batch evaluation failed, evaluating per message: {e}")
+
+    baselines = load_baselines(messages, db)
+    for i, message in enumerate(messages):
+        try:
+            # One connection and transaction per message: telemetry
+            # and its alerts are stored together or not at all
+            with message_transaction(message, db, baselines):
+                result = process_message(message, db, planned[i] if planned else None, stateful, baselines)
+            processed += 1
+            alerts_triggered += result.get('alerts_triggered', 0)
+        except Exception as e:
+            logger.exception(f"Error processing message: {e}")
+            errors.append(str(e))
+
+    flush_baselines(baselines, db)
+    return processed, alerts_triggered, errors
+
+
+def process_parallel(messages: list, workers: int) -> tuple:
+    """
+    Partition messages by device and process the partitions on a thread
+    pool. Messages of one device stay in queue order on a single worker.
+    Returns the same (processed, alerts_triggered, errors) totals.
+    """
+    partitions = defaultdict(list)
+    for message in messages:
+        partitions[(message.get('data') or {}).get('device_id')].append(message)
+
+    processed = 0
+    alerts_triggered = 0
+    errors = []
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, len(partitions)))) as pool:
+        for done, alerts, failures in pool.map(process_partition, partitions.values()):
+            processed += done
+            alerts_triggered += alerts
+            errors += failures
+
+    return processed, alerts_triggered, errors
+
+
+def process_batch_sql(messages: list) -> tuple:
+    """
+    Store the whole batch and create its alerts in a single statement
+    (DatabaseService.store_and_evaluate_batch evaluates conditions in SQL).
+    If the batch fails, e.g. on one bad message, it is rolled back and
+    reprocessed message by message so only the bad ones are reported.
+    """
+    readings = {}
+    telemetry = []
+    for message in messages:
+        if message.get('type') != 'telemetry':
+            logger.warning(f"Unknown message type: {message.get('type')}")
+            continue
+        data = message.get('data', {})
+        reading = telemetry_row(data, message.get('userId'))
+        reading['eventId'] = reading['eventId'] or str(uuid.uuid4())
+        reading['timestamp'] = data.get('timestamp')
+        # A message redelivered within the batch is evaluated once
+        if reading['eventId'] not in readings:
+            readings[reading['eventId']] = reading
+            telemetry.append(message)
+
+    db = DatabaseService()
+    try:
+        alerts = db.store_and_evaluate_batch(list(readings.values())) if readings else []
+    except Exception as e:
+        logger.warning(f"Batch evaluation failed, processing messages one by one: {e}")
+        return process_partition(messages, db)
+
+    for alert in alerts:
+        logger.info(f"Condition triggered: {alert['condition'].get('_id')} - {alert['message']}")
+    alerts_triggered = len(alerts)
+
+    # Debounced, windowed and anomaly conditions keep per-device state, so they run per message
+    errors = []
+    stateful = stateful_conditions(telemetry, db)
+    baselines = load_baselines(telemetry, db)
+    for message in telemetry:
+        try:
+            with message_transaction(message, db, baselines):
+                alerts_triggered += len(stateful_alerts(
+                    message.get('data', {}), message.get('userId'), stateful, baselines, db
+                ))
+                release_alerts(message.get('data', {}), db)
+        except Exception as e:
+            logger.exception(f"Error evaluating stateful conditions: {e}")
+            errors.append(str(e))
+    flush_baselines(baselines, db)
+    return len(messages), alerts_triggered, errors
+
+
+def consume_async():
+    """Process a batch with the asyncio pipeline (aio-pika + asyncpg)"""
+    import asyncio
+    from shared.async_consumer import consume
+
+    try:
+        result = asyncio.run(consume(max_messages=CONSUMER_BATCH_SIZE))
+        logger.info(f"Processed {result['processed']} messages, triggered {result['alerts_triggered']} alerts")
+        return {"statusCode": 200, "body": json.dumps(result)}
+
+    except Exception as e:
+        logger.exception(f"Consumer error: {e}")
+        return {
+            "statusCode": 500,
+            "body": json.dumps({"error": str(e)})
+        }
+
+
+@contextmanager
+def message_transaction(message: dict, db: DatabaseService, baselines: Baselines):
+    """
+    db.transaction() for one message. Evaluating it updates the debouncer
+    and `baselines` in memory; if the transaction rolls back, the device's
+    debounce episodes are dropped (re-seeded from the alert rows) and the
+    baseline updates are undone.
+    """
+    try:
+        with db.transaction():
+            yield
+    except Exception:
+        _debouncer.forget((message.get('data') or {}).get('device_id'))
+        baselines.rollback()
+        raise
+    baselines.commit()
+
+
+def process_message(
+    message: dict,
+    db: DatabaseService,
+    alerts: list = None,
+    stateful: dict = None,
+    baselines: Baselines = None
+) -> dict:
     """
     Process a single telemetry message:
     1. Store telemetry to DB
-    2. Evaluate conditions
+    2. Evaluate conditions (unless `alerts` were already planned for the batch,
+       along with the batch's `stateful` conditions)
     3. Create alerts if needed
+    Anomaly baselines come from the batch's `baselines` (flushed by the
+    caller), or are loaded and saved for this message alone.
     """
     message_type = message.get('type')
 
@@ -97,7 +272,16 @@ def process_message(message: dict, db: DatabaseService) -> dict:
     logger.info(f"Stored telemetry: {telemetry_record.get('eventId')}")
 
     # 2. Evaluate conditions and create alerts
-    alerts = evaluate_conditions(data, user_id, db)
+    own_baselines = baselines is None
+    if own_baselines:
+        baselines = load_baselines([message], db)
+    if alerts is None:
+        alerts = evaluate_conditions(data, user_id, db, baselines)
+    else:
+        alerts = create_alerts(alerts, db) + stateful_alerts(data, user_id, stateful or {}, baselines, db)
+    release_alerts(data, db)
+    if own_baselines:
+        flush_baselines(baselines, db)
 
     return {
         "telemetry_id": telemetry_record.get('eventId'),
@@ -105,138 +289,240 @@ def process_message(message: dict, db: DatabaseService) -> dict:
     }
 
 
-def store_telemetry(data: dict, user_id: str, db: DatabaseService) -> dict:
-    """Store telemetry data to PostgreSQL"""
-
-    # Build values array from telemetry data (Azure format)
-    values = []
-
-    sensor_mappings = {
-        'temperature': 'temperature',
-        'humidity': 'humidity',
-        'pressure': 'pressure',
-        'light_level': 'light',
-        'motion_detected': 'motion',
-        'sound_level': 'sound',
-        'air_quality': 'airQuality',
-        'battery_level': 'battery'
+def plan_alerts(messages: list, db: DatabaseService) -> list:
+    """
+    Evaluate a whole batch at once with alert_rules.evaluate_batch: each
+    valueType's conditions are loaded once and every reading is compared in
+    one vectorized pass. Returns (alert records for each message, {valueType:
+    ([], windowed, anomaly conditions)}) - those need per-device state and are
+    evaluated per message; debounced ones are only debounced when written.
+    """
+    readings = []
+    owners = []
+    for i, message in enumerate(messages):
+        if message.get('type') != 'telemetry':
+            continue
+        data = message.get('data', {})
+        for field, value_type in SENSOR_MAPPINGS.items():
+            if data.get(field) is not None:
+                readings.append((data.get('device_id'), value_type, data[field]))
+                owners.append(i)
+
+    conditions = {}
+    stateful = {}
+    for value_type in {value_type for _, value_type, _ in readings}:
+        plain, windowed, anomaly = condition_sets(db, value_type)
+        conditions[value_type] = plain
+        stateful[value_type] = ([], windowed, anomaly)
+
+    planned = [[] for _ in messages]
+    for index, condition, text in evaluate_batch(readings, conditions):
+        message = messages[owners[index]]
+        device_id, value_type, value = readings[index]
+        planned[owners[index]].append(
+            alert_record(device_id, message.get('userId'), text, condition, value_type, value, message['data'])
+        )
+    return planned, stateful
+
+
+def batch_readings(messages: list) -> set:
+    """(device_id, valueType) pairs with a reading in a batch"""
+    return {
+        ((message.get('data') or {}).get('device_id'), value_type)
+        for message in messages if message.get('type') == 'telemetry'
+        for field, value_type in SENSOR_MAPPINGS.items()
+        if (message.get('data') or {}).get(field) is not None
     }
 
-    for field, value_type in sensor_mappings.items():
-        if data.get(field) is not None:
-            values.append({
-                "valueType": value_type,
-                "value": data[field]
-            })
 
-    telemetry_data = {
-        'eventId': data.get('id'),
-        'deviceId': data.get('device_id'),
-        'userId': user_id,
-        'event_date': data.get('timestamp', datetime.now(timezone.utc).isoformat()),
-        'values': values,
-        'imageUrl': data.get('image_url')
-    }
+def stateful_conditions(messages: list, db: DatabaseService) -> dict:
+    """
+    {valueType: (debounced, windowed, anomaly conditions)} for the value
+    types in a batch: the ones store_and_evaluate_batch leaves out
+    """
+    stateful = {}
+    for value_type in {value_type for _, value_type in batch_readings(messages)}:
+        plain, windowed, anomaly = condition_sets(db, value_type)
+        stateful[value_type] = ([c for c in plain if is_debounced(c)], windowed, anomaly)
+    return stateful
 
-    return db.insert_telemetry(telemetry_data)
 
+def load_baselines(messages: list, db: DatabaseService) -> Baselines:
+    """Anomaly baselines of every device sensor in a batch, in one query"""
+    return Baselines(db.get_sensor_baselines(batch_readings(messages)))
 
-def evaluate_conditions(data: dict, user_id: str, db: DatabaseService) -> list:
-    """
-    Evaluate alert conditions against telemetry data.
-    Creates alert logs for any triggered conditions.
 
-    Azure logic: Check conditions by valueType, compare against min/max/exact values
+def flush_baselines(baselines: Baselines, db: DatabaseService):
+    """Save the baselines a batch changed in one statement"""
+    try:
+        db.save_sensor_baselines(baselines.pending())
+    except Exception as e:
+        # Alerts are already committed; the baselines only lose this batch's readings
+        logger.exception(f"Error saving sensor baselines: {e}")
+
+
+def record_alert(condition, alert: dict, db: DatabaseService) -> dict:
     """
-    alerts = []
+    Write the alert log for a triggered condition. Debounced conditions
+    coalesce into their current alert (same id: occurrences + 1) while it
+    is active or within the cooldown.
+    """
+    if is_debounced(condition):
+        device_id = alert['deviceId']
+        if not _debouncer.known(condition, device_id):
+            _debouncer.seed(condition, device_id, db.get_alert_episode(condition.get('_id'), device_id))
+        epoch = reading_epoch(alert['telemetry_data'][0].get('timestamp'))
+        alert['id'] = _debouncer.trigger(condition, device_id, epoch)
+    return db.create_alert_log(alert)
+
+
+def release_alerts(data: dict, db: DatabaseService):
+    """Resolve debounced alerts whose value moved back out of the hysteresis band"""
     device_id = data.get('device_id')
+    released = []
+    for field, value_type in SENSOR_MAPPINGS.items():
+        value = data.get(field)
+        if value is not None:
+            released += _debouncer.release(device_id, value_type, value)
+    db.resolve_alert_logs(released)
+
+
+def create_alerts(alerts: list, db: DatabaseService) -> list:
+    """Insert alert records planned by plan_alerts"""
+    created = []
+    for alert in alerts:
+        logger.info(f"Condition triggered: {alert['condition'].get('_id')} - {alert['message']}")
+        created.append(record_alert(alert['condition'], alert, db))
+    return created
 
-    # Map telemetry fields to value types
-    sensor_mappings = {
-        'temperature': 'temperature',
-        'humidity': 'humidity',
-        'pressure': 'pressure',
-        'light_level': 'light',
-        'motion_detected': 'motion',
-        'sound_level': 'sound',
-        'air_quality': 'airQuality',
-        'battery_level': 'battery'
-    }
 
-    for field, value_type in sensor_mappings.items():
+def stateful_alerts(data: dict, user_id: str, stateful: dict, baselines: Baselines, db: DatabaseService) -> list:
+    """
+    Apply a message's readings to the `stateful` conditions
+    ({valueType: (debounced, windowed, anomaly)})
+    """
+    alerts = []
+    for field, value_type in SENSOR_MAPPINGS.items():
         value = data.get(field)
-        if value is None:
+        if value is None or value_type not in stateful:
             continue
+        debounced, windowed, anomaly = stateful[value_type]
+        if debounced:
+            alerts += apply_conditions(debounced, data, user_id, value_type, value, db)
+        if windowed:
+            alerts += apply_windows(windowed, data, user_id, value_type, value, db)
+        if anomaly:
+            alerts += apply_anomalies(anomaly, data, user_id, value_type, value, baselines, db)
+    return alerts
 
-        # Get conditions for this value type
-        conditions = db.get_conditions_by_value_type(value_type)
-
-        for condition in conditions:
-            # Check if condition applies to this device or all devices (scope)
-            cond_device_id = condition.get('deviceId')
-            scope = condition.get('scope', 'device')
-
-            if scope == 'device' and cond_device_id and cond_device_id != device_id:
-                continue
-
-            # Check if condition is triggered
-            triggered, message = check_condition(condition, value, value_type)
-
-            if triggered:
-                logger.info(f"Condition triggered: {condition.get('conditionId')} - {message}")
-
-                # Create alert log
-                alert = db.create_alert_log({
-                    'deviceId': device_id,
-                    'userId': user_id,
-                    'message': message,
-                    'condition': condition,
-                    'telemetryData': {
-                        'valueType': value_type,
-                        'value': value,
-                        'timestamp': data.get('timestamp')
-                    }
-                })
-                alerts.append(alert)
 
+def apply_conditions(conditions: list, data: dict, user_id: str, value_type: str, value, db: DatabaseService) -> list:
+    """Check one reading against single-reading conditions and create alerts for the triggered ones"""
+    device_id = data.get('device_id')
+    alerts = []
+    for condition in conditions:
+        # Check if condition applies to this device or all devices (scope)
+        if not condition_applies(condition, device_id):
+            continue
+
+        # Check if condition is triggered
+        triggered, message = check_condition(condition, value, value_type)
+
+        if triggered:
+            logger.info(f"Condition triggered: {condition.get('_id')} - {message}")
+
+            # Create alert log (coalesced for debounced conditions)
+            alerts.append(record_alert(
+                condition, alert_record(device_id, user_id, message, condition, value_type, value, data), db
+            ))
     return alerts
 
 
-def check_condition(condition: dict, value, value_type: str) -> tuple:
+def apply_windows(conditions: list, data: dict, user_id: str, value_type: str, value, db: DatabaseService) -> list:
     """
-    Check if a condition is triggered.
+    Update the device's window states with one reading and create alerts for
+    the windowed conditions it triggers. The states stay locked until the
+    message's transaction commits, so concurrent consumers apply readings
+    of a device one at a time.
+    """
+    device_id = data.get('device_id')
+    windows = {c.get('windowSeconds') for c in conditions if condition_applies(c, device_id)}
+    if not windows:
+        return []
 
-    Azure condition structure:
-    - minValue: trigger if value < minValue
-    - maxValue: trigger if value > maxValue
-    - exactValue: trigger if value == exactValue
+    states = db.get_condition_windows(device_id, value_type, windows)
+    triggered, updated = evaluate_windows(conditions, states, device_id, value_type, value, data.get('timestamp'))
+    if updated:
+        db.save_condition_windows(device_id, value_type, updated)
 
-    Returns: (triggered: bool, message: str)
-    """
-    min_value = condition.get('minValue')
-    max_value = condition.get('maxValue')
-    exact_value = condition.get('exactValue')
-    condition_name = condition.get('conditionName', 'Unnamed condition')
+    alerts = []
+    for condition, message in triggered:
+        logger.info(f"Condition triggered: {condition.get('_id')} - {message}")
+        alerts.append(record_alert(
+            condition, alert_record(device_id, user_id, message, condition, value_type, value, data), db
+        ))
+    return alerts
 
-    try:
-        # Convert to float for comparison (except for motion which is boolean)
-        if value_type == 'motion':
-            # Motion is boolean - check exact match
-            if exact_value is not None and value == exact_value:
-                return True, f"{condition_name}: Motion detected = {value}"
-        else:
-            numeric_value = float(value)
 
-            if min_value is not None and numeric_value < float(min_value):
-                return True, f"{condition_name}: {value_type} ({numeric_value}) below minimum ({min_value})"
+def apply_anomalies(
+    conditions: list,
+    data: dict,
+    user_id: str,
+    value_type: str,
+    value,
+    baselines: Baselines,
+    db: DatabaseService
+) -> list:
+    """Score one reading against the sensor's baseline and create alerts for triggered anomaly conditions"""
+    device_id = data.get('device_id')
+    alerts = []
+    for condition, message in baselines.evaluate(conditions, device_id, value_type, value, data.get('timestamp')):
+        logger.info(f"Condition triggered: {condition.get('_id')} - {message}")
+        alerts.append(record_alert(
+            condition, alert_record(device_id, user_id, message, condition, value_type, value, data), db
+        ))
+    return alerts
+
+
+def telemetry_row(data: dict, user_id: str) -> dict:
+    """Telemetry row (Azure format) for a message's data"""
+    return {
+        'eventId': data.get('id'),
+        'deviceId': data.get('device_id'),
+        'userId': user_id,
+        'event_date': data.get('timestamp', datetime.now(timezone.utc).isoformat()),
+        # Build values array from telemetry data (Azure format)
+        'values': telemetry_values(data),
+        'imageUrl': data.get('image_url')
+    }
 
-            if max_value is not None and numeric_value > float(max_value):
-                return True, f"{condition_name}: {value_type} ({numeric_value}) above maximum ({max_value})"
 
-            if exact_value is not None and numeric_value == float(exact_value):
-                return True, f"{condition_name}: {value_type} ({numeric_value}) equals threshold ({exact_value})"
+def store_telemetry(data: dict, user_id: str, db: DatabaseService) -> dict:
+    """Store telemetry data to PostgreSQL"""
+    return db.insert_telemetry(telemetry_row(data, user_id))
 
-    except (ValueError, TypeError) as e:
-        logger.warning(f"Error comparing values: {e}")
 
-    return False, ""
+def evaluate_conditions(data: dict, user_id: str, db: DatabaseService, baselines: Baselines) -> list:
+    """
+    Evaluate alert conditions against telemetry data.
+    Creates alert logs for any triggered conditions.
+
+    Azure logic: Check conditions by valueType, compare against min/max/exact values
+    """
+    alerts = []
+
+    for field, value_type in SENSOR_MAPPINGS.items():
+        value = data.get(field)
+        if value is None:
+            continue
+
+        # Cached across messages and invocations (shared/cache.py)
+        conditions, windowed, anomaly = condition_sets(db, value_type)
+
+        alerts += apply_conditions(conditions, data, user_id, value_type, value, db)
+        if windowed:
+            alerts += apply_windows(windowed, data, user_id, value_type, value, db)
+        if anomaly:
+            alerts += apply_anomalies(anomaly, data, user_id, value_type, value, baselines, db)
+
+    return alerts
@@ -10,7 +10,7 @@ sys.path.insert(0, '/opt/python')
 
 from shared.db_service import DatabaseService
 from shared.auth import authenticate_user
-from shared.response import api_response, error_response
+from shared.response import api_response, error_response, make_etag, etag_matches, not_modified_response
 
 def main(event, context):
     """Main handler for device endpoints"""
@@ -75,12 +75,19 @@ def get_devices(event):
 
     try:
         db = DatabaseService()
-        devices = db.get_user_devices(auth['userId'])
+
+        with db.transaction(read_only=True):
+            # Answer unchanged polls from the version query alone
+            etag = make_etag('devices', *db.get_user_devices_version(auth['userId']))
+            if etag_matches(event, etag):
+                return not_modified_response(etag)
+
+            devices = db.get_user_devices(auth['userId'])
 
         return api_response(200, {
             "devices": devices,
             "count": len(devices)
-        })
+        }, event=event, etag=etag)
 
     except Exception as e:
         logger.exception(f"Get devices error: {e}")
@@ -108,18 +115,16 @@ def update_device(event):
 
         db = DatabaseService()
 
-        # Verify ownership
-        device_owner = db.find_user_by_device(device_id)
-        if not device_owner or device_owner != auth['userId']:
-            return error_response(403, "Device not found or not owned by user")
-
-        updated_device = db.update_device(device_id, update_data)
+        # Ownership check and update in one statement
+        device_exists, updated_device = db.update_device_owned(device_id, auth['userId'], update_data)
 
         if updated_device:
             return api_response(200, {
                 "message": "Device updated successfully",
                 "device": updated_device
             })
+        elif device_exists:
+            return error_response(403, "Device not owned by user")
         else:
             return error_response(404, "Device not found")
 
@@ -146,15 +151,13 @@ def delete_device(event):
 
         db = DatabaseService()
 
-        # Verify ownership
-        device_owner = db.find_user_by_device(device_id)
-        if not device_owner or device_owner != auth['userId']:
-            return error_response(403, "Device not found or not owned by user")
-
-        success = db.delete_device(device_id)
+        # Ownership check and delete in one statement
+        device_exists, success = db.delete_device_owned(device_id, auth['userId'])
 
         if success:
             return api_response(200, {"message": "Device deleted successfully"})
+        elif device_exists:
+            return error_response(403, "Device not owned by user")
         else:
             return error_response(404, "Device not found")
 
@@ -0,0 +1,47 @@
+"""
+Alert Notification Lambda
+=========================
+Delivers notifications for new alert logs:
+1. Claims alert logs not yet notified
+2. Groups them into one digest per user and channel
+3. Sends the digests through the condition's notificationMethods
+
+Triggered by: CloudWatch Events (scheduled) or direct invocation
+"""
+
+import json
+import logging
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+import sys
+sys.path.insert(0, '/opt/python')
+
+from shared.notifications import dispatch
+
+
+def main(event, context):
+    """
+    Main handler - dispatches pending alert notifications.
+    Triggered by CloudWatch Events; the schedule is the digest window.
+    """
+    logger.info("Starting notification dispatch...")
+
+    try:
+        totals = dispatch()
+        logger.info(
+            f"Notified {totals['alerts']} alerts in {totals['digests_sent']} digests "
+            f"({totals['digests_failed']} failed)"
+        )
+        return {
+            "statusCode": 200,
+            "body": json.dumps(totals)
+        }
+
+    except Exception as e:
+        logger.exception(f"Notification error: {e}")
+        return {
+            "statusCode": 500,
+            "body": json.dumps({"error": str(e)})
+        }
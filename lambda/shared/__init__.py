@@ -1,5 +1,45 @@
-from .config import get_config, get_secrets
-from .db_service import DatabaseService
-from .rabbitmq_service import RabbitMQService
-from .auth import authenticate_user, create_token, hash_password, verify_password
-from .response import api_response, error_response
+"""
+Shared Lambda layer.
+
+Submodules are imported on first attribute access so a handler only pays
+for the dependencies it uses (psycopg2, pika, bcrypt, jwt, boto3).
+"""
+
+import importlib
+
+_EXPORTS = {
+    "get_config": "config",
+    "get_secrets": "config",
+    "refresh_config": "config",
+    "set_secrets_client": "config",
+    "DatabaseService": "db_service",
+    "RabbitMQService": "rabbitmq_service",
+    "authenticate_user": "auth",
+    "create_token": "auth",
+    "hash_password": "auth",
+    "verify_password": "auth",
+    "api_response": "response",
+    "error_response": "response",
+    "make_etag": "response",
+    "etag_matches": "response",
+    "not_modified_response": "response",
+    "encode_cursor": "response",
+    "decode_cursor": "response",
+    "ndjson_response": "response",
+    "wants_ndjson": "response",
+}
+
+__all__ = list(_EXPORTS)
+
+
+def __getattr__(name):
+    module = _EXPORTS.get(name)
+    if module is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(f".{module}", __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(list(globals()) + __all__)
@@ -0,0 +1,593 @@
+"""
+Telemetry alert rules shared by the sync consumer (consumers/handler.py)
+and the asyncio pipeline (async_consumer.py), so both evaluate conditions
+identically.
+"""
+
+import os
+import math
+import uuid
+import logging
+from collections import defaultdict
+from datetime import datetime, timezone
+
+logger = logging.getLogger()
+
+# Time buckets kept per window state: windows are tracked to 1/N of their length
+CONDITION_WINDOW_BUCKETS = int(os.environ.get("CONDITION_WINDOW_BUCKETS", "12"))
+# Readings a sensor baseline needs before z-score conditions can fire
+ANOMALY_MIN_READINGS = int(os.environ.get("ANOMALY_MIN_READINGS", "10"))
+
+# conditions.aggregate values (chk_conditions_aggregate); NULL is a single-reading condition
+AGGREGATES = ('avg', 'change', 'pct_change', 'zscore')
+
+# Telemetry message field -> Azure valueType
+SENSOR_MAPPINGS = {
+    'temperature': 'temperature',
+    'humidity': 'humidity',
+    'pressure': 'pressure',
+    'light_level': 'light',
+    'motion_detected': 'motion',
+    'sound_level': 'sound',
+    'air_quality': 'airQuality',
+    'battery_level': 'battery'
+}
+
+
+def telemetry_values(data: dict) -> list:
+    """Build the Azure values array from a telemetry message's data"""
+    return [
+        {"valueType": value_type, "value": data[field]}
+        for field, value_type in SENSOR_MAPPINGS.items()
+        if data.get(field) is not None
+    ]
+
+
+def condition_applies(condition, device_id: str) -> bool:
+    """Device-scoped conditions only apply to their own device"""
+    cond_device_id = condition.get('deviceId')
+    scope = condition.get('scope', 'device')
+    return not (scope == 'device' and cond_device_id and cond_device_id != device_id)
+
+
+def alert_record(device_id: str, user_id: str, message: str, condition, value_type: str, value, data: dict) -> dict:
+    """Alert log fields for DatabaseService.create_alert_log"""
+    return {
+        'deviceId': device_id,
+        'user_id': user_id,
+        'message': message,
+        'condition': condition.to_dict() if hasattr(condition, 'to_dict') else condition,
+        'telemetry_data': [{
+            'valueType': value_type,
+            'value': value,
+            'timestamp': data.get('timestamp')
+        }],
+        'timestamp': datetime.now(timezone.utc)
+    }
+
+
+def split_conditions(conditions: list) -> tuple:
+    """
+    (single-reading, windowed, anomaly) conditions; see WINDOWED CONDITIONS
+    and ANOMALY CONDITIONS below
+    """
+    plain = []
+    windowed = []
+    anomaly = []
+    for condition in conditions:
+        aggregate = condition.get('aggregate')
+        if not aggregate:
+            plain.append(condition)
+        elif aggregate == 'zscore':
+            anomaly.append(condition)
+        else:
+            windowed.append(condition)
+    return plain, windowed, anomaly
+
+
+def check_condition(condition: dict, value, value_type: str) -> tuple:
+    """
+    Check if a condition is triggered.
+
+    Azure condition structure:
+    - minValue: trigger if value < minValue
+    - maxValue: trigger if value > maxValue
+    - exactValue: trigger if value == exactValue
+
+    Returns: (triggered: bool, message: str)
+    """
+    min_value = condition.get('minValue')
+    max_value = condition.get('maxValue')
+    exact_value = condition.get('exactValue')
+    condition_name = condition.get('conditionName', 'Unnamed condition')
+
+    try:
+        # Convert to float for comparison (except for motion which is boolean)
+        if value_type == 'motion':
+            # Motion is boolean - check exact match
+            if exact_value is not None and value == exact_value:
+                return True, f"{condition_name}: Motion detected = {value}"
+        else:
+            numeric_value = float(value)
+
+            if min_value is not None and numeric_value < float(min_value):
+                return True, f"{condition_name}: {value_type} ({numeric_value}) below minimum ({min_value})"
+
+            if max_value is not None and numeric_value > float(max_value):
+                return True, f"{condition_name}: {value_type} ({numeric_value}) above maximum ({max_value})"
+
+            if exact_value is not None and numeric_value == float(exact_value):
+                return True, f"{condition_name}: {value_type} ({numeric_value}) equals threshold ({exact_value})"
+
+    except (ValueError, TypeError) as e:
+        logger.warning(f"Error comparing values: {e}")
+
+    return False, ""
+
+
+def might_trigger(bounds, value_type: str, value) -> bool:
+    """
+    Cheap pre-check against a valueType's threshold summary (max minValue,
+    min maxValue, exactValues over all its single-reading conditions; see
+    DatabaseService.get_condition_bounds). False means no single-reading
+    condition can fire for this value; True may be a false positive (the
+    summary ignores device scope).
+    """
+    if bounds is None:
+        return False
+    low, high, exacts, _ = bounds
+    if value_type == 'motion':
+        return value in exacts
+    try:
+        numeric_value = float(value)
+    except (ValueError, TypeError):
+        return False
+    return ((low is not None and numeric_value < low)
+            or (high is not None and numeric_value > high)
+            or numeric_value in exacts)
+
+
+# ==================== BATCH EVALUATION ====================
+# readings: [(device_id, value_type, value)]; conditions_by_type: {valueType: [condition]}
+# Both evaluators return [(reading_index, condition, message)] in the order the
+# per-message loop would create the alerts.
+
+_numpy = []
+
+
+def _load_numpy():
+    """numpy if installed (imported on first batch: it is slow to import)"""
+    if not _numpy:
+        try:
+            import numpy
+        except ImportError:
+            numpy = None
+        _numpy.append(numpy)
+    return _numpy[0]
+
+
+def evaluate_batch(readings: list, conditions_by_type: dict, vectorized: bool = True) -> list:
+    """Evaluate every (reading, condition) pair of a batch; vectorized when numpy is available"""
+    np = _load_numpy() if vectorized else None
+    if np is None:
+        return _evaluate_scalar(readings, conditions_by_type)
+    return _evaluate_vectorized(np, readings, conditions_by_type)
+
+
+def _evaluate_scalar(readings: list, conditions_by_type: dict) -> list:
+    triggered = []
+    for index, (device_id, value_type, value) in enumerate(readings):
+        for condition in conditions_by_type.get(value_type) or []:
+            if not condition_applies(condition, device_id):
+                continue
+            hit, message = check_condition(condition, value, value_type)
+            if hit:
+                triggered.append((index, condition, message))
+    return triggered
+
+
+def _reading_float(value, motion: bool) -> float:
+    """check_condition's view of a reading as a float; NaN never triggers"""
+    if motion:
+        # Motion compares the raw value with ==, so only real numbers can match
+        # (ints past 2**53 are not exactly representable, so no vector compare)
+        if isinstance(value, (bool, float)) or (isinstance(value, int) and abs(value) <= 2 ** 53):
+            return float(value)
+        return float('nan')
+    try:
+        return float(value)
+    except (ValueError, TypeError, OverflowError):
+        return float('nan')
+
+
+def _threshold(bound) -> float:
+    return float('nan') if bound is None else float(bound)
+
+
+def _evaluate_vectorized(np, readings: list, conditions_by_type: dict) -> list:
+    """
+    Per valueType: readings as a float column, thresholds as aligned rows
+    (NaN where unset), trigger matrix by broadcasting, device scope as a
+    mask. Messages for the triggered pairs come from check_condition, so
+    they are identical to the scalar path.
+    """
+    by_type = defaultdict(list)
+    for index, (_, value_type, _) in enumerate(readings):
+        by_type[value_type].append(index)
+
+    triggered = []
+    for value_type, indexes in by_type.items():
+        conditions = conditions_by_type.get(value_type) or []
+        if not conditions:
+            continue
+        motion = value_type == 'motion'
+
+        bounds = []
+        scalar_columns = []
+        for column, condition in enumerate(conditions):
+            try:
+                bounds.append((
+                    _threshold(condition.get('minValue')),
+                    _threshold(condition.get('maxValue')),
+                    _threshold(condition.get('exactValue')),
+                ))
+            except (ValueError, TypeError):
+                # Malformed threshold: leave this condition to check_condition
+                bounds.append((float('nan'),) * 3)
+                scalar_columns.append(column)
+        mins, maxs, exacts = (np.array(column, dtype=float) for column in zip(*bounds))
+
+        values = np.array([_reading_float(readings[i][2], motion) for i in indexes], dtype=float)[:, None]
+        hit = values == exacts
+        if not motion:
+            hit |= (values < mins) | (values > maxs)
+
+        device_scoped = np.array([
+            condition.get('scope', 'device') == 'device' and bool(condition.get('deviceId'))
+            for condition in conditions
+        ])
+        condition_devices = np.array([condition.get('deviceId') for condition in conditions], dtype=object)
+        reading_devices = np.array([readings[i][0] for i in indexes], dtype=object)
+        hit &= ~device_scoped | (reading_devices[:, None] == condition_devices)
+
+        for row, column in zip(*np.nonzero(hit)):
+            index = indexes[row]
+            _, message = check_condition(conditions[column], readings[index][2], value_type)
+            triggered.append((index, column, conditions[column], message))
+
+        for column in scalar_columns:
+            condition = conditions[column]
+            for index in indexes:
+                device_id, _, value = readings[index]
+                if condition_applies(condition, device_id):
+                    matched, message = check_condition(condition, value, value_type)
+                    if matched:
+                        triggered.append((index, column, condition, message))
+
+    triggered.sort(key=lambda item: (item[0], item[1]))
+    return [(index, condition, message) for index, _, condition, message in triggered]
+
+
+
+# ==================== WINDOWED CONDITIONS ====================
+# A condition with an `aggregate` compares a value over its last
+# `windowSeconds` instead of the single reading:
+#   avg        - mean of the readings in the window
+#   change     - newest minus oldest reading in the window
+#   pct_change - that change as a percentage of the oldest reading
+# State is kept per (device, valueType, window) and shared by every
+# condition on it: CONDITION_WINDOW_BUCKETS time buckets of
+# [index, count, sum, first, last] plus the newest reading's time, so it
+# stays O(1) in size and is updated without rescanning telemetry.
+
+def reading_epoch(timestamp) -> float:
+    """Reading time in epoch seconds (messages carry ISO strings; now if missing)"""
+    if isinstance(timestamp, datetime):
+        moment = timestamp
+    else:
+        try:
+            moment = datetime.fromisoformat(str(timestamp).replace('Z', '+00:00'))
+        except ValueError:
+            moment = datetime.now(timezone.utc)
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return moment.timestamp()
+
+
+def _finite_number(value):
+    """Reading as a float, None for non-numeric, NaN or infinite values"""
+    try:
+        number = float(value)
+    except (ValueError, TypeError):
+        return None
+    return number if math.isfinite(number) else None
+
+
+def update_window(state: dict, window_seconds: int, epoch: float, value: float) -> dict:
+    """
+    New state with the reading added, or None when it is not newer than the
+    last applied one (late or redelivered readings are not counted twice).
+    """
+    if state and epoch <= state['last']:
+        return None
+    index = int(epoch // (window_seconds / CONDITION_WINDOW_BUCKETS))
+    buckets = [
+        bucket for bucket in (state or {}).get('buckets', [])
+        if bucket[0] > index - CONDITION_WINDOW_BUCKETS
+    ]
+    if buckets and buckets[-1][0] == index:
+        _, count, total, first, _ = buckets[-1]
+        buckets[-1] = [index, count + 1, total + value, first, value]
+    else:
+        buckets.append([index, 1, value, value, value])
+    return {'last': epoch, 'buckets': buckets}
+
+
+def window_value(state: dict, aggregate: str):
+    """Aggregate of a window state; None when undefined"""
+    buckets = state['buckets']
+    if aggregate == 'avg':
+        return sum(bucket[2] for bucket in buckets) / sum(bucket[1] for bucket in buckets)
+    change = buckets[-1][4] - buckets[0][3]
+    if aggregate == 'change':
+        return change
+    if aggregate == 'pct_change' and buckets[0][3]:
+        return change / abs(buckets[0][3]) * 100
+    return None
+
+
+def evaluate_windows(conditions: list, states: dict, device_id: str, value_type: str, value, timestamp) -> tuple:
+    """
+    Apply one reading to the windows of the applicable windowed conditions
+    and check them. `states` maps windowSeconds -> stored state (missing:
+    empty). Returns ([(condition, message)], {windowSeconds: new state}) -
+    only changed states need to be saved.
+    """
+    conditions = [c for c in conditions if condition_applies(c, device_id)]
+    number = _finite_number(value)
+    if number is None:
+        return [], {}
+
+    epoch = reading_epoch(timestamp)
+    updated = {}
+    for window in {c.get('windowSeconds') for c in conditions}:
+        state = update_window(states.get(window), window, epoch, number)
+        if state is not None:
+            updated[window] = state
+
+    triggered = []
+    for condition in conditions:
+        window = condition.get('windowSeconds')
+        if window not in updated:
+            continue
+        aggregate = condition.get('aggregate')
+        aggregated = window_value(updated[window], aggregate)
+        if aggregated is None:
+            continue
+        # Numeric comparison for every valueType (avg of motion is a fraction)
+        label = f"{value_type} {aggregate} over {window}s"
+        hit, message = check_condition(condition, aggregated, label)
+        if hit:
+            triggered.append((condition, message))
+    return triggered, updated
+
+
+
+# ==================== ANOMALY CONDITIONS ====================
+# aggregate 'zscore' fires on a reading's z-score against the sensor's
+# exponentially weighted mean and variance instead of a fixed threshold,
+# e.g. maxValue 3 / minValue -3. windowSeconds is the EWMA time constant: a
+# reading dt seconds after the previous one gets weight 1 - exp(-dt / windowSeconds),
+# so irregular reporting intervals are weighted correctly.
+
+def update_baseline(state: dict, window_seconds: int, epoch: float, value: float) -> tuple:
+    """
+    (new state, z-score of the reading against the previous state). The
+    z-score is None while the baseline warms up; the new state is None when
+    the reading is not newer than the last applied one.
+    """
+    if state is None:
+        return {'mean': value, 'variance': 0.0, 'readings': 1, 'last': epoch}, None
+    if epoch <= state['last']:
+        return None, None
+
+    mean = state['mean']
+    variance = state['variance']
+    score = None
+    if state['readings'] >= ANOMALY_MIN_READINGS and variance > 0:
+        score = (value - mean) / math.sqrt(variance)
+
+    # Incremental EWMA mean and variance (O(1), no history kept)
+    alpha = 1 - math.exp(-(epoch - state['last']) / window_seconds)
+    diff = value - mean
+    increment = alpha * diff
+    return {
+        'mean': mean + increment,
+        'variance': (1 - alpha) * (variance + diff * increment),
+        'readings': state['readings'] + 1,
+        'last': epoch,
+    }, score
+
+
+class Baselines:
+    """
+    EWMA state of the sensors in one batch, keyed by (device_id, valueType,
+    windowSeconds). Loaded once up front, updated in memory per reading and
+    flushed in a single statement (DatabaseService.save_sensor_baselines).
+    Updates since the last commit() are undone by rollback(), so a message
+    whose transaction failed leaves no trace in the flushed baselines. A
+    pipeline that evaluates a message before the previous one is written
+    takes each message's updates with detach() and passes them to
+    rollback() if that message fails.
+    """
+
+    def __init__(self, states: dict = None):
+        self.states = dict(states or {})
+        self.changed = set()
+        # key -> (state, changed) before the first uncommitted update
+        self._undo = {}
+
+    def evaluate(self, conditions: list, device_id: str, value_type: str, value, timestamp) -> list:
+        """Apply one reading; returns [(condition, message)] for the anomaly conditions it triggers"""
+        conditions = [c for c in conditions if condition_applies(c, device_id)]
+        number = _finite_number(value)
+        if not conditions or number is None:
+            return []
+
+        epoch = reading_epoch(timestamp)
+        scores = {}
+        for window in {c.get('windowSeconds') for c in conditions}:
+            key = (device_id, value_type, window)
+            state, scores[window] = update_baseline(self.states.get(key), window, epoch, number)
+            if state is not None:
+                if key not in self._undo:
+                    self._undo[key] = (self.states.get(key), key in self.changed)
+                self.states[key] = state
+                self.changed.add(key)
+
+        triggered = []
+        for condition in conditions:
+            score = scores.get(condition.get('windowSeconds'))
+            if score is None:
+                continue
+            # Rounded so alert messages stay readable
+            hit, message = check_condition(condition, round(score, 3), f"{value_type} z-score")
+            if hit:
+                triggered.append((condition, message))
+        return triggered
+
+    def commit(self):
+        self._undo = {}
+
+    def detach(self) -> dict:
+        """End the current undo log and return it, for a later rollback(undo)"""
+        undo = {key: (state, changed, self.states.get(key)) for key, (state, changed) in self._undo.items()}
+        self._undo = {}
+        return undo
+
+    def rollback(self, undo: dict = None):
+        """
+        Restore the states updated since the last commit(), or those in a
+        detach()ed log that no later reading has updated since
+        """
+        for key, (state, changed, updated) in (self.detach() if undo is None else undo).items():
+            if self.states.get(key) is not updated:
+                continue
+            if state is None:
+                self.states.pop(key, None)
+            else:
+                self.states[key] = state
+            if not changed:
+                self.changed.discard(key)
+
+    def pending(self) -> list:
+        """Changed states as save_sensor_baselines rows; clears the change set"""
+        rows = []
+        for device_id, value_type, window in self.changed:
+            rows.append({
+                'device_id': device_id,
+                'value_type': value_type,
+                'window_seconds': window,
+                **self.states[(device_id, value_type, window)]
+            })
+        self.changed = set()
+        return rows
+
+
+
+# ==================== DEBOUNCE ====================
+# Conditions with cooldownSeconds and/or hysteresis coalesce repeated
+# triggers into one alert_logs row (occurrences, timestamp = first,
+# last_triggered_at = newest) instead of writing a row per reading:
+#   - an alert stays active until the value moves back past the threshold
+#     by `hysteresis` (0 when unset); triggers meanwhile update its row
+#   - after that, a trigger within cooldownSeconds of the previous one
+#     reopens the same row; a later one starts a new alert
+# Hysteresis needs the compared value, so windowed and anomaly conditions
+# only use the cooldown.
+
+def is_debounced(condition) -> bool:
+    return bool(condition.get('cooldownSeconds')) or condition.get('hysteresis') is not None
+
+
+def _still_triggered(condition, value, value_type: str, band: float) -> bool:
+    """check_condition with every threshold moved `band` towards the normal range"""
+    exact_value = condition.get('exactValue')
+    if value_type == 'motion':
+        return exact_value is not None and value == exact_value
+    number = _finite_number(value)
+    if number is None:
+        return False
+    min_value = condition.get('minValue')
+    max_value = condition.get('maxValue')
+    try:
+        return (
+            (min_value is not None and number < float(min_value) + band)
+            or (max_value is not None and number > float(max_value) - band)
+            or (exact_value is not None and number == float(exact_value))
+        )
+    except (ValueError, TypeError):
+        return False
+
+
+class Debouncer:
+    """
+    Last-fired state of debounced conditions per device: {device_id:
+    {condition_id: episode}}. Kept in memory for the warm container and
+    seeded from the latest alert row on a miss (DatabaseService.get_alert_episode),
+    so the alert rows themselves are the persisted state. Devices are only
+    touched by one thread at a time (consumers partition by device).
+    """
+
+    def __init__(self):
+        self.devices = {}
+
+    def known(self, condition, device_id: str) -> bool:
+        return condition.get('_id') in self.devices.get(device_id, {})
+
+    def seed(self, condition, device_id: str, episode: tuple):
+        """Record the latest alert (id, last trigger epoch, resolved) or None"""
+        episodes = self.devices.setdefault(device_id, {})
+        if episode is None:
+            episodes[condition.get('_id')] = None
+            return
+        alert_id, last, resolved = episode
+        episodes[condition.get('_id')] = {
+            'alert_id': alert_id, 'last': last, 'active': not resolved, 'condition': condition
+        }
+
+    def trigger(self, condition, device_id: str, epoch: float) -> str:
+        """Alert id for a trigger: the current episode's, or a new one"""
+        episodes = self.devices.setdefault(device_id, {})
+        episode = episodes.get(condition.get('_id'))
+        cooldown = condition.get('cooldownSeconds') or 0
+        if episode and (episode['active'] or epoch - episode['last'] < cooldown):
+            alert_id = episode['alert_id']
+            epoch = max(epoch, episode['last'])
+        else:
+            alert_id = str(uuid.uuid4())
+        episodes[condition.get('_id')] = {
+            'alert_id': alert_id,
+            'last': epoch,
+            'active': not condition.get('aggregate'),
+            'condition': condition,
+        }
+        return alert_id
+
+    def forget(self, device_id: str):
+        """Drop a device's episodes, e.g. after its alert writes rolled back; they are re-seeded on next use"""
+        self.devices.pop(device_id, None)
+
+    def release(self, device_id: str, value_type: str, value) -> list:
+        """Deactivate alerts whose value cleared the hysteresis band; returns their ids"""
+        released = []
+        for episode in self.devices.get(device_id, {}).values():
+            if not episode or not episode['active']:
+                continue
+            condition = episode['condition']
+            if condition.get('valueType') != value_type:
+                continue
+            if not _still_triggered(condition, value, value_type, condition.get('hysteresis') or 0.0):
+                episode['active'] = False
+                released.append(episode['alert_id'])
+        return released
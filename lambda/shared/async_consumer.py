@@ -0,0 +1,435 @@
+"""
+Asyncio telemetry consumer pipeline.
+
+Does the same work as consumers/handler.py (store telemetry, evaluate
+conditions, write alert logs) with asyncio-native drivers: aio-pika for
+Amazon MQ and asyncpg for PostgreSQL. The stages run concurrently and are
+connected by bounded queues, so network waits overlap and a slow stage
+applies backpressure instead of buffering the whole batch:
+
+    fetch -> incoming[device] -> store (N) -> stored -> evaluate -> results[device] -> write (N)
+
+Each store and write worker owns a shard of devices, so one device's
+readings reach the (single) evaluate stage, and their results are
+written, in the order they were fetched, as window and baseline state
+requires.
+
+Window and baseline states are loaded once per device sensor and updated
+in memory by the evaluate stage, which runs ahead of the writes (so unlike
+the sync consumer, window rows are not locked while a reading is applied).
+A write saves a message's window states, resolves the alerts its reading
+released and inserts its alerts in one transaction, then acks the message;
+if the transaction fails, the message's in-memory updates are undone.
+Failures are nacked without requeue; the queues are declared with the same
+dead-letter arguments as RabbitMQService's, so they go to the queue's
+-dlq. Messages on the priority lane (readings that may trigger an alert)
+are fetched before the main queue's.
+"""
+
+import os
+import ssl
+import json
+import asyncio
+import logging
+from datetime import datetime, timezone
+
+import aio_pika
+import asyncpg
+
+from .config import get_config
+from .rabbitmq_service import queue_declarations
+from .db_service import NUMBERED_STATEMENTS, CACHE_VERSIONS_SQL
+from . import cache
+from .row_format import formatter
+from .alert_rules import (
+    SENSOR_MAPPINGS, telemetry_values, condition_applies, alert_record, check_condition,
+    split_conditions, evaluate_windows, Baselines, Debouncer, is_debounced, reading_epoch
+)
+
+logger = logging.getLogger()
+
+# Items buffered between two stages
+CONSUMER_QUEUE_SIZE = int(os.environ.get("CONSUMER_QUEUE_SIZE", "32"))
+# Concurrent store (one per device shard) and alert-write workers (and pooled DB connections)
+CONSUMER_WORKERS = int(os.environ.get("CONSUMER_WORKERS", "4"))
+# Main-queue messages fetched between checks of an empty priority lane
+CONSUMER_PRIORITY_CHECK_EVERY = int(os.environ.get("CONSUMER_PRIORITY_CHECK_EVERY", "10"))
+
+# Last-fired state of debounced conditions; lives as long as the warm container
+_debouncer = Debouncer()
+
+
+def _timestamp(value) -> datetime:
+    """asyncpg needs datetimes; messages carry ISO strings"""
+    if isinstance(value, datetime):
+        return value
+    if not value:
+        return datetime.now(timezone.utc)
+    return datetime.fromisoformat(value.replace('Z', '+00:00'))
+
+
+class AsyncConsumer:
+    """
+    One pipeline run over a queue and a connection pool. `queue` (and the
+    optional `priority_queue`) needs get(no_ack=False, fail=False) returning
+    messages with body/ack()/nack(); `pool` is an asyncpg pool (or anything
+    with the same acquire() API).
+    """
+
+    def __init__(self, queue, pool, workers: int = CONSUMER_WORKERS, priority_queue=None):
+        self.queue = queue
+        self.priority_queue = priority_queue
+        self.pool = pool
+        self.workers = workers
+        # valueType -> Future of split_conditions(), looked up once per run
+        self._conditions = {}
+        # Anomaly baselines: loaded per device sensor on first use, flushed after the run
+        self._baselines = Baselines()
+        self._baselines_loaded = set()
+        # Window states: (device_id, valueType, windowSeconds) -> state, loaded
+        # on first use, saved with each message's alerts
+        self._windows = {}
+        self._windows_loaded = set()
+        self.processed = 0
+        self.alerts_triggered = 0
+        self.errors = []
+
+    async def run(self, max_messages: int) -> dict:
+        incoming = [asyncio.Queue(CONSUMER_QUEUE_SIZE) for _ in range(self.workers)]
+        stored = asyncio.Queue(CONSUMER_QUEUE_SIZE)
+        results = [asyncio.Queue(CONSUMER_QUEUE_SIZE) for _ in range(self.workers)]
+
+        tasks = [asyncio.create_task(self._stage(shard, self._store, stored)) for shard in incoming]
+        tasks.append(asyncio.create_task(self._stage(stored, self._evaluate, results)))
+        tasks += [asyncio.create_task(self._stage(shard, self._write, None)) for shard in results]
+
+        try:
+            await self._fetch(incoming, max_messages)
+            # Each stage hands an item on before marking it done, so the
+            # queues drain in order
+            for stage_queue in (*incoming, stored, *results):
+                await stage_queue.join()
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            await self._flush_baselines()
+
+        return {
+            "processed": self.processed,
+            "alerts_triggered": self.alerts_triggered,
+            "errors": self.errors if self.errors else None
+        }
+
+    async def _fetch(self, incoming: list, max_messages: int):
+        check_priority = self.priority_queue is not None
+        since_check = 0
+        for _ in range(max_messages):
+            message = None
+            if check_priority:
+                message = await self.priority_queue.get(no_ack=False, fail=False)
+                # Lane empty: take the main queue, and look again in a while
+                check_priority = message is not None
+                since_check = 0
+            if message is None:
+                message = await self.queue.get(no_ack=False, fail=False)
+                if message is None:
+                    break
+                since_check += 1
+                check_priority = self.priority_queue is not None and since_check >= CONSUMER_PRIORITY_CHECK_EVERY
+            payload = self._parse(message)
+            device_id = ((payload or {}).get('data') or {}).get('device_id')
+            await incoming[self._shard(device_id, len(incoming))].put((message, payload))
+
+    @staticmethod
+    def _parse(message):
+        """Message body as a dict, or None if it is not one (the store stage rejects it)"""
+        try:
+            payload = json.loads(message.body)
+        except ValueError:
+            return None
+        return payload if isinstance(payload, dict) else None
+
+    @staticmethod
+    def _shard(device_id, shards: int) -> int:
+        """Store or write worker for a message: the same for every reading of a device"""
+        return hash(device_id) % shards
+
+    async def _stage(self, inbox: asyncio.Queue, handler, outbox):
+        """Run `handler` over `inbox`; a list outbox is sharded by the result's device id (its first item)"""
+        while True:
+            message, item = await inbox.get()
+            try:
+                result = await handler(message, item)
+                if outbox is not None and result is not None:
+                    target = outbox[self._shard(result[0], len(outbox))] if isinstance(outbox, list) else outbox
+                    await target.put((message, result))
+            except Exception as e:
+                logger.exception(f"Error processing message: {e}")
+                self.errors.append(str(e))
+                try:
+                    await message.nack(requeue=False)
+                except Exception as nack_error:
+                    # Channel gone: the broker redelivers the unacked message;
+                    # keep draining so run() does not wait forever
+                    logger.warning(f"Could not nack message: {nack_error}")
+            finally:
+                inbox.task_done()
+
+    async def _store(self, message, payload):
+        """Insert the telemetry row; returns (data, user_id) for evaluation"""
+        if payload is None:
+            raise ValueError("Message body is not a JSON object")
+        if payload.get('type') != 'telemetry':
+            logger.warning(f"Unknown message type: {payload.get('type')}")
+            await message.ack()
+            self.processed += 1
+            return None
+
+        data = payload.get('data', {})
+        user_id = payload.get('userId')
+        async with self.pool.acquire() as conn:
+            try:
+                await conn.execute(
+                    NUMBERED_STATEMENTS['insert_telemetry'],
+                    data.get('id'),
+                    data.get('device_id'),
+                    user_id,
+                    _timestamp(data.get('timestamp')),
+                    json.dumps(telemetry_values(data)),
+                    data.get('image_url')
+                )
+            except asyncpg.UniqueViolationError:
+                # Redelivered after the alert write failed; evaluate again
+                logger.info(f"Telemetry {data.get('id')} already stored")
+        return data, user_id
+
+    async def _conditions_for(self, value_type: str) -> tuple:
+        future = self._conditions.get(value_type)
+        if future is None:
+            future = self._conditions[value_type] = asyncio.ensure_future(self._load_conditions(value_type))
+        try:
+            return await future
+        except Exception:
+            # Let the next message retry the load
+            self._conditions.pop(value_type, None)
+            raise
+
+    async def _load_conditions(self, value_type: str) -> tuple:
+        """(single-reading, windowed, anomaly) conditions, from the container's cache when current"""
+        async with self.pool.acquire() as conn:
+            if cache.versions_due():
+                cache.apply_versions({row['name']: row['version'] for row in await conn.fetch(CACHE_VERSIONS_SQL)})
+            sets, generation = cache.conditions.lookup(value_type)
+            if sets is not cache.MISS:
+                return sets
+            rows = await conn.fetch(NUMBERED_STATEMENTS['conditions_by_value_type'], value_type)
+        if rows:
+            fmt = formatter('condition_row', [(column,) for column in rows[0].keys()])
+            sets = split_conditions([fmt(row) for row in rows])
+        else:
+            sets = [], [], []
+        cache.conditions.store(value_type, sets, generation)
+        return sets
+
+    async def _apply_windows(self, conditions: list, device_id: str, value_type: str, value, timestamp,
+                             undo: dict) -> list:
+        """
+        Update the device's window states in memory; returns [(condition, message)].
+        Records {key: (state before, state after)} in `undo` for _write.
+        """
+        windows = {c.get('windowSeconds') for c in conditions if condition_applies(c, device_id)}
+        missing = [window for window in windows if (device_id, value_type, window) not in self._windows_loaded]
+        if missing:
+            async with self.pool.acquire() as conn:
+                rows = await conn.fetch(NUMBERED_STATEMENTS['condition_windows'], device_id, value_type, missing)
+            for row in rows:
+                # asyncpg returns jsonb as text
+                self._windows[(device_id, value_type, row['window_seconds'])] = json.loads(row['state'])
+            self._windows_loaded.update((device_id, value_type, window) for window in missing)
+
+        states = {}
+        for window in windows:
+            if (device_id, value_type, window) in self._windows:
+                states[window] = self._windows[(device_id, value_type, window)]
+        triggered, updated = evaluate_windows(conditions, states, device_id, value_type, value, timestamp)
+        for window, state in updated.items():
+            key = (device_id, value_type, window)
+            undo[key] = (undo[key][0] if key in undo else self._windows.get(key), state)
+            self._windows[key] = state
+        return triggered
+
+    def _undo_windows(self, undo: dict):
+        """Restore the window states of a failed message that no later reading has updated"""
+        for key, (state, updated) in undo.items():
+            if self._windows.get(key) is not updated:
+                continue
+            if state is None:
+                self._windows.pop(key, None)
+            else:
+                self._windows[key] = state
+
+    async def _score_anomalies(self, conditions: list, device_id: str, value_type: str, value, timestamp) -> list:
+        """Score a reading against the sensor's baseline; returns [(condition, message)]"""
+        if (device_id, value_type) not in self._baselines_loaded:
+            async with self.pool.acquire() as conn:
+                rows = await conn.fetch(NUMBERED_STATEMENTS['sensor_baselines'], [device_id], [value_type])
+            for row in rows:
+                key = (row['device_id'], row['value_type'], row['window_seconds'])
+                self._baselines.states[key] = {
+                    'mean': row['mean'], 'variance': row['variance'], 'readings': row['readings'], 'last': row['last']
+                }
+            self._baselines_loaded.add((device_id, value_type))
+        return self._baselines.evaluate(conditions, device_id, value_type, value, timestamp)
+
+    async def _flush_baselines(self):
+        rows = self._baselines.pending()
+        if not rows:
+            return
+        try:
+            async with self.pool.acquire() as conn:
+                await conn.execute(NUMBERED_STATEMENTS['save_sensor_baselines'], json.dumps(rows))
+        except Exception as e:
+            logger.exception(f"Error saving sensor baselines: {e}")
+
+    async def _evaluate(self, message, item) -> tuple:
+        """
+        Same rules as the sync consumer (alert_rules.check_condition). Returns
+        (device_id, alerts, window undo, baseline undo, released alert ids) for _write.
+        """
+        data, user_id = item
+        device_id = data.get('device_id')
+        alerts = []
+        windows = {}
+        try:
+            for field, value_type in SENSOR_MAPPINGS.items():
+                value = data.get(field)
+                if value is None:
+                    continue
+                conditions, windowed, anomaly = await self._conditions_for(value_type)
+                triggered = []
+                for condition in conditions:
+                    if not condition_applies(condition, device_id):
+                        continue
+                    hit, text = check_condition(condition, value, value_type)
+                    if hit:
+                        triggered.append((condition, text))
+                if windowed:
+                    triggered += await self._apply_windows(
+                        windowed, device_id, value_type, value, data.get('timestamp'), windows
+                    )
+                if anomaly:
+                    triggered += await self._score_anomalies(anomaly, device_id, value_type, value, data.get('timestamp'))
+                for condition, text in triggered:
+                    logger.info(f"Condition triggered: {condition.get('_id')} - {text}")
+                    alert = alert_record(device_id, user_id, text, condition, value_type, value, data)
+                    if is_debounced(condition):
+                        alert['id'] = await self._debounce(condition, device_id, data.get('timestamp'))
+                    alerts.append(alert)
+        except Exception:
+            self._rollback(device_id, windows, self._baselines.detach())
+            raise
+        return device_id, alerts, windows, self._baselines.detach(), self._release(data)
+
+    async def _debounce(self, condition, device_id: str, timestamp) -> str:
+        """Alert id for a debounced trigger (see alert_rules.Debouncer)"""
+        if not _debouncer.known(condition, device_id):
+            async with self.pool.acquire() as conn:
+                episode = await conn.fetchrow(NUMBERED_STATEMENTS['alert_episode'], condition.get('_id'), device_id)
+            _debouncer.seed(condition, device_id, tuple(episode) if episode else None)
+        return _debouncer.trigger(condition, device_id, reading_epoch(timestamp))
+
+    @staticmethod
+    def _release(data: dict) -> list:
+        """Ids of debounced alerts whose value moved back out of the hysteresis band"""
+        released = []
+        for field, value_type in SENSOR_MAPPINGS.items():
+            if data.get(field) is not None:
+                released += _debouncer.release(data.get('device_id'), value_type, data[field])
+        return released
+
+    def _rollback(self, device_id: str, windows: dict, baselines: dict):
+        """Undo a message's in-memory updates after its evaluation or write failed"""
+        # The episodes _evaluate advanced refer to rows that were never
+        # written; re-seed them from the alert rows
+        _debouncer.forget(device_id)
+        self._undo_windows(windows)
+        self._baselines.rollback(baselines)
+
+    async def _write(self, message, result: tuple):
+        """
+        Save the message's window states, resolve released alerts and insert
+        its alerts in one transaction, then ack it
+        """
+        device_id, alerts, windows, baselines, released = result
+        if alerts or windows or released:
+            try:
+                async with self.pool.acquire() as conn:
+                    async with conn.transaction():
+                        if windows:
+                            await conn.executemany(NUMBERED_STATEMENTS['save_condition_window'], [
+                                (key[0], key[1], key[2], json.dumps(state)) for key, (_, state) in windows.items()
+                            ])
+                        if released:
+                            await conn.execute(NUMBERED_STATEMENTS['resolve_alert_logs'], released)
+                        if alerts:
+                            await conn.executemany(NUMBERED_STATEMENTS['insert_alert_log'], [
+                                (
+                                    alert.get('id'),
+                                    alert['deviceId'],
+                                    alert['user_id'],
+                                    alert['message'],
+                                    json.dumps(alert['condition'], default=str),
+                                    json.dumps(alert['telemetry_data'], default=str),
+                                    alert['timestamp']
+                                )
+                                for alert in alerts
+                            ])
+            except Exception:
+                self._rollback(device_id, windows, baselines)
+                raise
+        await message.ack()
+        self.processed += 1
+        self.alerts_triggered += len(alerts)
+
+
+async def _declare(channel, name: str):
+    """Declare a queue and its dead-letter queue as RabbitMQService does"""
+    for queue_name, arguments in queue_declarations(name):
+        queue = await channel.declare_queue(queue_name, durable=True, arguments=arguments)
+    return queue
+
+
+async def consume(max_messages: int = 10, queue_name: str = None, workers: int = CONSUMER_WORKERS) -> dict:
+    """Connect to Amazon MQ and PostgreSQL, run one pipeline batch, disconnect"""
+    config = get_config()
+
+    # Amazon MQ requires TLS
+    connection = await aio_pika.connect(
+        host=config["RABBITMQ_HOST"],
+        port=config["RABBITMQ_PORT"],
+        login=config["RABBITMQ_USERNAME"],
+        password=config["RABBITMQ_PASSWORD"],
+        virtualhost="/",
+        ssl=True,
+        ssl_context=ssl.create_default_context(),
+    )
+    pool = await asyncpg.create_pool(
+        host=config['DB_HOST'],
+        port=config['DB_PORT'],
+        database=config['DB_NAME'],
+        user=config['DB_USERNAME'],
+        password=config['DB_PASSWORD'],
+        ssl='require',
+        min_size=1,
+        max_size=workers,
+    )
+    try:
+        channel = await connection.channel()
+        await channel.set_qos(prefetch_count=CONSUMER_QUEUE_SIZE)
+        queue = await _declare(channel, queue_name or config["QUEUE_NAME"])
+        priority_queue = await _declare(channel, config["PRIORITY_QUEUE_NAME"])
+        return await AsyncConsumer(queue, pool, workers, priority_queue).run(max_messages)
+    finally:
+        await pool.close()
+        await connection.close()
@@ -1,18 +1,33 @@
+import os
 import jwt
-import bcrypt
+import time
+import hashlib
 import logging
+import threading
+from collections import OrderedDict
 from datetime import datetime, timedelta, timezone
 from .config import get_config
 
 logger = logging.getLogger()
 
+# Verified-token cache: sha256(token) -> (secret, algorithm, exp, claims).
+# Entries are only served while exp is in the future and the signing
+# secret/algorithm they were verified with is still the configured one.
+TOKEN_CACHE_SIZE = int(os.environ.get("JWT_CACHE_SIZE", "1024"))
+_token_cache = OrderedDict()
+_token_cache_lock = threading.Lock()
+
 def hash_password(password: str) -> str:
     """Hash a password using bcrypt"""
+    import bcrypt  # deferred: only users/ needs password hashing
+
     salt = bcrypt.gensalt(rounds=12)
     return bcrypt.hashpw(password.encode('utf-8'), salt).decode('utf-8')
 
 def verify_password(password: str, password_hash: str) -> bool:
     """Verify a password against its hash"""
+    import bcrypt
+
     try:
         return bcrypt.checkpw(password.encode('utf-8'), password_hash.encode('utf-8'))
     except Exception as e:
@@ -32,6 +47,34 @@ def create_token(user_id: str, user_type: str = "user") -> str:
 
     return jwt.encode(payload, config["JWT_SECRET"], algorithm=config["JWT_ALGORITHM"])
 
+def _get_cached_claims(key: bytes, secret: str, algorithm: str):
+    """Return cached claims for a token hash, or None on miss/expiry/rotation"""
+    with _token_cache_lock:
+        entry = _token_cache.get(key)
+        if entry is None:
+            return None
+
+        cached_secret, cached_algorithm, exp, claims = entry
+        if cached_secret != secret or cached_algorithm != algorithm or exp <= time.time():
+            del _token_cache[key]
+            return None
+
+        _token_cache.move_to_end(key)
+        return claims
+
+def _cache_claims(key: bytes, secret: str, algorithm: str, exp: float, claims: dict):
+    """Store verified claims, evicting the least recently used entry when full"""
+    with _token_cache_lock:
+        _token_cache[key] = (secret, algorithm, exp, claims)
+        _token_cache.move_to_end(key)
+        while len(_token_cache) > TOKEN_CACHE_SIZE:
+            _token_cache.popitem(last=False)
+
+def clear_token_cache():
+    """Drop all cached token verifications"""
+    with _token_cache_lock:
+        _token_cache.clear()
+
 def authenticate_user(event: dict) -> dict:
     """
     Authenticate user from JWT in Authorization header.
@@ -53,18 +96,32 @@ def authenticate_user(event: dict) -> dict:
     else:
         token = auth_header
 
+    secret = config["JWT_SECRET"]
+    algorithm = config["JWT_ALGORITHM"]
+    cache_key = hashlib.sha256(token.encode('utf-8')).digest()
+
+    cached = _get_cached_claims(cache_key, secret, algorithm)
+    if cached is not None:
+        return dict(cached)
+
     try:
         payload = jwt.decode(
             token,
-            config["JWT_SECRET"],
-            algorithms=[config["JWT_ALGORITHM"]]
+            secret,
+            algorithms=[algorithm]
         )
 
-        return {
+        claims = {
             "userId": payload.get("userId"),
             "userType": payload.get("userType", "user")
         }
 
+        # Tokens without exp are verified every time rather than cached forever
+        if payload.get("exp") is not None:
+            _cache_claims(cache_key, secret, algorithm, float(payload["exp"]), claims)
+
+        return dict(claims)
+
     except jwt.ExpiredSignatureError:
         logger.warning("JWT token expired")
         return None
@@ -0,0 +1,249 @@
+"""
+Cross-invocation caches for conditions, their threshold bounds and device owners.
+
+Both live as long as the container and are kept fresh by the database
+rather than by a TTL. Triggers on conditions and devices (migrations 007
+and 009, once per statement) bump a counter in cache_versions and NOTIFY
+'cache_invalidation' with the changed keys:
+
+- Long-lived processes (CACHE_LISTEN=true) run a listener thread on a
+  dedicated connection that evicts exactly the keys named in each
+  notification.
+- Lambdas are frozen between invocations and cannot hold a listener, so
+  sync_caches() reads the counters instead: one small query, at most every
+  CACHE_VERSION_CHECK_SECONDS, that clears a cache whose counter moved.
+
+    sync_caches(db)
+    owner = device_owner(db, device_id)
+    plain, windowed, anomaly = condition_sets(db, value_type)
+    bounds = condition_bounds(db, value_types)
+"""
+
+import os
+import json
+import time
+import select
+import logging
+import threading
+
+from .alert_rules import split_conditions
+
+logger = logging.getLogger()
+
+# Longest a Lambda serves cached entries before re-reading the version counters
+CACHE_VERSION_CHECK_SECONDS = float(os.environ.get("CACHE_VERSION_CHECK_SECONDS", "1"))
+# Run the LISTEN thread (long-lived consumers and workers, not Lambda)
+CACHE_LISTEN = os.environ.get("CACHE_LISTEN", "false").lower() == "true"
+# Entries kept per cache; the oldest is dropped beyond this
+CACHE_MAX_ENTRIES = int(os.environ.get("CACHE_MAX_ENTRIES", "10000"))
+
+CACHE_CHANNEL = "cache_invalidation"
+
+# lookup() result for a key that is not cached
+MISS = object()
+
+
+class VersionedCache:
+    """
+    Thread-safe key -> value cache for one cache_versions counter (`name`
+    unless `counter` is given). A value loaded while an eviction ran is not
+    stored, so a load racing an invalidation cannot put the old row back.
+    """
+
+    def __init__(self, name: str, counter: str = None, max_entries: int = CACHE_MAX_ENTRIES):
+        self.name = name
+        self.counter = counter or name
+        self.max_entries = max_entries
+        self.version = None
+        self._entries = {}
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    def lookup(self, key) -> tuple:
+        """(cached value or MISS, generation to pass to store() after loading)"""
+        with self._lock:
+            return self._entries.get(key, MISS), self._generation
+
+    def store(self, key, value, generation: int):
+        with self._lock:
+            if generation == self._generation:
+                if len(self._entries) >= self.max_entries:
+                    del self._entries[next(iter(self._entries))]
+                self._entries[key] = value
+
+    def load(self, key, loader):
+        """Cached value of `key`, calling loader() on a miss"""
+        value, generation = self.lookup(key)
+        if value is MISS:
+            value = loader()
+            self.store(key, value, generation)
+        return value
+
+    def evict(self, keys):
+        with self._lock:
+            for key in keys:
+                self._entries.pop(key, None)
+            self._generation += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._generation += 1
+
+    def sync(self, version):
+        """Clear if the table changed since the last check"""
+        if version != self.version:
+            if self.version is not None:
+                logger.info(f"Cache {self.name} invalidated (version {self.version} -> {version})")
+            self.clear()
+            self.version = version
+
+
+# valueType -> split_conditions() of its condition rows
+conditions = VersionedCache("conditions")
+# valueType -> (max minValue, min maxValue, exactValues) of its single-reading
+# conditions plus whether any of its conditions keeps per-device state, or
+# None if it has no conditions (DatabaseService.get_condition_bounds)
+bounds = VersionedCache("condition_bounds", counter="conditions")
+# device_id -> owning user id (None: no such device). Only the id is kept:
+# no trigger watches the other user columns.
+device_owners = VersionedCache("device_owners")
+
+# cache_versions counter -> the caches it invalidates
+CACHES = {}
+for _cache in (conditions, bounds, device_owners):
+    CACHES.setdefault(_cache.counter, []).append(_cache)
+
+_checked = {"at": float("-inf")}
+_listener = [None]
+
+
+def versions_due() -> bool:
+    """Whether the version counters should be read now (never while a listener is connected)"""
+    if CACHE_LISTEN and _listener[0] is None:
+        start_listener()
+    if _listener[0] is not None and _listener[0].connected:
+        return False
+    return time.monotonic() - _checked["at"] >= CACHE_VERSION_CHECK_SECONDS
+
+
+def apply_versions(versions: dict):
+    """Clear the caches whose counters moved ({cache name: version})"""
+    for counter, caches in CACHES.items():
+        for cache in caches:
+            cache.sync(versions.get(counter))
+    _checked["at"] = time.monotonic()
+
+
+def sync_caches(db):
+    """Bring the caches up to date; call before reading them in a request"""
+    if versions_due():
+        apply_versions(db.get_cache_versions())
+
+
+def condition_sets(db, value_type: str) -> tuple:
+    """(single-reading, windowed, anomaly) conditions of a value type, cached"""
+    sync_caches(db)
+    return conditions.load(
+        value_type, lambda: split_conditions(db.get_conditions_by_value_type(value_type, as_rows=True))
+    )
+
+
+def condition_bounds(db, value_types) -> dict:
+    """{valueType: bounds} (see `bounds` above), cached; misses load in one query"""
+    sync_caches(db)
+    found = {}
+    missing = {}
+    for value_type in value_types:
+        value, generation = bounds.lookup(value_type)
+        if value is MISS:
+            missing[value_type] = generation
+        else:
+            found[value_type] = value
+    if missing:
+        loaded = db.get_condition_bounds(list(missing))
+        for value_type, generation in missing.items():
+            found[value_type] = loaded.get(value_type)
+            bounds.store(value_type, found[value_type], generation)
+    return found
+
+
+def device_owner(db, device_id: str):
+    """{"userId"} of a device's owner (None: no such device), cached"""
+    def load():
+        owner = db.find_user_by_device(device_id)
+        return owner['userId'] if owner is not None else None
+
+    sync_caches(db)
+    user_id = device_owners.load(device_id, load)
+    return {"userId": user_id} if user_id is not None else None
+
+
+def invalidate(payload: str):
+    """Apply one notification: {"cache", "table", "keys"} (keys null: too many to list)"""
+    message = json.loads(payload)
+    keys = message.get("keys")
+    for cache in CACHES.get(message.get("cache"), []):
+        if keys is None:
+            cache.clear()
+        else:
+            cache.evict(keys)
+
+
+class InvalidationListener(threading.Thread):
+    """
+    LISTENs on CACHE_CHANNEL and evicts the keys each notification names.
+    Notifications sent while disconnected are lost, so every (re)connect
+    clears the caches.
+    """
+
+    def __init__(self, connect, poll_seconds: float = 5.0):
+        super().__init__(name="cache-invalidation", daemon=True)
+        self.connect = connect
+        self.poll_seconds = poll_seconds
+        self.connected = False
+        self._stopping = threading.Event()
+
+    def run(self):
+        backoff = 1.0
+        while not self._stopping.is_set():
+            conn = None
+            try:
+                conn = self.connect(CACHE_CHANNEL)
+                for caches in CACHES.values():
+                    for cache in caches:
+                        cache.clear()
+                self.connected = True
+                backoff = 1.0
+                while not self._stopping.is_set():
+                    if not select.select([conn], [], [], self.poll_seconds)[0]:
+                        # Idle: a round trip notices a dropped connection
+                        with conn.cursor() as cursor:
+                            cursor.execute("SELECT 1")
+                    conn.poll()
+                    while conn.notifies:
+                        invalidate(conn.notifies.pop(0).payload)
+            except Exception as e:
+                logger.warning(f"Cache invalidation listener disconnected: {e}")
+            finally:
+                # Lambda-style version checks take over until reconnected
+                self.connected = False
+                if conn is not None and not conn.closed:
+                    conn.close()
+            self._stopping.wait(backoff)
+            backoff = min(backoff * 2, 60.0)
+
+    def stop(self):
+        self._stopping.set()
+
+
+def start_listener(connect=None) -> InvalidationListener:
+    """Start the container's listener (once); `connect(channel)` defaults to DatabaseService.listen"""
+    if _listener[0] is None:
+        if connect is None:
+            from .db_service import DatabaseService
+
+            connect = DatabaseService().listen
+        _listener[0] = InvalidationListener(connect)
+        _listener[0].start()
+    return _listener[0]
@@ -1,26 +1,63 @@
 import os
 import json
-import boto3
-from functools import lru_cache
+import time
+import logging
+import threading
+from types import MappingProxyType
 
-@lru_cache(maxsize=1)
-def get_secrets():
-    """Load secrets from AWS Secrets Manager with caching"""
+logger = logging.getLogger()
+
+# Seconds a loaded config is served before Secrets Manager is consulted again
+CONFIG_TTL_SECONDS = float(os.environ.get("CONFIG_TTL_SECONDS", "300"))
+# Refresh stale config on a background thread instead of blocking the request
+CONFIG_BACKGROUND_REFRESH = os.environ.get("CONFIG_BACKGROUND_REFRESH", "true").lower() == "true"
+
+_state = {
+    "config": None,       # MappingProxyType, frozen
+    "loaded_at": 0.0,
+    "refreshing": False,
+    "secrets_client": None,
+}
+_lock = threading.Lock()
+
+
+def set_secrets_client(client):
+    """
+    Use `client` instead of boto3 for Secrets Manager lookups.
+    Any object with get_secret_value(SecretId=...) works, so tests and local
+    runs can pass a stub. Clears the cached config.
+    """
+    with _lock:
+        _state["secrets_client"] = client
+        _state["config"] = None
+        _state["loaded_at"] = 0.0
+
+
+def _secrets_client():
+    if _state["secrets_client"] is None:
+        import boto3  # deferred: boto3 is the slowest import in the layer
+
+        _state["secrets_client"] = boto3.client('secretsmanager')
+    return _state["secrets_client"]
+
+
+def _fetch_secrets():
+    """Fetch the current secret value; returns (secrets dict, version id)"""
     secrets_arn = os.environ.get('SECRETS_ARN')
     if not secrets_arn:
         raise EnvironmentError("SECRETS_ARN environment variable not set")
 
-    client = boto3.client('secretsmanager')
-    response = client.get_secret_value(SecretId=secrets_arn)
-    return json.loads(response['SecretString'])
+    response = _secrets_client().get_secret_value(SecretId=secrets_arn)
+    return json.loads(response['SecretString']), response.get('VersionId')
 
-def get_config():
-    """Get application configuration combining env vars and secrets"""
-    secrets = get_secrets()
 
-    return {
+def _build_config(secrets: dict, secrets_version: str = None):
+    """Combine env vars and secrets into a frozen config mapping"""
+    return MappingProxyType({
         # Database
         "DB_HOST": os.environ.get("DB_HOST", "").split(":")[0],  # Remove port
+        # Optional read replica for read-only queries (empty: use the primary)
+        "DB_READER_HOST": os.environ.get("DB_READER_HOST", "").split(":")[0],
         "DB_PORT": 5432,
         "DB_NAME": os.environ.get("DB_NAME", secrets.get("db_name", "iotaccessibility")),
         "DB_USERNAME": secrets.get("db_username"),
@@ -40,5 +77,69 @@ def get_config():
         # AWS Resources
         "S3_BUCKET": os.environ.get("S3_BUCKET"),
         "QUEUE_NAME": os.environ.get("QUEUE_NAME", "telemetry-queue"),
+        # Lane for readings that may trigger an alert; consumers drain it first
+        "PRIORITY_QUEUE_NAME": os.environ.get("PRIORITY_QUEUE_NAME", "telemetry-priority-queue"),
         "ENVIRONMENT": os.environ.get("ENVIRONMENT", "dev"),
-    }
+
+        # Telemetry older than this can no longer change (queue message TTL)
+        "TELEMETRY_IMMUTABLE_AFTER_SECONDS": int(os.environ.get("TELEMETRY_IMMUTABLE_AFTER_SECONDS", "86400")),
+
+        # Silent device detection
+        "SILENT_DEVICE_MINUTES": int(os.environ.get("SILENT_DEVICE_MINUTES", "60")),
+
+        # Secrets Manager VersionId the credentials above came from; pooled
+        # connections compare it to detect rotation
+        "SECRETS_VERSION": secrets_version,
+        "_SECRETS": MappingProxyType(dict(secrets)),
+    })
+
+
+def refresh_config():
+    """Reload secrets now and replace the cached config. Returns the new config."""
+    secrets, version = _fetch_secrets()
+    config = _build_config(secrets, version)
+    with _lock:
+        previous = _state["config"]
+        _state["config"] = config
+        _state["loaded_at"] = time.monotonic()
+    if previous is not None and previous["SECRETS_VERSION"] != version:
+        logger.info(f"Secrets rotated: {previous['SECRETS_VERSION']} -> {version}")
+    return config
+
+
+def _background_refresh():
+    try:
+        refresh_config()
+    except Exception as e:
+        # Keep serving the previous config; retried on the next stale read
+        logger.warning(f"Background config refresh failed: {e}")
+    finally:
+        with _lock:
+            _state["refreshing"] = False
+
+
+def get_config():
+    """
+    Get application configuration combining env vars and secrets.
+    Built once and cached for CONFIG_TTL_SECONDS; once stale it is refreshed
+    in the background while the previous (frozen) config keeps being served.
+    """
+    with _lock:
+        config = _state["config"]
+        stale = config is not None and time.monotonic() - _state["loaded_at"] >= CONFIG_TTL_SECONDS
+        start_refresh = stale and CONFIG_BACKGROUND_REFRESH and not _state["refreshing"]
+        if start_refresh:
+            _state["refreshing"] = True
+
+    if config is None or (stale and not CONFIG_BACKGROUND_REFRESH):
+        return refresh_config()
+
+    if start_refresh:
+        threading.Thread(target=_background_refresh, daemon=True).start()
+
+    return config
+
+
+def get_secrets():
+    """Load secrets from AWS Secrets Manager with caching"""
+    return get_config()["_SECRETS"]
@@ -1,10 +1,244 @@
+import os
+import time
+import select
+import uuid
+import threading
+import functools
 import psycopg2
-from psycopg2.extras import RealDictCursor
+import psycopg2.extensions
 import json
+import logging
 from contextlib import contextmanager
-from typing import Optional, List, Dict, Any
-from .config import get_config
+from typing import Optional, List, Dict, Any, Tuple
+from .config import get_config, refresh_config
+from .row_format import formatter
 
+logger = logging.getLogger()
+
+# Rows fetched per round trip when streaming from a server-side cursor
+STREAM_BATCH_SIZE = int(os.environ.get("DB_STREAM_BATCH_SIZE", "500"))
+
+# Keep a connection open between invocations of a warm container
+DB_REUSE_CONNECTIONS = os.environ.get("DB_REUSE_CONNECTIONS", "true").lower() == "true"
+# Idle connections kept per role (raise for multi-threaded callers such as
+# the consumer's parallel mode, one per worker)
+DB_MAX_IDLE_CONNECTIONS = int(os.environ.get("DB_MAX_IDLE_CONNECTIONS", "1"))
+# Idle connections older than this are closed instead of reused
+DB_CONNECTION_MAX_IDLE_SECONDS = float(os.environ.get("DB_CONNECTION_MAX_IDLE_SECONDS", "300"))
+# PREPARE the hot statements once per reused connection and EXECUTE them by name
+DB_PREPARED_STATEMENTS = os.environ.get("DB_PREPARED_STATEMENTS", "true").lower() == "true"
+# Replica lag (seconds) above which read-only queries go back to the primary
+DB_READER_MAX_LAG_SECONDS = float(os.environ.get("DB_READER_MAX_LAG_SECONDS", "5"))
+# How long a replica lag measurement is trusted before it is taken again
+DB_READER_LAG_CHECK_SECONDS = float(os.environ.get("DB_READER_LAG_CHECK_SECONDS", "10"))
+
+# 0 on a caught-up standby (or a primary); otherwise seconds since the last replayed commit
+REPLICA_LAG_SQL = """
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+    END
+"""
+
+# Alert feed horizon: every transaction older than this has finished, so all
+# alert_logs rows with a smaller feed_xid are visible
+FEED_HORIZON_SQL = "SELECT pg_snapshot_xmin(pg_current_snapshot())::text::bigint"
+# Feed position before any alert log of a transaction
+FEED_FIRST_ID = "00000000-0000-0000-0000-000000000000"
+
+# Change counters of the cross-invocation caches (shared/cache.py)
+CACHE_VERSIONS_SQL = "SELECT name, version FROM cache_versions"
+
+# Statements run for every telemetry message or device request. Written with
+# %s placeholders so they also run unprepared (see DatabaseService._execute).
+HOT_STATEMENTS = {
+    "user_by_device": """
+        SELECT u.* FROM users u
+        JOIN devices d ON u.id = d.user_id
+        WHERE d.device_id = %s
+    """,
+    # Advance devices.last_seen_at in the same statement; out-of-order
+    # readings never move it backwards
+    "insert_telemetry": """
+        WITH inserted AS (
+            INSERT INTO telemetry (
+                event_id, device_id, user_id, event_date, values, image_url, created_at
+            ) VALUES (
+                %s, %s, %s, %s, %s, %s, NOW()
+            )
+            RETURNING *
+        ), seen AS (
+            UPDATE devices d
+            SET last_seen_at = i.event_date, silence_alerted_at = NULL
+            FROM inserted i
+            WHERE d.device_id = i.device_id
+              AND (d.last_seen_at IS NULL OR d.last_seen_at < i.event_date)
+        )
+        SELECT * FROM inserted
+    """,
+    "conditions_by_value_type": """
+        SELECT * FROM conditions WHERE value_type = %s AND type = 'condition'
+    """,
+    # Windowed condition state (alert_rules.evaluate_windows), locked for
+    # the message's transaction
+    "condition_windows": """
+        SELECT window_seconds, state FROM condition_windows
+        WHERE device_id = %s AND value_type = %s AND window_seconds = ANY(%s)
+        FOR UPDATE
+    """,
+    "save_condition_window": """
+        INSERT INTO condition_windows (device_id, value_type, window_seconds, state, updated_at)
+        VALUES (%s, %s, %s, %s, NOW())
+        ON CONFLICT (device_id, value_type, window_seconds)
+        DO UPDATE SET state = EXCLUDED.state, updated_at = NOW()
+    """,
+    # Anomaly baselines (alert_rules.Baselines): loaded for a batch's
+    # (device_id, value_type) pairs, flushed once per batch. A flush never
+    # replaces a baseline that has already seen newer readings.
+    "sensor_baselines": """
+        SELECT b.device_id, b.value_type, b.window_seconds, b.mean, b.variance, b.readings,
+               EXTRACT(EPOCH FROM b.last_reading_at)::float8 AS last
+        FROM sensor_baselines b
+        JOIN unnest(%s::text[], %s::text[]) AS p(device_id, value_type)
+          ON b.device_id = p.device_id AND b.value_type = p.value_type
+    """,
+    "save_sensor_baselines": """
+        INSERT INTO sensor_baselines (
+            device_id, value_type, window_seconds, mean, variance, readings, last_reading_at, updated_at
+        )
+        SELECT device_id, value_type, window_seconds, mean, variance, readings, to_timestamp(last), NOW()
+        FROM jsonb_to_recordset(%s::jsonb) AS b(
+            device_id text, value_type text, window_seconds int,
+            mean float8, variance float8, readings bigint, last float8
+        )
+        ON CONFLICT (device_id, value_type, window_seconds) DO UPDATE SET
+            mean = EXCLUDED.mean, variance = EXCLUDED.variance, readings = EXCLUDED.readings,
+            last_reading_at = EXCLUDED.last_reading_at, updated_at = NOW()
+        WHERE sensor_baselines.last_reading_at < EXCLUDED.last_reading_at
+    """,
+    # A new row, or - given the id of an existing alert (debounced conditions,
+    # alert_rules.Debouncer) - one more occurrence coalesced into that row
+    "insert_alert_log": """
+        INSERT INTO alert_logs (
+            id, device_id, user_id, message, condition, telemetry_data, timestamp,
+            last_triggered_at, condition_id, created_at
+        )
+        SELECT COALESCE(a.id, uuid_generate_v4()), a.device_id, a.user_id, a.message, a.condition,
+               a.telemetry_data, a.ts, a.ts, (a.condition->>'_id')::uuid, NOW()
+        FROM (VALUES (%s::uuid, %s::text, %s::uuid, %s::text, %s::jsonb, %s::jsonb, %s::timestamptz))
+            AS a(id, device_id, user_id, message, condition, telemetry_data, ts)
+        ON CONFLICT (id) DO UPDATE SET
+            occurrences = alert_logs.occurrences + 1,
+            last_triggered_at = GREATEST(alert_logs.last_triggered_at, EXCLUDED.last_triggered_at),
+            message = EXCLUDED.message,
+            telemetry_data = EXCLUDED.telemetry_data,
+            resolved_at = NULL
+        RETURNING *
+    """,
+    # Latest alert episode of a condition on a device: (id, last trigger epoch, resolved)
+    "alert_episode": """
+        SELECT id::text, EXTRACT(EPOCH FROM COALESCE(last_triggered_at, timestamp))::float8,
+               resolved_at IS NOT NULL
+        FROM alert_logs
+        WHERE condition_id = %s AND device_id = %s
+        ORDER BY last_triggered_at DESC NULLS LAST
+        LIMIT 1
+    """,
+    "resolve_alert_logs": """
+        UPDATE alert_logs SET resolved_at = NOW()
+        WHERE id = ANY(%s::uuid[]) AND resolved_at IS NULL
+    """,
+}
+
+
+def _numbered(query: str) -> str:
+    """Rewrite %s placeholders as $1..$n for PREPARE"""
+    parts = query.split('%s')
+    return parts[0] + ''.join(f"${i}{part}" for i, part in enumerate(parts[1:], 1))
+
+
+# $n form of HOT_STATEMENTS, for PREPARE and for asyncpg (async_consumer.py)
+NUMBERED_STATEMENTS = {name: _numbered(query) for name, query in HOT_STATEMENTS.items()}
+
+
+def _py_float(expr: str) -> str:
+    """SQL text of a float8 expression formatted like Python's str(float)"""
+    return f"CASE WHEN ({expr})::text ~ '[.eEn]' THEN ({expr})::text ELSE ({expr})::text || '.0' END"
+
+
+# Reading value as float8 the way check_condition's float(value) reads it
+# (numbers, numeric strings, booleans as 1/0); NULL when float() would fail
+_READING_NUMBER = r"""
+    CASE jsonb_typeof(v->'value')
+        WHEN 'number' THEN (v->>'value')::float8
+        WHEN 'boolean' THEN CASE WHEN (v->'value')::boolean THEN 1 ELSE 0 END
+        WHEN 'string' THEN CASE
+            WHEN v->>'value' ~ '^\s*[-+]?(\d+\.?\d*|\.\d+)([eE][-+]?\d+)?\s*$'
+            THEN (v->>'value')::float8
+        END
+    END
+"""
+
+# Alert message per check_condition (first match of min, max, exact; motion
+# only compares exactValue). ConditionRows have no name, so the Python path
+# always says 'Unnamed condition'.
+_ALERT_MESSAGE = f"""
+    CASE
+        WHEN r.value_type = 'motion' THEN CASE
+            WHEN c.exact_value IS NOT NULL
+                 AND jsonb_typeof(r.value) IN ('number', 'boolean')
+                 AND r.number = c.exact_value::float8
+            THEN 'Unnamed condition: Motion detected = '
+                 || CASE jsonb_typeof(r.value) WHEN 'boolean' THEN initcap(r.value::text) ELSE r.value::text END
+        END
+        WHEN c.min_value IS NOT NULL AND r.number < c.min_value::float8
+        THEN 'Unnamed condition: ' || r.value_type || ' (' || {_py_float('r.number')}
+             || ') below minimum (' || {_py_float('c.min_value::float8')} || ')'
+        WHEN c.max_value IS NOT NULL AND r.number > c.max_value::float8
+        THEN 'Unnamed condition: ' || r.value_type || ' (' || {_py_float('r.number')}
+             || ') above maximum (' || {_py_float('c.max_value::float8')} || ')'
+        WHEN c.exact_value IS NOT NULL AND r.number = c.exact_value::float8
+        THEN 'Unnamed condition: ' || r.value_type || ' (' || {_py_float('r.number')}
+             || ') equals threshold (' || {_py_float('c.exact_value::float8')} || ')'
+    END
+"""
+
+
+class _Connection(psycopg2.extensions.connection):
+    """Connection that tracks its prepared statements and reuse state"""
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.role = 'primary'
+        self.prepared = set()
+        self.secrets_version = None
+        self.released_at = 0.0
+        self.reusable = True
+
+
+# Up to DB_MAX_IDLE_CONNECTIONS idle connections per role per container
+# (Lambda runs one request at a time; extra concurrent callers open their own)
+_idle: Dict[str, List[_Connection]] = {'primary': [], 'reader': []}
+_idle_lock = threading.Lock()
+
+# Last replica lag measurement, shared by every DatabaseService in the container
+_replica = {'checked_at': float('-inf'), 'healthy': False}
+
+
+def close_idle_connections():
+    """Close the kept-open connections, e.g. after a schema migration"""
+    with _idle_lock:
+        for connections in _idle.values():
+            while connections:
+                connections.pop().close()
+
+
+def _mutates(method):
+    """Mark a write: later reads in the same request stay on the primary"""
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        self._wrote = True
+        return method(self, *args, **kwargs)
+    return wrapper
 
 class DatabaseService:
     """
@@ -12,39 +246,325 @@ class DatabaseService:
     Schema matches Azure Cosmos DB structure for feature parity.
     """
 
-    def __init__(self):
-        self.config = get_config()
+    def __init__(self, prepared: bool = None):
+        self._load_config(get_config())
+        # Connection shared by every call inside a transaction() block
+        self._conn = None
+        # Set by the first write; keeps this request's reads on the primary
+        self._wrote = False
+        # Use prepared hot statements (only applies to reused connections)
+        self.prepared = DB_PREPARED_STATEMENTS if prepared is None else prepared
+
+    def _load_config(self, config):
+        self.config = config
         self.connection_params = {
-            'host': self.config['DB_HOST'],
-            'port': self.config['DB_PORT'],
-            'database': self.config['DB_NAME'],
-            'user': self.config['DB_USERNAME'],
-            'password': self.config['DB_PASSWORD'],
+            'host': config['DB_HOST'],
+            'port': config['DB_PORT'],
+            'database': config['DB_NAME'],
+            'user': config['DB_USERNAME'],
+            'password': config['DB_PASSWORD'],
             'sslmode': 'require'
         }
 
+    def _connect(self, role: str = 'primary'):
+        """Open a connection, re-reading credentials once if they were rotated"""
+        def connect():
+            params = dict(self.connection_params)
+            if role == 'reader':
+                params['host'] = self.config['DB_READER_HOST']
+            return psycopg2.connect(connection_factory=_Connection, **params)
+
+        try:
+            conn = connect()
+        except psycopg2.OperationalError as e:
+            if 'authentication failed' not in str(e):
+                raise
+            logger.warning("Database authentication failed, reloading secrets")
+            self._load_config(refresh_config())
+            conn = connect()
+        conn.role = role
+        conn.secrets_version = self.config['SECRETS_VERSION']
+        if role == 'reader':
+            conn.set_session(readonly=True)
+        return conn
+
+    def _checkout(self, role: str = 'primary') -> _Connection:
+        """Reuse the container's idle connection when it is still valid, else connect"""
+        with _idle_lock:
+            conn = _idle[role].pop() if _idle[role] else None
+        if conn is not None:
+            if (conn.closed
+                    or conn.secrets_version != self.config['SECRETS_VERSION']
+                    or time.monotonic() - conn.released_at > DB_CONNECTION_MAX_IDLE_SECONDS):
+                conn.close()
+            else:
+                return conn
+        return self._connect(role)
+
+    def _release(self, conn: _Connection):
+        if DB_REUSE_CONNECTIONS and conn.reusable and not conn.closed:
+            conn.released_at = time.monotonic()
+            with _idle_lock:
+                if len(_idle[conn.role]) < DB_MAX_IDLE_CONNECTIONS:
+                    _idle[conn.role].append(conn)
+                    return
+        conn.close()
+
+    def _use_reader(self) -> bool:
+        """
+        Route a read-only query to the replica unless none is configured,
+        this request already wrote (read-your-writes), or the replica lags
+        more than DB_READER_MAX_LAG_SECONDS behind the primary.
+        """
+        if self._wrote or not self.config['DB_READER_HOST']:
+            return False
+        now = time.monotonic()
+        if now - _replica['checked_at'] >= DB_READER_LAG_CHECK_SECONDS:
+            _replica['healthy'] = self._replica_lag() <= DB_READER_MAX_LAG_SECONDS
+            _replica['checked_at'] = now
+        return _replica['healthy']
+
+    def _replica_lag(self) -> float:
+        """Measure replica lag in seconds (infinite if the replica is unreachable)"""
+        lag = float('inf')
+        try:
+            conn = self._checkout('reader')
+        except psycopg2.Error as e:
+            logger.warning(f"Read replica unavailable, reading from primary: {e}")
+            return lag
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute(REPLICA_LAG_SQL)
+                lag = float(cursor.fetchone()[0])
+            conn.commit()
+        except psycopg2.Error as e:
+            conn.reusable = False
+            logger.warning(f"Replica lag check failed, reading from primary: {e}")
+        finally:
+            self._release(conn)
+        if DB_READER_MAX_LAG_SECONDS < lag < float('inf'):
+            logger.warning(f"Read replica {lag:.1f}s behind, reading from primary")
+        return lag
+
+    def listen(self, channel: str) -> _Connection:
+        """
+        Open a dedicated autocommit connection LISTENing on `channel`. It is
+        never pooled; the caller polls it for notifies and closes it.
+        """
+        conn = self._connect()
+        conn.reusable = False
+        conn.set_session(autocommit=True)
+        with conn.cursor() as cursor:
+            cursor.execute(f"LISTEN {channel}")
+        return conn
+
     @contextmanager
-    def get_connection(self):
-        """Context manager for database connections"""
-        conn = psycopg2.connect(**self.connection_params)
+    def get_connection(self, read_only: bool = False):
+        """
+        Context manager for database connections.
+        With DB_REUSE_CONNECTIONS the connection is kept open for the next
+        invocation after commit/rollback; broken connections are dropped.
+        read_only connections go to the read replica when it is usable.
+        """
+        conn = self._checkout('reader' if read_only and self._use_reader() else 'primary')
         try:
             yield conn
             conn.commit()
-        except Exception:
-            conn.rollback()
+        except Exception as e:
+            if isinstance(e, (psycopg2.OperationalError, psycopg2.InterfaceError)):
+                conn.reusable = False
+            if not conn.closed:
+                conn.rollback()
             raise
         finally:
-            conn.close()
+            self._release(conn)
+
+    @contextmanager
+    def transaction(self, read_only: bool = False):
+        """
+        Unit of work for one request: every call made inside the block
+        shares a single connection and commits (or rolls back) once at the end.
+        Nested blocks join the outer transaction. A read_only transaction
+        (consistent multi-query read) may run on the read replica.
+
+            with db.transaction():
+                owner = db.find_user_by_device(device_id)
+                db.update_device(device_id, updates)
+        """
+        if self._conn is not None:
+            yield self
+            return
+
+        with self.get_connection(read_only) as conn:
+            self._conn = conn
+            try:
+                yield self
+            finally:
+                self._conn = None
+
+    @contextmanager
+    def listening(self, channel: str):
+        """
+        A transaction() whose connection LISTENs on `channel` for the block;
+        wait_for_notify() commits and blocks until a notification arrives.
+        The connection UNLISTENs before it goes back to the pool (or is
+        dropped if the block failed). Do not nest inside another transaction.
+        """
+        with self.transaction():
+            conn = self._conn
+            with conn.cursor() as cursor:
+                cursor.execute(f"LISTEN {channel}")
+            conn.commit()
+            try:
+                yield self
+            except Exception:
+                conn.reusable = False
+                raise
+            with conn.cursor() as cursor:
+                cursor.execute(f"UNLISTEN {channel}")
+            del conn.notifies[:]
+
+    def wait_for_notify(self, payload: str, timeout: float) -> bool:
+        """
+        Inside listening() (or any transaction(), which just sleeps): commit,
+        then wait up to `timeout` seconds for a notification carrying
+        `payload`. True if one arrived.
+        """
+        conn = self._conn
+        conn.commit()
+        deadline = time.monotonic() + timeout
+        while True:
+            arrived = any(notify.payload == payload for notify in conn.notifies)
+            del conn.notifies[:]
+            remaining = deadline - time.monotonic()
+            if arrived or remaining <= 0:
+                return arrived
+            if select.select([conn], [], [], remaining)[0]:
+                conn.poll()
 
     @contextmanager
-    def get_cursor(self):
-        """Context manager for database cursors with RealDictCursor"""
-        with self.get_connection() as conn:
-            cursor = conn.cursor(cursor_factory=RealDictCursor)
+    def session_slot(self, application_name: str, limit: int):
+        """
+        A transaction() whose connection is tagged with `application_name`
+        for the block if fewer than `limit` sessions carry it
+        (pg_stat_activity), to cap how many connections one kind of long
+        request holds across all containers. Yields whether a slot was
+        taken. The tag is session state, so the block keeps the connection
+        (joining an enclosing transaction or listening() block) whether or
+        not it goes back to the pool; if the block fails, the connection is
+        dropped with its tag. A soft limit: concurrent checks can overshoot
+        it by a few.
+        """
+        with self.transaction():
+            conn = self._conn
+            with self.get_cursor() as cursor:
+                cursor.execute(
+                    """
+                    SELECT set_config('application_name', %s, false)
+                    WHERE (SELECT COUNT(*) FROM pg_stat_activity WHERE application_name = %s) < %s
+                    """,
+                    (application_name, application_name, limit)
+                )
+                taken = cursor.fetchone() is not None
+            if not taken:
+                yield False
+                return
+            try:
+                yield True
+            except Exception:
+                conn.reusable = False
+                raise
+            with self.get_cursor() as cursor:
+                cursor.execute("RESET application_name")
+
+    @contextmanager
+    def get_cursor(self, name: str = None, read_only: bool = False):
+        """
+        Context manager for database cursors.
+        Rows are plain tuples; use _fetch_one/_fetch_all to map them to the
+        Azure response format with a formatter compiled for the query shape.
+        A `name` opens a server-side (named) cursor instead. read_only
+        queries outside a transaction may run on the read replica.
+        """
+        if self._conn is not None:
+            cursor = self._conn.cursor(name=name)
             try:
                 yield cursor
             finally:
                 cursor.close()
+            return
+
+        with self.get_connection(read_only) as conn:
+            cursor = conn.cursor(name=name)
+            try:
+                yield cursor
+            finally:
+                cursor.close()
+
+    def _execute(self, cursor, name: str, params: tuple):
+        """
+        Run a HOT_STATEMENTS entry. On reused connections it is PREPAREd on
+        first use and then executed by name, skipping parse/plan each time.
+        A fresh connection starts with nothing prepared, so statements are
+        re-prepared automatically after a reconnect.
+        """
+        conn = cursor.connection
+        if not (self.prepared and DB_REUSE_CONNECTIONS):
+            cursor.execute(HOT_STATEMENTS[name], params)
+            return
+
+        if name not in conn.prepared:
+            cursor.execute(f"PREPARE {name} AS {NUMBERED_STATEMENTS[name]}")
+            conn.prepared.add(name)
+        try:
+            cursor.execute(f"EXECUTE {name} ({', '.join(['%s'] * len(params))})", params)
+        except psycopg2.Error:
+            # e.g. the statement was deallocated or its result type changed
+            # after a migration; start over on a new connection next time
+            conn.reusable = False
+            raise
+
+    def _fetch_one(self, cursor, kind: str):
+        """Format the next row as `kind` (see row_format), or None"""
+        row = cursor.fetchone()
+        return formatter(kind, cursor.description)(row) if row else None
+
+    def _fetch_all(self, cursor, kind: str) -> list:
+        """Format all remaining rows as `kind` (see row_format)"""
+        rows = cursor.fetchall()
+        if not rows:
+            return []
+        fmt = formatter(kind, cursor.description)
+        return [fmt(row) for row in rows]
+
+    def _stream(
+        self,
+        kind: str,
+        query: str,
+        params: tuple = (),
+        batch_size: int = None,
+        read_only: bool = True
+    ):
+        """
+        Yield rows formatted as `kind` from a server-side cursor, fetching
+        batch_size rows per round trip, so memory stays flat however large
+        the result set is. The cursor (and its connection, outside a
+        transaction() block) is released when the generator is exhausted or closed.
+        """
+        batch_size = batch_size or STREAM_BATCH_SIZE
+        with self.get_cursor(name=f"stream_{uuid.uuid4().hex}", read_only=read_only) as cursor:
+            cursor.itersize = batch_size
+            cursor.execute(query, params)
+            fmt = None
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                if fmt is None:
+                    # Named cursors only have a description after the first fetch
+                    fmt = formatter(kind, cursor.description)
+                for row in rows:
+                    yield fmt(row)
 
     # ==================== USER OPERATIONS ====================
     # Azure: Users collection with fields: _id, userId, username, name, surname,
@@ -54,22 +574,19 @@ class DatabaseService:
         """Find user by ID (Azure: _id or userId)"""
         with self.get_cursor() as cursor:
             cursor.execute("SELECT * FROM users WHERE id = %s", (user_id,))
-            user = cursor.fetchone()
-            return self._format_user(user) if user else None
+            return self._fetch_one(cursor, 'user')
 
     def find_user_by_email(self, email: str) -> Optional[Dict[str, Any]]:
         """Find user by email"""
         with self.get_cursor() as cursor:
             cursor.execute("SELECT * FROM users WHERE email = %s", (email,))
-            user = cursor.fetchone()
-            return self._format_user(user) if user else None
+            return self._fetch_one(cursor, 'user')
 
     def find_user_by_username(self, username: str) -> Optional[Dict[str, Any]]:
         """Find user by username"""
         with self.get_cursor() as cursor:
             cursor.execute("SELECT * FROM users WHERE username = %s", (username,))
-            user = cursor.fetchone()
-            return self._format_user(user) if user else None
+            return self._fetch_one(cursor, 'user')
 
     def find_user_by_email_or_username(self, identifier: str) -> Optional[Dict[str, Any]]:
         """Find user by email or username (Azure: login supports both)"""
@@ -78,23 +595,15 @@ class DatabaseService:
                 "SELECT * FROM users WHERE email = %s OR username = %s",
                 (identifier, identifier)
             )
-            user = cursor.fetchone()
-            return self._format_user(user) if user else None
+            return self._fetch_one(cursor, 'user')
 
     def find_user_by_device(self, device_id: str) -> Optional[Dict[str, Any]]:
         """Find user that owns a device (Azure: {"Devices.deviceId": device_id})"""
         with self.get_cursor() as cursor:
-            cursor.execute(
-                """
-                SELECT u.* FROM users u
-                JOIN devices d ON u.id = d.user_id
-                WHERE d.device_id = %s
-                """,
-                (device_id,)
-            )
-            user = cursor.fetchone()
-            return self._format_user(user) if user else None
+            self._execute(cursor, "user_by_device", (device_id,))
+            return self._fetch_one(cursor, 'user')
 
+    @_mutates
     def create_user(self, user_data: Dict[str, Any]) -> Dict[str, Any]:
         """
         Create a new user.
@@ -127,8 +636,9 @@ class DatabaseService:
                     json.dumps(user_data.get('uploadedImages', []))
                 )
             )
-            return self._format_user(cursor.fetchone())
+            return self._fetch_one(cursor, 'user')
 
+    @_mutates
     def update_user(self, user_id: str, updates: Dict[str, Any]) -> Optional[Dict[str, Any]]:
         """Update user profile (Azure: $set operator)"""
         set_clauses = []
@@ -166,9 +676,9 @@ class DatabaseService:
         with self.get_cursor() as cursor:
             query = f"UPDATE users SET {', '.join(set_clauses)} WHERE id = %s RETURNING *"
             cursor.execute(query, values)
-            result = cursor.fetchone()
-            return self._format_user(result) if result else None
+            return self._fetch_one(cursor, 'user')
 
+    @_mutates
     def update_password(self, user_id: str, password_hash: str) -> bool:
         """Update user password"""
         with self.get_cursor() as cursor:
@@ -178,34 +688,98 @@ class DatabaseService:
             )
             return cursor.rowcount > 0
 
+    @_mutates
     def delete_user(self, user_id: str) -> bool:
         """Delete user and cascade to related records"""
         with self.get_cursor() as cursor:
             cursor.execute("DELETE FROM users WHERE id = %s", (user_id,))
             return cursor.rowcount > 0
 
+    def get_user_profile(self, user_id: str, include_latest: bool = False) -> Optional[Dict[str, Any]]:
+        """
+        Get user with embedded devices in one query (Azure: user document with Devices[]).
+        Devices are aggregated and shaped by PostgreSQL with json_agg; with
+        include_latest each device also carries its newest telemetry reading.
+        """
+        latest_field = ""
+        latest_join = ""
+        if include_latest:
+            latest_field = ", 'latestReading', lt.reading"
+            latest_join = """
+                LEFT JOIN LATERAL (
+                    SELECT json_build_object(
+                        'eventId', t.event_id::text,
+                        'event_date', t.event_date,
+                        'values', t.values,
+                        'imageUrl', t.image_url
+                    ) AS reading
+                    FROM telemetry t
+                    WHERE t.device_id = d.device_id
+                    ORDER BY t.event_date DESC
+                    LIMIT 1
+                ) lt ON TRUE
+            """
+
+        with self.get_cursor() as cursor:
+            cursor.execute(
+                f"""
+                SELECT u.*, COALESCE(dev.devices, '[]'::json) AS devices
+                FROM users u
+                LEFT JOIN LATERAL (
+                    SELECT json_agg(json_build_object(
+                        'deviceId', d.device_id,
+                        'deviceName', d.device_name,
+                        'sensorType', d.sensor_type,
+                        'location', json_build_object(
+                            'name', d.location_name,
+                            'longitude', COALESCE(d.location_longitude, ''),
+                            'latitude', COALESCE(d.location_latitude, '')
+                        ),
+                        'registrationDate', d.registration_date,
+                        'status', COALESCE(d.status, '[]'::jsonb),
+                        'user_id', d.user_id::text,
+                        'lastSeen', d.last_seen_at{latest_field}
+                    ) ORDER BY d.created_at DESC) AS devices
+                    FROM devices d
+                    {latest_join}
+                    WHERE d.user_id = u.id
+                ) dev ON TRUE
+                WHERE u.id = %s
+                """,
+                (user_id,)
+            )
+            return self._fetch_one(cursor, 'user')
+
+    def get_user_profile_version(self, user_id: str) -> Optional[tuple]:
+        """
+        Cheap version of get_user_profile for ETags: the user's updated_at plus
+        device count, MAX(updated_at) and MAX(last_seen_at). None if no such user.
+        """
+        with self.get_cursor() as cursor:
+            cursor.execute(
+                """
+                SELECT u.updated_at, d.n, d.updated, d.seen
+                FROM users u
+                LEFT JOIN LATERAL (
+                    SELECT COUNT(*) AS n, MAX(updated_at) AS updated, MAX(last_seen_at) AS seen
+                    FROM devices WHERE user_id = u.id
+                ) d ON TRUE
+                WHERE u.id = %s
+                """,
+                (user_id,)
+            )
+            row = cursor.fetchone()
+            return tuple(row) if row else None
+
     def get_all_users(self) -> List[Dict[str, Any]]:
         """Get all users (admin only)"""
-        with self.get_cursor() as cursor:
+        with self.get_cursor(read_only=True) as cursor:
             cursor.execute("SELECT * FROM users ORDER BY created_at DESC")
-            return [self._format_user(row) for row in cursor.fetchall()]
-
-    def _format_user(self, user: Dict) -> Dict[str, Any]:
-        """Format user dict to match Azure API response format"""
-        if not user:
-            return None
-        result = dict(user)
-        # Add Azure compatibility fields
-        result['_id'] = str(result['id'])
-        result['userId'] = str(result['id'])
-        # Map snake_case back to camelCase for API response
-        if 'emergency_contact' in result:
-            result['emergencyContact'] = result.pop('emergency_contact')
-        if 'uploaded_images' in result:
-            result['uploadedImages'] = result.pop('uploaded_images')
-        if 'password_hash' in result:
-            result['password'] = result.pop('password_hash')
-        return result
+            return self._fetch_all(cursor, 'user')
+
+    def iter_all_users(self, batch_size: int = None):
+        """Stream all users (admin export) without loading the table into memory"""
+        return self._stream('user', "SELECT * FROM users ORDER BY created_at DESC", (), batch_size)
 
     # ==================== DEVICE OPERATIONS ====================
     # Azure: Embedded in Users.Devices[] array with fields:
@@ -216,18 +790,36 @@ class DatabaseService:
         """Find device by ID"""
         with self.get_cursor() as cursor:
             cursor.execute("SELECT * FROM devices WHERE device_id = %s", (device_id,))
-            device = cursor.fetchone()
-            return self._format_device(device) if device else None
+            return self._fetch_one(cursor, 'device')
 
     def get_user_devices(self, user_id: str) -> List[Dict[str, Any]]:
         """Get all devices for a user (Azure: user.Devices array)"""
-        with self.get_cursor() as cursor:
+        with self.get_cursor(read_only=True) as cursor:
             cursor.execute(
                 "SELECT * FROM devices WHERE user_id = %s ORDER BY created_at DESC",
                 (user_id,)
             )
-            return [self._format_device(row) for row in cursor.fetchall()]
+            return self._fetch_all(cursor, 'device')
+
+    def get_user_devices_version(self, user_id: str) -> tuple:
+        """
+        Cheap version of a user's device list for ETags: (count, MAX(updated_at),
+        MAX(last_seen_at)). Inserts, updates and deletes all change it, and so
+        do new readings (lastSeen), which leave updated_at alone; served from
+        idx_devices_user_id.
+        """
+        with self.get_cursor(read_only=True) as cursor:
+            cursor.execute(
+                """
+                SELECT COUNT(*) AS n, MAX(updated_at) AS updated, MAX(last_seen_at) AS seen
+                FROM devices WHERE user_id = %s
+                """,
+                (user_id,)
+            )
+            count, updated, seen = cursor.fetchone()
+            return count, updated, seen
 
+    @_mutates
     def create_device(self, device_data: Dict[str, Any]) -> Dict[str, Any]:
         """
         Create a new device.
@@ -257,10 +849,65 @@ class DatabaseService:
                     json.dumps(device_data.get('status', []))
                 )
             )
-            return self._format_device(cursor.fetchone())
+            return self._fetch_one(cursor, 'device')
 
+    @_mutates
     def update_device(self, device_id: str, updates: Dict[str, Any]) -> Optional[Dict[str, Any]]:
         """Update device (Azure: $set on Devices.$)"""
+        set_clauses, values = self._device_set_clauses(updates)
+
+        if not set_clauses:
+            return self.find_device_by_id(device_id)
+
+        set_clauses.append("updated_at = NOW()")
+        values.append(device_id)
+
+        with self.get_cursor() as cursor:
+            query = f"UPDATE devices SET {', '.join(set_clauses)} WHERE device_id = %s RETURNING *"
+            cursor.execute(query, values)
+            return self._fetch_one(cursor, 'device')
+
+    @_mutates
+    def update_device_owned(
+        self,
+        device_id: str,
+        user_id: str,
+        updates: Dict[str, Any]
+    ) -> Tuple[bool, Optional[Dict[str, Any]]]:
+        """
+        Update a device only if user_id owns it, in a single statement.
+        Returns (device_exists, updated_device); updated_device is None when
+        the device is missing or owned by someone else.
+        """
+        set_clauses, values = self._device_set_clauses(updates)
+
+        if set_clauses:
+            set_clauses.append("updated_at = NOW()")
+            target = f"""
+                UPDATE devices SET {', '.join(set_clauses)}
+                WHERE device_id = %s AND user_id = %s
+                RETURNING *
+            """
+        else:
+            target = "SELECT * FROM devices WHERE device_id = %s AND user_id = %s"
+        values.extend([device_id, user_id, device_id])
+
+        with self.get_cursor() as cursor:
+            cursor.execute(
+                f"""
+                WITH target AS ({target})
+                SELECT EXISTS(SELECT 1 FROM devices WHERE device_id = %s) AS device_exists, t.*
+                FROM (SELECT 1) one LEFT JOIN target t ON TRUE
+                """,
+                values
+            )
+            device_exists, *device = cursor.fetchone()
+            if device[0] is None:
+                return device_exists, None
+            return device_exists, formatter('device', cursor.description[1:])(device)
+
+    def _device_set_clauses(self, updates: Dict[str, Any]) -> Tuple[List[str], List[Any]]:
+        """Map Azure device fields to SET clauses and their values"""
         set_clauses = []
         values = []
 
@@ -291,24 +938,38 @@ class DatabaseService:
                     set_clauses.append(f"{db_field} = %s")
                     values.append(value)
 
-        if not set_clauses:
-            return self.find_device_by_id(device_id)
-
-        set_clauses.append("updated_at = NOW()")
-        values.append(device_id)
-
-        with self.get_cursor() as cursor:
-            query = f"UPDATE devices SET {', '.join(set_clauses)} WHERE device_id = %s RETURNING *"
-            cursor.execute(query, values)
-            result = cursor.fetchone()
-            return self._format_device(result) if result else None
+        return set_clauses, values
 
+    @_mutates
     def delete_device(self, device_id: str) -> bool:
         """Delete device (Azure: $pull from Users.Devices)"""
         with self.get_cursor() as cursor:
             cursor.execute("DELETE FROM devices WHERE device_id = %s", (device_id,))
             return cursor.rowcount > 0
 
+    @_mutates
+    def delete_device_owned(self, device_id: str, user_id: str) -> Tuple[bool, bool]:
+        """
+        Delete a device only if user_id owns it, in a single statement.
+        Returns (device_exists, deleted).
+        """
+        with self.get_cursor() as cursor:
+            cursor.execute(
+                """
+                WITH deleted AS (
+                    DELETE FROM devices WHERE device_id = %s AND user_id = %s
+                    RETURNING device_id
+                )
+                SELECT
+                    EXISTS(SELECT 1 FROM devices WHERE device_id = %s) AS device_exists,
+                    EXISTS(SELECT 1 FROM deleted) AS deleted
+                """,
+                (device_id, user_id, device_id)
+            )
+            device_exists, deleted = cursor.fetchone()
+            return device_exists, deleted
+
+    @_mutates
     def transfer_device(self, device_id: str, new_user_id: str) -> Optional[Dict[str, Any]]:
         """Transfer device to another user (Azure: admin function)"""
         with self.get_cursor() as cursor:
@@ -316,47 +977,92 @@ class DatabaseService:
                 "UPDATE devices SET user_id = %s, updated_at = NOW() WHERE device_id = %s RETURNING *",
                 (new_user_id, device_id)
             )
-            result = cursor.fetchone()
-            return self._format_device(result) if result else None
-
-    def _format_device(self, device: Dict) -> Dict[str, Any]:
-        """Format device dict to match Azure API response format"""
-        if not device:
-            return None
-        result = {
-            'deviceId': device['device_id'],
-            'deviceName': device['device_name'],
-            'sensorType': device['sensor_type'],
-            'location': {
-                'name': device['location_name'],
-                'longitude': device.get('location_longitude', ''),
-                'latitude': device.get('location_latitude', '')
-            },
-            'registrationDate': device['registration_date'].isoformat() if device.get('registration_date') else None,
-            'status': device.get('status', []),
-            'user_id': str(device['user_id'])
-        }
-        return result
+            return self._fetch_one(cursor, 'device')
+
+    def get_silent_devices(
+        self,
+        silent_minutes: int,
+        limit: int = 100,
+        after: tuple = None
+    ) -> List[Dict[str, Any]]:
+        """
+        Devices whose last reading is older than silent_minutes, oldest first.
+        Keyset paging on (last_seen_at, device_id) via idx_devices_last_seen;
+        pass the last row's (lastSeen, deviceId) as `after` for the next page.
+        """
+        query = """
+            SELECT * FROM devices
+            WHERE last_seen_at IS NOT NULL
+              AND last_seen_at < NOW() - make_interval(mins => %s)
+        """
+        params = [silent_minutes]
+
+        if after:
+            query += " AND (last_seen_at, device_id) > (%s, %s)"
+            params.extend(after)
+
+        query += " ORDER BY last_seen_at, device_id LIMIT %s"
+        params.append(limit)
+
+        with self.get_cursor() as cursor:
+            cursor.execute(query, params)
+            return self._fetch_all(cursor, 'device')
+
+    @_mutates
+    def create_silence_alerts(self, silent_minutes: int, limit: int = 100) -> List[Dict[str, Any]]:
+        """
+        Create one alert log per newly silent device and mark it alerted.
+        Candidates come from idx_devices_silence_pending, so each call costs
+        one index range scan of at most `limit` rows.
+        """
+        with self.get_cursor() as cursor:
+            cursor.execute(
+                """
+                WITH silent AS (
+                    SELECT device_id, user_id, last_seen_at FROM devices
+                    WHERE last_seen_at IS NOT NULL
+                      AND silence_alerted_at IS NULL
+                      AND last_seen_at < NOW() - make_interval(mins => %s)
+                    ORDER BY last_seen_at, device_id
+                    LIMIT %s
+                    FOR UPDATE SKIP LOCKED
+                ), marked AS (
+                    UPDATE devices d
+                    SET silence_alerted_at = NOW()
+                    FROM silent s
+                    WHERE d.device_id = s.device_id
+                )
+                INSERT INTO alert_logs (
+                    id, device_id, user_id, message, condition, telemetry_data, timestamp, created_at
+                )
+                SELECT
+                    uuid_generate_v4(), s.device_id, s.user_id,
+                    'Device ' || s.device_id || ' silent for more than ' || %s || ' minutes',
+                    jsonb_build_object('type', 'silence', 'valueType', 'lastSeen', 'silentMinutes', %s),
+                    jsonb_build_array(jsonb_build_object('valueType', 'lastSeen', 'value', s.last_seen_at)),
+                    NOW(), NOW()
+                FROM silent s
+                RETURNING *
+                """,
+                (silent_minutes, limit, silent_minutes, silent_minutes)
+            )
+            return self._fetch_all(cursor, 'alert_log')
 
     # ==================== TELEMETRY OPERATIONS ====================
     # Azure: Embedded in Devices[].telemetryData[] with fields:
     #        deviceId, userId, eventId, event_date, values[], imageUrl
 
+    @_mutates
     def insert_telemetry(self, telemetry_data: Dict[str, Any]) -> Dict[str, Any]:
         """
         Insert telemetry record.
         Azure: $push to Devices.$.telemetryData
         """
         with self.get_cursor() as cursor:
-            cursor.execute(
-                """
-                INSERT INTO telemetry (
-                    event_id, device_id, user_id, event_date, values, image_url, created_at
-                ) VALUES (
-                    %s, %s, %s, %s, %s, %s, NOW()
-                )
-                RETURNING *
-                """,
+            # Also advances devices.last_seen_at (see HOT_STATEMENTS)
+            self._execute(
+                cursor,
+                "insert_telemetry",
                 (
                     telemetry_data['eventId'],
                     telemetry_data['deviceId'],
@@ -366,7 +1072,102 @@ class DatabaseService:
                     telemetry_data.get('imageUrl')
                 )
             )
-            return self._format_telemetry(cursor.fetchone())
+            return self._fetch_one(cursor, 'telemetry')
+
+    @_mutates
+    def store_and_evaluate_batch(self, readings: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        Store a batch of telemetry and create its alert logs in one statement.
+        `readings` have eventId, deviceId, userId, event_date, values,
+        imageUrl and timestamp (the message's raw timestamp). Readings are
+        joined against conditions in SQL with check_condition's semantics
+        (value type, scope/device, min/max/exact); already-stored event ids
+        are skipped along with their alerts, and an event id repeated within
+        the batch (a redelivery) is stored and evaluated once. Windowed,
+        anomaly and debounced conditions are left to the caller. Returns the
+        created alert logs.
+        """
+        unique = {}
+        for reading in readings:
+            unique.setdefault(reading['eventId'], reading)
+        batch = json.dumps([
+            {
+                'event_id': r['eventId'],
+                'device_id': r['deviceId'],
+                'user_id': r['userId'],
+                'event_date': r['event_date'],
+                'values': r.get('values', []),
+                'image_url': r.get('imageUrl'),
+                'reading_ts': r.get('timestamp'),
+            }
+            for r in unique.values()
+        ], default=str)
+
+        with self.get_cursor() as cursor:
+            cursor.execute(
+                f"""
+                WITH batch AS (
+                    SELECT * FROM jsonb_to_recordset(%s::jsonb) AS b(
+                        event_id uuid, device_id text, user_id uuid, event_date timestamptz,
+                        "values" jsonb, image_url text, reading_ts text
+                    )
+                ), stored AS (
+                    INSERT INTO telemetry (
+                        event_id, device_id, user_id, event_date, values, image_url, created_at
+                    )
+                    SELECT event_id, device_id, user_id, event_date, "values", image_url, NOW()
+                    FROM batch
+                    ON CONFLICT (event_id) DO NOTHING
+                    RETURNING event_id, device_id, user_id, event_date, values
+                ), seen AS (
+                    UPDATE devices d
+                    SET last_seen_at = s.latest, silence_alerted_at = NULL
+                    FROM (SELECT device_id, MAX(event_date) AS latest FROM stored GROUP BY device_id) s
+                    WHERE d.device_id = s.device_id
+                      AND (d.last_seen_at IS NULL OR d.last_seen_at < s.latest)
+                ), readings AS (
+                    SELECT s.device_id, s.user_id, b.reading_ts,
+                           v->>'valueType' AS value_type, v->'value' AS value,
+                           {_READING_NUMBER} AS number
+                    FROM stored s
+                    JOIN batch b ON b.event_id = s.event_id
+                    CROSS JOIN LATERAL jsonb_array_elements(s.values) v
+                ), matched AS (
+                    SELECT r.device_id, r.user_id, r.reading_ts, r.value_type, r.value,
+                           {_ALERT_MESSAGE} AS message,
+                           jsonb_build_object(
+                               '_id', c.id::text, 'type', c.type, 'userId', c.user_id,
+                               'deviceId', c.device_id, 'valueType', c.value_type,
+                               'minValue', c.min_value::float8, 'maxValue', c.max_value::float8,
+                               'exactValue', c.exact_value::float8, 'unit', c.unit,
+                               'scope', c.scope, 'notificationMethods', c.notification_methods,
+                               'aggregate', c.aggregate, 'windowSeconds', c.window_seconds,
+                               'cooldownSeconds', c.cooldown_seconds, 'hysteresis', c.hysteresis::float8
+                           ) AS condition
+                    FROM readings r
+                    JOIN conditions c ON c.value_type = r.value_type AND c.type = 'condition'
+                                     AND c.aggregate IS NULL
+                                     AND c.cooldown_seconds IS NULL AND c.hysteresis IS NULL
+                    WHERE c.scope IS DISTINCT FROM 'device'
+                       OR COALESCE(c.device_id, '') = ''
+                       OR c.device_id = r.device_id
+                )
+                INSERT INTO alert_logs (
+                    device_id, user_id, message, condition, telemetry_data, timestamp,
+                    last_triggered_at, condition_id, created_at
+                )
+                SELECT device_id, user_id, message, condition,
+                       jsonb_build_array(jsonb_build_object(
+                           'valueType', value_type, 'value', value, 'timestamp', reading_ts
+                       )),
+                       NOW(), NOW(), (condition->>'_id')::uuid, NOW()
+                FROM matched
+                WHERE message IS NOT NULL
+                RETURNING *
+                """,
+                (batch,)
+            )
+            return self._fetch_all(cursor, 'alert_log')
 
     def get_device_telemetry(
         self,
@@ -375,11 +1176,15 @@ class DatabaseService:
         sensor_type: str = None,
         event_date: str = None,
         limit: int = 100,
-        offset: int = 0
+        offset: int = 0,
+        before: tuple = None
     ) -> List[Dict[str, Any]]:
         """
-        Get telemetry for a device with optional filters.
+        Get telemetry for a device with optional filters, newest first.
         Azure: filters on eventId, sensorType (valueType), eventDate
+
+        `before` is a keyset cursor (event_date, event_id): only rows strictly
+        older than it are returned, so a page anchored in the past is stable.
         """
         query = "SELECT * FROM telemetry WHERE device_id = %s"
         params = [device_id]
@@ -390,47 +1195,88 @@ class DatabaseService:
         if event_date:
             query += " AND DATE(event_date) = %s"
             params.append(event_date)
+        if sensor_type:
+            # Filter in SQL so LIMIT and keyset cursors count matching rows only
+            query += " AND values @> %s::jsonb"
+            params.append(json.dumps([{'valueType': sensor_type}]))
+        if before:
+            query += " AND (event_date, event_id) < (%s, %s)"
+            params.extend(before)
 
-        query += " ORDER BY event_date DESC LIMIT %s OFFSET %s"
+        query += " ORDER BY event_date DESC, event_id DESC LIMIT %s OFFSET %s"
         params.extend([limit, offset])
 
-        with self.get_cursor() as cursor:
+        with self.get_cursor(read_only=True) as cursor:
             cursor.execute(query, params)
-            results = [self._format_telemetry(row) for row in cursor.fetchall()]
+            return self._fetch_all(cursor, 'telemetry')
 
-            # Filter by sensor_type (valueType) in Python since it's in JSONB
-            if sensor_type:
-                results = [
-                    r for r in results
-                    if any(v.get('valueType') == sensor_type for v in r.get('values', []))
-                ]
+    def get_latest_readings(self, user_id: str, since: str = None, device_id: str = None) -> List[Dict[str, Any]]:
+        """
+        Latest telemetry row of each of a user's devices, for devices seen
+        after `since` (devices.last_seen_at). One index probe per device.
+        """
+        query = """
+            SELECT t.* FROM devices d
+            CROSS JOIN LATERAL (
+                SELECT * FROM telemetry
+                WHERE device_id = d.device_id
+                ORDER BY event_date DESC
+                LIMIT 1
+            ) t
+            WHERE d.user_id = %s AND d.last_seen_at IS NOT NULL
+        """
+        params = [user_id]
+        if since:
+            query += " AND d.last_seen_at > %s"
+            params.append(since)
+        if device_id:
+            query += " AND d.device_id = %s"
+            params.append(device_id)
 
-            return results
+        with self.get_cursor() as cursor:
+            cursor.execute(query, params)
+            return self._fetch_all(cursor, 'telemetry')
 
+    @_mutates
     def delete_telemetry(self, event_id: str) -> bool:
         """Delete telemetry record (Azure: $pull from Devices.$.telemetryData)"""
         with self.get_cursor() as cursor:
             cursor.execute("DELETE FROM telemetry WHERE event_id = %s", (event_id,))
             return cursor.rowcount > 0
 
-    def _format_telemetry(self, telemetry: Dict) -> Dict[str, Any]:
-        """Format telemetry dict to match Azure API response format"""
-        if not telemetry:
-            return None
-        return {
-            'eventId': str(telemetry['event_id']),
-            'deviceId': telemetry['device_id'],
-            'userId': str(telemetry['user_id']),
-            'event_date': telemetry['event_date'].isoformat() if telemetry.get('event_date') else None,
-            'values': telemetry.get('values', []),
-            'imageUrl': telemetry.get('image_url')
-        }
+    @_mutates
+    def delete_telemetry_owned(self, event_id: str, device_id: str, user_id: str) -> Tuple[bool, bool]:
+        """
+        Delete a telemetry record only if user_id owns its device, in a single statement.
+        Returns (device_owned, deleted).
+        """
+        with self.get_cursor() as cursor:
+            cursor.execute(
+                """
+                WITH deleted AS (
+                    DELETE FROM telemetry t
+                    USING devices d
+                    WHERE t.event_id = %s AND t.device_id = %s
+                      AND d.device_id = t.device_id AND d.user_id = %s
+                    RETURNING t.event_id
+                )
+                SELECT
+                    EXISTS(SELECT 1 FROM devices WHERE device_id = %s AND user_id = %s) AS device_owned,
+                    EXISTS(SELECT 1 FROM deleted) AS deleted
+                """,
+                (event_id, device_id, user_id, device_id, user_id)
+            )
+            device_owned, deleted = cursor.fetchone()
+            return device_owned, deleted
 
     # ==================== CONDITION OPERATIONS ====================
     # Azure: Conditions collection with fields:
     #        type, userId, deviceId, valueType, minValue, maxValue, exactValue,
     #        unit, scope, notificationMethods[]
+    #        (+ aggregate, windowSeconds for windowed conditions,
+    #         cooldownSeconds, hysteresis for debounced ones)
 
+    @_mutates
     def create_condition(self, condition_data: Dict[str, Any]) -> Dict[str, Any]:
         """Create a new condition (Azure: insert to Conditions collection)"""
         with self.get_cursor() as cursor:
@@ -439,9 +1285,10 @@ class DatabaseService:
                 INSERT INTO conditions (
                     id, type, user_id, device_id, value_type,
                     min_value, max_value, exact_value, unit, scope,
-                    notification_methods, created_at, updated_at
+                    notification_methods, aggregate, window_seconds, cooldown_seconds, hysteresis,
+                    created_at, updated_at
                 ) VALUES (
-                    %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, NOW(), NOW()
+                    %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, NOW(), NOW()
                 )
                 RETURNING *
                 """,
@@ -456,10 +1303,14 @@ class DatabaseService:
                     condition_data.get('exactValue'),
                     condition_data.get('unit'),
                     condition_data.get('scope', 'general'),
-                    json.dumps(condition_data.get('notificationMethods', ['Log']))
+                    json.dumps(condition_data.get('notificationMethods', ['Log'])),
+                    condition_data.get('aggregate'),
+                    condition_data.get('windowSeconds'),
+                    condition_data.get('cooldownSeconds'),
+                    condition_data.get('hysteresis')
                 )
             )
-            return self._format_condition(cursor.fetchone())
+            return self._fetch_one(cursor, 'condition')
 
     def get_conditions(self, device_id: str = None) -> List[Dict[str, Any]]:
         """
@@ -474,7 +1325,29 @@ class DatabaseService:
                 )
             else:
                 cursor.execute("SELECT * FROM conditions WHERE type = 'condition'")
-            return [self._format_condition(row) for row in cursor.fetchall()]
+            return self._fetch_all(cursor, 'condition')
+
+    def get_user_conditions(self, user_id: str) -> List[Dict[str, Any]]:
+        """Get conditions created by a user"""
+        with self.get_cursor() as cursor:
+            cursor.execute(
+                "SELECT * FROM conditions WHERE type = 'condition' AND user_id = %s ORDER BY created_at DESC",
+                (user_id,)
+            )
+            return self._fetch_all(cursor, 'condition')
+
+    def get_user_conditions_version(self, user_id: str) -> tuple:
+        """Cheap version of a user's condition list for ETags: (count, MAX(updated_at))"""
+        with self.get_cursor() as cursor:
+            cursor.execute(
+                """
+                SELECT COUNT(*) AS n, MAX(updated_at) AS updated
+                FROM conditions WHERE type = 'condition' AND user_id = %s
+                """,
+                (user_id,)
+            )
+            count, updated = cursor.fetchone()
+            return count, updated
 
     def get_condition_by_id(self, condition_id: str) -> Optional[Dict[str, Any]]:
         """Get condition by ID"""
@@ -483,20 +1356,163 @@ class DatabaseService:
                 "SELECT * FROM conditions WHERE id = %s AND type = 'condition'",
                 (condition_id,)
             )
-            result = cursor.fetchone()
-            return self._format_condition(result) if result else None
+            return self._fetch_one(cursor, 'condition')
 
-    def get_conditions_by_value_type(self, value_type: str) -> List[Dict[str, Any]]:
-        """Get conditions for a specific value type (used by consumer for evaluation)"""
+    def get_conditions_by_value_type(self, value_type: str, as_rows: bool = False) -> list:
+        """
+        Get conditions for a specific value type (used by consumer for evaluation).
+        as_rows returns ConditionRow objects (__slots__, dict-like get) instead of dicts.
+        Includes windowed conditions (alert_rules.split_conditions separates them).
+        """
+        with self.get_cursor() as cursor:
+            self._execute(cursor, "conditions_by_value_type", (value_type,))
+            return self._fetch_all(cursor, 'condition_row' if as_rows else 'condition')
+
+    def get_condition_bounds(self, value_types: List[str]) -> Dict[str, tuple]:
+        """
+        Threshold summary of the conditions per valueType
+        (alert_rules.might_trigger): {valueType: (max minValue, min maxValue,
+        frozenset of exactValues) of the single-reading conditions, and
+        whether any condition keeps per-device state (windowed, anomaly or
+        debounced)}. Value types without conditions are absent.
+        """
         with self.get_cursor() as cursor:
             cursor.execute(
-                "SELECT * FROM conditions WHERE value_type = %s AND type = 'condition'",
-                (value_type,)
+                """
+                SELECT value_type,
+                       MAX(min_value) FILTER (WHERE aggregate IS NULL),
+                       MIN(max_value) FILTER (WHERE aggregate IS NULL),
+                       ARRAY_AGG(DISTINCT exact_value) FILTER (WHERE aggregate IS NULL AND exact_value IS NOT NULL),
+                       BOOL_OR(aggregate IS NOT NULL OR COALESCE(cooldown_seconds, 0) <> 0 OR hysteresis IS NOT NULL)
+                FROM conditions
+                WHERE type = 'condition' AND value_type = ANY(%s)
+                GROUP BY value_type
+                """,
+                (list(value_types),)
             )
-            return [self._format_condition(row) for row in cursor.fetchall()]
+            return {
+                value_type: (
+                    float(low) if low is not None else None,
+                    float(high) if high is not None else None,
+                    frozenset(float(exact) for exact in exacts or ()),
+                    stateful
+                )
+                for value_type, low, high, exacts, stateful in cursor.fetchall()
+            }
+
+    def get_cache_versions(self) -> Dict[str, int]:
+        """Change counters of the cached tables: {cache name: version}"""
+        with self.get_cursor() as cursor:
+            cursor.execute(CACHE_VERSIONS_SQL)
+            return dict(cursor.fetchall())
 
+    def get_condition_windows(self, device_id: str, value_type: str, windows: List[int]) -> Dict[int, dict]:
+        """
+        Stored window states of a device/valueType, locked FOR UPDATE until
+        the transaction ends. Returns {window_seconds: state}.
+        """
+        with self.get_cursor() as cursor:
+            self._execute(cursor, "condition_windows", (device_id, value_type, list(windows)))
+            return {window: state for window, state in cursor.fetchall()}
+
+    @_mutates
+    def save_condition_windows(self, device_id: str, value_type: str, states: Dict[int, dict]):
+        """Upsert window states returned by alert_rules.evaluate_windows"""
+        with self.get_cursor() as cursor:
+            for window, state in states.items():
+                self._execute(cursor, "save_condition_window", (device_id, value_type, window, json.dumps(state)))
+
+    def get_sensor_baselines(self, pairs) -> Dict[tuple, dict]:
+        """
+        Anomaly baselines of (device_id, value_type) pairs in one query.
+        Returns {(device_id, value_type, window_seconds): state} for alert_rules.Baselines.
+        """
+        pairs = list(pairs)
+        if not pairs:
+            return {}
+        with self.get_cursor() as cursor:
+            self._execute(cursor, "sensor_baselines", ([p[0] for p in pairs], [p[1] for p in pairs]))
+            return {
+                (device_id, value_type, window): {
+                    'mean': mean, 'variance': variance, 'readings': readings, 'last': last
+                }
+                for device_id, value_type, window, mean, variance, readings, last in cursor.fetchall()
+            }
+
+    @_mutates
+    def save_sensor_baselines(self, rows: List[Dict[str, Any]]):
+        """Upsert the rows of Baselines.pending() in a single statement"""
+        if rows:
+            with self.get_cursor() as cursor:
+                self._execute(cursor, "save_sensor_baselines", (json.dumps(rows),))
+
+    @_mutates
+    def delete_expired_condition_windows(self) -> int:
+        """Drop window states not updated for longer than their window"""
+        with self.get_cursor() as cursor:
+            cursor.execute(
+                "DELETE FROM condition_windows WHERE updated_at < NOW() - make_interval(secs => window_seconds)"
+            )
+            return cursor.rowcount
+
+    @_mutates
     def update_condition(self, condition_id: str, updates: Dict[str, Any]) -> Optional[Dict[str, Any]]:
         """Update condition (Azure: $set)"""
+        set_clauses, values = self._condition_set_clauses(updates)
+
+        if not set_clauses:
+            return self.get_condition_by_id(condition_id)
+
+        set_clauses.append("updated_at = NOW()")
+        values.append(condition_id)
+
+        with self.get_cursor() as cursor:
+            query = f"UPDATE conditions SET {', '.join(set_clauses)} WHERE id = %s RETURNING *"
+            cursor.execute(query, values)
+            return self._fetch_one(cursor, 'condition')
+
+    @_mutates
+    def update_condition_owned(
+        self,
+        condition_id: str,
+        user_id: str,
+        updates: Dict[str, Any]
+    ) -> Tuple[bool, Optional[Dict[str, Any]]]:
+        """
+        Update a condition only if user_id owns it, in a single statement.
+        Returns (condition_exists, updated_condition).
+        """
+        set_clauses, values = self._condition_set_clauses(updates)
+
+        if set_clauses:
+            set_clauses.append("updated_at = NOW()")
+            target = f"""
+                UPDATE conditions SET {', '.join(set_clauses)}
+                WHERE id = %s AND user_id = %s AND type = 'condition'
+                RETURNING *
+            """
+        else:
+            target = "SELECT * FROM conditions WHERE id = %s AND user_id = %s AND type = 'condition'"
+        values.extend([condition_id, user_id, condition_id])
+
+        with self.get_cursor() as cursor:
+            cursor.execute(
+                f"""
+                WITH target AS ({target})
+                SELECT EXISTS(
+                    SELECT 1 FROM conditions WHERE id = %s AND type = 'condition'
+                ) AS condition_exists, t.*
+                FROM (SELECT 1) one LEFT JOIN target t ON TRUE
+                """,
+                values
+            )
+            condition_exists, *condition = cursor.fetchone()
+            if condition[0] is None:
+                return condition_exists, None
+            return condition_exists, formatter('condition', cursor.description[1:])(condition)
+
+    def _condition_set_clauses(self, updates: Dict[str, Any]) -> Tuple[List[str], List[Any]]:
+        """Map Azure condition fields to SET clauses and their values"""
         set_clauses = []
         values = []
 
@@ -507,7 +1523,9 @@ class DatabaseService:
             'exactValue': 'exact_value',
             'unit': 'unit',
             'scope': 'scope',
-            'notificationMethods': 'notification_methods'
+            'notificationMethods': 'notification_methods',
+            'windowSeconds': 'window_seconds',
+            'cooldownSeconds': 'cooldown_seconds'
         }
 
         for key, value in updates.items():
@@ -517,62 +1535,57 @@ class DatabaseService:
             if db_field == 'notification_methods':
                 set_clauses.append(f"{db_field} = %s")
                 values.append(json.dumps(value))
-            elif db_field in ['value_type', 'min_value', 'max_value', 'exact_value', 'unit', 'scope']:
+            elif db_field in ['value_type', 'min_value', 'max_value', 'exact_value', 'unit', 'scope',
+                              'aggregate', 'window_seconds', 'cooldown_seconds', 'hysteresis']:
                 set_clauses.append(f"{db_field} = %s")
                 values.append(value)
 
-        if not set_clauses:
-            return self.get_condition_by_id(condition_id)
-
-        set_clauses.append("updated_at = NOW()")
-        values.append(condition_id)
-
-        with self.get_cursor() as cursor:
-            query = f"UPDATE conditions SET {', '.join(set_clauses)} WHERE id = %s RETURNING *"
-            cursor.execute(query, values)
-            result = cursor.fetchone()
-            return self._format_condition(result) if result else None
+        return set_clauses, values
 
+    @_mutates
     def delete_condition(self, condition_id: str) -> bool:
         """Delete condition"""
         with self.get_cursor() as cursor:
             cursor.execute("DELETE FROM conditions WHERE id = %s", (condition_id,))
             return cursor.rowcount > 0
 
-    def _format_condition(self, condition: Dict) -> Dict[str, Any]:
-        """Format condition dict to match Azure API response format"""
-        if not condition:
-            return None
-        return {
-            '_id': str(condition['id']),
-            'type': condition['type'],
-            'userId': condition.get('user_id', ''),
-            'deviceId': condition.get('device_id', ''),
-            'valueType': condition['value_type'],
-            'minValue': float(condition['min_value']) if condition.get('min_value') is not None else None,
-            'maxValue': float(condition['max_value']) if condition.get('max_value') is not None else None,
-            'exactValue': float(condition['exact_value']) if condition.get('exact_value') is not None else None,
-            'unit': condition.get('unit'),
-            'scope': condition.get('scope', 'general'),
-            'notificationMethods': condition.get('notification_methods', ['Log'])
-        }
+    @_mutates
+    def delete_condition_owned(self, condition_id: str, user_id: str) -> Tuple[bool, bool]:
+        """
+        Delete a condition only if user_id owns it, in a single statement.
+        Returns (condition_exists, deleted).
+        """
+        with self.get_cursor() as cursor:
+            cursor.execute(
+                """
+                WITH deleted AS (
+                    DELETE FROM conditions WHERE id = %s AND user_id = %s
+                    RETURNING id
+                )
+                SELECT
+                    EXISTS(SELECT 1 FROM conditions WHERE id = %s) AS condition_exists,
+                    EXISTS(SELECT 1 FROM deleted) AS deleted
+                """,
+                (condition_id, user_id, condition_id)
+            )
+            condition_exists, deleted = cursor.fetchone()
+            return condition_exists, deleted
 
     # ==================== ALERT LOG OPERATIONS ====================
     # Azure: AlertLogs collection with fields:
     #        deviceId, user_id, message, condition (embedded), telemetry_data[], timestamp
 
+    @_mutates
     def create_alert_log(self, alert_data: Dict[str, Any]) -> Dict[str, Any]:
-        """Create a new alert log (Azure: insert to AlertLogs collection)"""
+        """
+        Create a new alert log (Azure: insert to AlertLogs collection).
+        With the 'id' of an existing alert, coalesces into it instead
+        (occurrences + 1, last_triggered_at, latest message and telemetry).
+        """
         with self.get_cursor() as cursor:
-            cursor.execute(
-                """
-                INSERT INTO alert_logs (
-                    id, device_id, user_id, message, condition, telemetry_data, timestamp, created_at
-                ) VALUES (
-                    %s, %s, %s, %s, %s, %s, %s, NOW()
-                )
-                RETURNING *
-                """,
+            self._execute(
+                cursor,
+                "insert_alert_log",
                 (
                     alert_data.get('id'),
                     alert_data['deviceId'],
@@ -583,23 +1596,145 @@ class DatabaseService:
                     alert_data['timestamp']
                 )
             )
-            return self._format_alert_log(cursor.fetchone())
+            return self._fetch_one(cursor, 'alert_log')
 
-    def get_alert_logs(self, user_id: str, device_id: str = None) -> List[Dict[str, Any]]:
-        """Get alert logs for a user with optional device filter"""
+    def get_alert_episode(self, condition_id: str, device_id: str) -> Optional[tuple]:
+        """Latest alert of a condition on a device as (id, last trigger epoch, resolved), or None"""
         with self.get_cursor() as cursor:
-            if device_id:
-                cursor.execute(
-                    "SELECT * FROM alert_logs WHERE user_id = %s AND device_id = %s ORDER BY timestamp DESC",
-                    (user_id, device_id)
+            self._execute(cursor, "alert_episode", (condition_id, device_id))
+            return cursor.fetchone()
+
+    @_mutates
+    def resolve_alert_logs(self, alert_ids: List[str]):
+        """Mark alerts resolved (their value cleared the condition's hysteresis band)"""
+        if alert_ids:
+            with self.get_cursor() as cursor:
+                self._execute(cursor, "resolve_alert_logs", (list(alert_ids),))
+
+    @_mutates
+    def claim_pending_notifications(self, limit: int, max_attempts: int) -> List[Tuple[Dict[str, Any], Dict[str, Any]]]:
+        """
+        Claim up to `limit` alerts awaiting notification (oldest first) by
+        setting notified_at, skipping rows another dispatcher holds.
+        Returns [(alert log, recipient)] with the recipient's userId,
+        username, email and phone.
+        """
+        with self.get_cursor() as cursor:
+            cursor.execute(
+                """
+                WITH claimed AS (
+                    UPDATE alert_logs a SET notified_at = NOW()
+                    FROM (
+                        SELECT id FROM alert_logs
+                        WHERE notified_at IS NULL AND notify_attempts < %s
+                        ORDER BY created_at
+                        LIMIT %s
+                        FOR UPDATE SKIP LOCKED
+                    ) pending
+                    WHERE a.id = pending.id
+                    RETURNING a.*
                 )
-            else:
+                SELECT c.*, u.id::text, u.username, u.email, u.phone
+                FROM claimed c
+                JOIN users u ON u.id = c.user_id
+                ORDER BY c.created_at
+                """,
+                (max_attempts, limit)
+            )
+            fmt = formatter('alert_log', cursor.description[:-4])
+            return [
+                (fmt(row[:-4]), dict(zip(('userId', 'username', 'email', 'phone'), row[-4:])))
+                for row in cursor.fetchall()
+            ]
+
+    @_mutates
+    def release_notifications(self, alert_ids: List[str]):
+        """Return claimed alerts whose delivery failed to the pending set for a later run"""
+        if alert_ids:
+            with self.get_cursor() as cursor:
                 cursor.execute(
-                    "SELECT * FROM alert_logs WHERE user_id = %s ORDER BY timestamp DESC",
-                    (user_id,)
+                    """
+                    UPDATE alert_logs SET notified_at = NULL, notify_attempts = notify_attempts + 1
+                    WHERE id = ANY(%s::uuid[])
+                    """,
+                    (list(alert_ids),)
                 )
-            return [self._format_alert_log(row) for row in cursor.fetchall()]
 
+    def _alert_logs_query(self, user_id: str, device_id: str = None) -> Tuple[str, List[Any]]:
+        query = "SELECT * FROM alert_logs WHERE user_id = %s"
+        params = [user_id]
+        if device_id:
+            query += " AND device_id = %s"
+            params.append(device_id)
+        return query + " ORDER BY timestamp DESC", params
+
+    def get_alert_logs(
+        self,
+        user_id: str,
+        device_id: str = None,
+        limit: int = None,
+        offset: int = 0
+    ) -> List[Dict[str, Any]]:
+        """Get alert logs for a user with optional device filter and paging"""
+        query, params = self._alert_logs_query(user_id, device_id)
+        if limit is not None:
+            query += " LIMIT %s OFFSET %s"
+            params += [limit, offset]
+        with self.get_cursor(read_only=True) as cursor:
+            cursor.execute(query, params)
+            return self._fetch_all(cursor, 'alert_log')
+
+    def iter_alert_logs(self, user_id: str, device_id: str = None, batch_size: int = None):
+        """Stream a user's full alert history (export) from a server-side cursor"""
+        query, params = self._alert_logs_query(user_id, device_id)
+        return self._stream('alert_log', query, tuple(params), batch_size)
+
+    def get_alert_feed(
+        self,
+        user_id: str,
+        after: tuple = None,
+        limit: int = 100,
+        device_id: str = None
+    ) -> Tuple[List[Dict[str, Any]], tuple, bool]:
+        """
+        Alert logs written after the feed position `after` (feed_xid, id),
+        in write order. Returns (alert logs, next position, more); `more`
+        means another page is ready now. Without `after` returns no rows and
+        the current position. Runs on the primary: replicas lag.
+        """
+        with self.get_cursor() as cursor:
+            cursor.execute(FEED_HORIZON_SQL)
+            horizon = cursor.fetchone()[0]
+            if after is None:
+                return [], (horizon, FEED_FIRST_ID), False
+
+            # Only rows below the horizon: a transaction still running may
+            # yet commit rows ordered before the ones visible now
+            query = """
+                SELECT * FROM alert_logs
+                WHERE user_id = %s AND (feed_xid, id) > (%s, %s::uuid) AND feed_xid < %s
+            """
+            params = [user_id, after[0], after[1], horizon]
+            if device_id:
+                query += " AND device_id = %s"
+                params.append(device_id)
+            query += " ORDER BY feed_xid, id LIMIT %s"
+            params.append(limit + 1)
+
+            cursor.execute(query, params)
+            rows = cursor.fetchall()
+            more = len(rows) > limit
+            rows = rows[:limit]
+            if more:
+                columns = [column[0] for column in cursor.description]
+                last = rows[-1]
+                position = (last[columns.index('feed_xid')], str(last[columns.index('id')]))
+            else:
+                position = (horizon, FEED_FIRST_ID)
+            fmt = formatter('alert_log', cursor.description)
+            return [fmt(row) for row in rows], position, more
+
+    @_mutates
     def delete_alert_log(self, alert_id: str, user_id: str) -> bool:
         """Delete alert log"""
         with self.get_cursor() as cursor:
@@ -608,17 +1743,3 @@ class DatabaseService:
                 (alert_id, user_id)
             )
             return cursor.rowcount > 0
-
-    def _format_alert_log(self, alert: Dict) -> Dict[str, Any]:
-        """Format alert log dict to match Azure API response format"""
-        if not alert:
-            return None
-        return {
-            '_id': str(alert['id']),
-            'deviceId': alert['device_id'],
-            'user_id': str(alert['user_id']),
-            'message': alert['message'],
-            'condition': alert.get('condition', {}),
-            'telemetry_data': alert.get('telemetry_data', []),
-            'timestamp': alert['timestamp'].isoformat() if alert.get('timestamp') else None
-        }
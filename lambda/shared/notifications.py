@@ -0,0 +1,232 @@
+"""
+Alert notification dispatcher.
+
+Runs as its own scheduled Lambda (notifications/handler.py), fed from
+alert_logs rows the consumer created, so alert creation never waits on
+notification delivery. Each run claims pending alerts, groups them into
+one digest per user and channel (the schedule interval is the digest
+window), and delivers the digests concurrently with bounded parallelism
+and retries. Digests that still fail are released for a later run.
+
+Channels come from the condition's notificationMethods and map to sinks:
+'log', 'email' (SES) and 'sms' (SNS) are built in; register_sink() adds or
+replaces one. With NOTIFY_SINK_FILE set, every channel goes to a JSON-lines
+file instead ('-' for stdout), for tests and local runs.
+"""
+
+import os
+import sys
+import json
+import time
+import logging
+import threading
+from abc import ABC, abstractmethod
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+from .db_service import DatabaseService
+
+logger = logging.getLogger()
+
+# Alerts claimed per batch, and batches per run
+NOTIFY_BATCH_SIZE = int(os.environ.get("NOTIFY_BATCH_SIZE", "500"))
+NOTIFY_MAX_BATCHES = int(os.environ.get("NOTIFY_MAX_BATCHES", "10"))
+# Digests delivered at once
+NOTIFY_CONCURRENCY = int(os.environ.get("NOTIFY_CONCURRENCY", "8"))
+# Retries per digest within a run (exponential backoff from NOTIFY_RETRY_SECONDS)
+NOTIFY_RETRIES = int(os.environ.get("NOTIFY_RETRIES", "2"))
+NOTIFY_RETRY_SECONDS = float(os.environ.get("NOTIFY_RETRY_SECONDS", "0.5"))
+# Runs an alert may fail in before it is no longer picked up
+NOTIFY_MAX_ATTEMPTS = int(os.environ.get("NOTIFY_MAX_ATTEMPTS", "5"))
+# Deliver every channel to this JSON-lines file ('-': stdout) instead
+NOTIFY_SINK_FILE = os.environ.get("NOTIFY_SINK_FILE", "")
+NOTIFY_EMAIL_FROM = os.environ.get("NOTIFY_EMAIL_FROM", "")
+
+# Alerts listed in a digest's text; the rest are counted
+DIGEST_MAX_LINES = 20
+
+
+class NotificationSink(ABC):
+    """
+    Delivers digests for a channel. A digest is a dict with channel,
+    recipient (userId, username, email, phone), alerts, subject and text.
+    send() raises to have the digest retried.
+    """
+
+    @abstractmethod
+    def send(self, digest: dict):
+        ...
+
+
+class LogSink(NotificationSink):
+    def send(self, digest: dict):
+        logger.info(f"Notification for {digest['recipient']['userId']}: {digest['subject']}")
+
+
+class FileSink(NotificationSink):
+    """Appends each digest as a JSON line"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def send(self, digest: dict):
+        line = json.dumps(digest, default=str) + "\n"
+        with self._lock:
+            if self.path == "-":
+                sys.stdout.write(line)
+                sys.stdout.flush()
+            else:
+                with open(self.path, "a") as f:
+                    f.write(line)
+
+
+class EmailSink(NotificationSink):
+    """Amazon SES, from NOTIFY_EMAIL_FROM"""
+
+    def __init__(self):
+        self._client = None
+
+    def send(self, digest: dict):
+        email = digest['recipient'].get('email')
+        if not email or not NOTIFY_EMAIL_FROM:
+            logger.warning(f"Email notification skipped for {digest['recipient']['userId']}: no address")
+            return
+        if self._client is None:
+            import boto3  # deferred: boto3 is the slowest import in the layer
+
+            self._client = boto3.client('ses')
+        self._client.send_email(
+            Source=NOTIFY_EMAIL_FROM,
+            Destination={'ToAddresses': [email]},
+            Message={
+                'Subject': {'Data': digest['subject']},
+                'Body': {'Text': {'Data': digest['text']}},
+            },
+        )
+
+
+class SmsSink(NotificationSink):
+    """Amazon SNS direct SMS to the user's phone"""
+
+    def __init__(self):
+        self._client = None
+
+    def send(self, digest: dict):
+        phone = digest['recipient'].get('phone')
+        if not phone:
+            logger.warning(f"SMS notification skipped for {digest['recipient']['userId']}: no phone")
+            return
+        if self._client is None:
+            import boto3
+
+            self._client = boto3.client('sns')
+        self._client.publish(PhoneNumber=phone, Message=digest['subject'])
+
+
+_sinks = {
+    'log': LogSink(),
+    'email': EmailSink(),
+    'sms': SmsSink(),
+}
+_file_sink = [None]
+
+
+def register_sink(channel: str, sink: NotificationSink):
+    """Deliver `channel` (case-insensitive) through `sink`"""
+    _sinks[channel.lower()] = sink
+
+
+def sink_for(channel: str):
+    """Sink for a channel, or None if nothing delivers it"""
+    if NOTIFY_SINK_FILE:
+        if _file_sink[0] is None:
+            _file_sink[0] = FileSink(NOTIFY_SINK_FILE)
+        return _file_sink[0]
+    return _sinks.get(channel.lower())
+
+
+def build_digests(claimed: list) -> list:
+    """Group (alert, recipient) pairs into one digest per user and channel"""
+    grouped = defaultdict(list)
+    recipients = {}
+    for alert, recipient in claimed:
+        methods = (alert.get('condition') or {}).get('notificationMethods') or ['Log']
+        for channel in {method.lower() for method in methods}:
+            grouped[(recipient['userId'], channel)].append(alert)
+        recipients[recipient['userId']] = recipient
+
+    digests = []
+    for (user_id, channel), alerts in grouped.items():
+        if len(alerts) == 1:
+            subject = alerts[0]['message']
+        else:
+            subject = f"{len(alerts)} alerts on {len({a['deviceId'] for a in alerts})} device(s)"
+        lines = [f"{a['timestamp']} {a['deviceId']}: {a['message']}" for a in alerts[:DIGEST_MAX_LINES]]
+        if len(alerts) > DIGEST_MAX_LINES:
+            lines.append(f"... and {len(alerts) - DIGEST_MAX_LINES} more")
+        digests.append({
+            'channel': channel,
+            'recipient': recipients[user_id],
+            'alerts': alerts,
+            'subject': subject,
+            'text': "\n".join(lines),
+        })
+    return digests
+
+
+def deliver(digest: dict, retries: int = NOTIFY_RETRIES) -> bool:
+    """Send one digest, retrying with exponential backoff; True once delivered"""
+    sink = sink_for(digest['channel'])
+    if sink is None:
+        logger.warning(f"No notification sink for channel {digest['channel']}")
+        return True
+
+    for attempt in range(retries + 1):
+        try:
+            sink.send(digest)
+            return True
+        except Exception as e:
+            logger.warning(f"Notification via {digest['channel']} failed (attempt {attempt + 1}): {e}")
+            if attempt < retries:
+                time.sleep(NOTIFY_RETRY_SECONDS * 2 ** attempt)
+    return False
+
+
+def dispatch(db: DatabaseService = None, max_batches: int = NOTIFY_MAX_BATCHES) -> dict:
+    """
+    Claim, digest and deliver pending alerts until none are left (or
+    max_batches). Returns counts of alerts, digests sent and digests failed.
+    """
+    db = db or DatabaseService()
+    totals = {"alerts": 0, "digests_sent": 0, "digests_failed": 0}
+    failed = set()
+    # Claimed alerts of the batch being delivered, released too if it is interrupted
+    in_flight = set()
+
+    try:
+        with ThreadPoolExecutor(max_workers=NOTIFY_CONCURRENCY) as pool:
+            for _ in range(max_batches):
+                claimed = db.claim_pending_notifications(NOTIFY_BATCH_SIZE, NOTIFY_MAX_ATTEMPTS)
+                if not claimed:
+                    break
+                in_flight = {alert['_id'] for alert, _ in claimed}
+
+                digests = build_digests(claimed)
+                for digest, delivered in zip(digests, pool.map(deliver, digests)):
+                    if delivered:
+                        totals["digests_sent"] += 1
+                    else:
+                        totals["digests_failed"] += 1
+                        failed.update(alert['_id'] for alert in digest['alerts'])
+                in_flight = set()
+
+                totals["alerts"] += len(claimed)
+                if len(claimed) < NOTIFY_BATCH_SIZE:
+                    break
+    finally:
+        # Failed alerts go back to pending for the next run (released last so
+        # this run does not claim them again; their other channels may be sent
+        # again), also when the run itself fails
+        db.release_notifications(sorted(failed | in_flight))
+    return totals
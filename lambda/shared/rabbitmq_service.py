@@ -2,20 +2,53 @@ import json
 import logging
 import ssl
 import pika
-from .config import get_config
+from .config import get_config, refresh_config
 
 logger = logging.getLogger()
 
+def queue_arguments(queue: str) -> dict:
+    """Declare arguments of a work queue: rejected or expired messages go to {queue}-dlq"""
+    return {
+        'x-dead-letter-exchange': '',
+        'x-dead-letter-routing-key': f'{queue}-dlq',
+        'x-message-ttl': 86400000  # 24 hours
+    }
+
+def queue_declarations(queue: str) -> list:
+    """
+    (name, arguments) to declare, in order, before using a work queue: its
+    dead-letter queue, then the queue itself. Every client must declare a
+    queue with the same arguments; RabbitMQ rejects a mismatch with 406
+    PRECONDITION_FAILED and closes the channel.
+    """
+    return [(f'{queue}-dlq', None), (queue, queue_arguments(queue))]
+
+def _declare(channel, queue: str):
+    for name, arguments in queue_declarations(queue):
+        channel.queue_declare(queue=name, durable=True, arguments=arguments)
+
 class RabbitMQService:
     def __init__(self):
-        config = get_config()
+        self._load_config(get_config())
+
+    def _load_config(self, config):
         self.host = config["RABBITMQ_HOST"]
         self.port = config["RABBITMQ_PORT"]
         self.username = config["RABBITMQ_USERNAME"]
         self.password = config["RABBITMQ_PASSWORD"]
         self.queue_name = config["QUEUE_NAME"]
+        self.priority_queue_name = config["PRIORITY_QUEUE_NAME"]
 
     def _get_connection(self):
+        try:
+            return self._connect()
+        except (pika.exceptions.ProbableAuthenticationError, pika.exceptions.AuthenticationError):
+            # Credentials may have been rotated since the config was cached
+            logger.warning("RabbitMQ authentication failed, reloading secrets")
+            self._load_config(refresh_config())
+            return self._connect()
+
+    def _connect(self):
         credentials = pika.PlainCredentials(self.username, self.password)
 
         # Amazon MQ requires TLS
@@ -39,18 +72,8 @@ class RabbitMQService:
         connection = self._get_connection()
         channel = connection.channel()
 
-        channel.queue_declare(
-            queue=queue,
-            durable=True,
-            arguments={
-                'x-dead-letter-exchange': '',
-                'x-dead-letter-routing-key': f'{queue}-dlq',
-                'x-message-ttl': 86400000  # 24 hours
-            }
-        )
-
-        # Also declare dead letter queue
-        channel.queue_declare(queue=f'{queue}-dlq', durable=True)
+        # Also declares the dead letter queue
+        _declare(channel, queue)
 
         connection.close()
         logger.info(f"Queue '{queue}' declared successfully")
@@ -63,7 +86,7 @@ class RabbitMQService:
             connection = self._get_connection()
             channel = connection.channel()
 
-            channel.queue_declare(queue=queue, durable=True)
+            _declare(channel, queue)
 
             channel.basic_publish(
                 exchange='',
@@ -83,27 +106,34 @@ class RabbitMQService:
             logger.exception(f"Failed to send message to RabbitMQ: {str(e)}")
             raise
 
-    def receive_messages(self, max_messages: int = 10, queue_name: str = None) -> list:
-        """Receive messages from queue (for polling-based consumption)"""
-        queue = queue_name or self.queue_name
+    def receive_messages(self, max_messages: int = 10, queue_name: str = None, prioritized: bool = False) -> list:
+        """
+        Receive messages from queue (for polling-based consumption).
+        prioritized drains the priority lane first and fills the rest of
+        the batch from the queue.
+        """
+        queues = [queue_name or self.queue_name]
+        if prioritized:
+            queues.insert(0, self.priority_queue_name)
         messages = []
 
         try:
             connection = self._get_connection()
             channel = connection.channel()
 
-            channel.queue_declare(queue=queue, durable=True)
+            for queue in queues:
+                _declare(channel, queue)
 
-            for _ in range(max_messages):
-                method, properties, body = channel.basic_get(queue=queue, auto_ack=False)
+                while len(messages) < max_messages:
+                    method, properties, body = channel.basic_get(queue=queue, auto_ack=False)
 
-                if body:
-                    messages.append({
-                        'delivery_tag': method.delivery_tag,
-                        'body': json.loads(body)
-                    })
-                else:
-                    break
+                    if body:
+                        messages.append({
+                            'delivery_tag': method.delivery_tag,
+                            'body': json.loads(body)
+                        })
+                    else:
+                        break
 
             # Acknowledge all messages
             for msg in messages:
@@ -1,8 +1,27 @@
+import io
+import os
 import json
+import gzip
+import base64
+import hashlib
 from datetime import datetime, date
 from decimal import Decimal
 from uuid import UUID
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Installed in the layer (build_all.sh); gzip only where it is missing
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Bodies smaller than this are sent uncompressed (not worth the CPU/base64 overhead)
+COMPRESSION_MIN_BYTES = int(os.environ.get("COMPRESSION_MIN_BYTES", "2048"))
+
 class CustomEncoder(json.JSONEncoder):
     """Custom JSON encoder for special types"""
     def default(self, obj):
@@ -16,24 +35,233 @@ class CustomEncoder(json.JSONEncoder):
             return str(obj)
         return super().default(obj)
 
-def api_response(status_code: int, body: dict, headers: dict = None) -> dict:
-    """Create a standardized API response"""
-    response_headers = {
+def _orjson_default(obj):
+    # orjson handles datetime, date and UUID natively
+    if isinstance(obj, Decimal):
+        return float(obj)
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+def dumps(body) -> bytes:
+    """Serialize a response body to UTF-8 JSON (orjson when available)"""
+    if isinstance(body, bytes):
+        # Already serialized (e.g. a cached page)
+        return body
+    if orjson is not None:
+        return orjson.dumps(body, default=_orjson_default, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(body, cls=CustomEncoder).encode('utf-8')
+
+def _accepted_encodings(event: dict) -> dict:
+    """Parse Accept-Encoding into {encoding: q}"""
+    headers = (event or {}).get('headers', {}) or {}
+    header = headers.get('accept-encoding') or headers.get('Accept-Encoding') or ''
+
+    encodings = {}
+    for part in header.split(','):
+        name, _, params = part.strip().partition(';')
+        if not name:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        encodings[name.strip().lower()] = q
+    return encodings
+
+def _compress(payload: bytes, event: dict):
+    """Return (encoding, compressed) for the best encoding the client accepts, or (None, payload)"""
+    if len(payload) < COMPRESSION_MIN_BYTES:
+        return None, payload
+
+    accepted = _accepted_encodings(event)
+    if brotli is not None and accepted.get('br', 0) > 0:
+        return 'br', brotli.compress(payload, quality=4)
+    if accepted.get('gzip', 0) > 0:
+        return 'gzip', gzip.compress(payload, compresslevel=5)
+    return None, payload
+
+def _base_headers() -> dict:
+    return {
         "Content-Type": "application/json",
         "Access-Control-Allow-Origin": "*",
-        "Access-Control-Allow-Headers": "Content-Type,Authorization,X-Requested-With",
-        "Access-Control-Allow-Methods": "GET,POST,PUT,PATCH,DELETE,OPTIONS"
+        "Access-Control-Allow-Headers": "Content-Type,Authorization,X-Requested-With,If-None-Match",
+        "Access-Control-Allow-Methods": "GET,POST,PUT,PATCH,DELETE,OPTIONS",
+        "Access-Control-Expose-Headers": "ETag"
     }
 
+def make_etag(*parts) -> str:
+    """Weak ETag from version parts (e.g. row count and MAX(updated_at))"""
+    digest = hashlib.sha1('|'.join(str(p) for p in parts).encode('utf-8')).hexdigest()
+    return f'W/"{digest[:32]}"'
+
+def _body_etag(payload: bytes) -> str:
+    """Strong ETag from the serialized body"""
+    return f'"{hashlib.sha1(payload).hexdigest()[:32]}"'
+
+def etag_matches(event: dict, etag: str) -> bool:
+    """True if the request's If-None-Match matches etag (weak comparison)"""
+    headers = (event or {}).get('headers', {}) or {}
+    header = headers.get('if-none-match') or headers.get('If-None-Match')
+    if not header or not etag:
+        return False
+    if header.strip() == '*':
+        return True
+
+    target = etag[2:] if etag.startswith('W/') else etag
+    for candidate in header.split(','):
+        candidate = candidate.strip()
+        if candidate.startswith('W/'):
+            candidate = candidate[2:]
+        if candidate == target:
+            return True
+    return False
+
+def not_modified_response(etag: str, headers: dict = None) -> dict:
+    """304 Not Modified with no body"""
+    response_headers = _base_headers()
+    response_headers.update({"ETag": etag, "Cache-Control": "private, no-cache"})
+    if headers:
+        response_headers.update(headers)
+    del response_headers["Content-Type"]
+    return {"statusCode": 304, "headers": response_headers, "body": ""}
+
+def _is_get(event: dict) -> bool:
+    return event.get('requestContext', {}).get('http', {}).get('method', 'GET') == 'GET'
+
+def api_response(
+    status_code: int,
+    body: dict,
+    headers: dict = None,
+    event: dict = None,
+    etag: str = None
+) -> dict:
+    """
+    Create a standardized API response.
+    Pass the request `event` to allow gzip/brotli compression of large
+    bodies when the client's Accept-Encoding permits it, and conditional
+    GETs: 200 GET responses carry an ETag (`etag`, or a hash of the body)
+    and return 304 when it matches If-None-Match.
+    """
+    response_headers = _base_headers()
+
     if headers:
         response_headers.update(headers)
 
+    payload = dumps(body)
+
+    if event is not None:
+        if status_code == 200 and _is_get(event):
+            etag = etag or _body_etag(payload)
+            if etag_matches(event, etag):
+                return not_modified_response(etag, headers)
+            response_headers.setdefault("Cache-Control", "private, no-cache")
+            response_headers["ETag"] = etag
+
+        response_headers["Vary"] = "Accept-Encoding"
+        encoding, compressed = _compress(payload, event)
+        if encoding:
+            response_headers["Content-Encoding"] = encoding
+            return {
+                "statusCode": status_code,
+                "headers": response_headers,
+                "body": base64.b64encode(compressed).decode('ascii'),
+                "isBase64Encoded": True
+            }
+
     return {
         "statusCode": status_code,
         "headers": response_headers,
-        "body": json.dumps(body, cls=CustomEncoder)
+        "body": payload.decode('utf-8')
     }
 
+def wants_ndjson(event: dict) -> bool:
+    """True if the client asked for newline-delimited JSON (?format=ndjson or Accept)"""
+    params = (event or {}).get('queryStringParameters', {}) or {}
+    if params.get('format') == 'ndjson':
+        return True
+    headers = (event or {}).get('headers', {}) or {}
+    accept = headers.get('accept') or headers.get('Accept') or ''
+    return 'application/x-ndjson' in accept
+
+class _Compressor:
+    """Incremental gzip/brotli (or identity) writer into an in-memory buffer"""
+    def __init__(self, encoding: str):
+        self.encoding = encoding
+        self.buffer = io.BytesIO()
+        if encoding == 'gzip':
+            self._gzip = gzip.GzipFile(fileobj=self.buffer, mode='wb', compresslevel=5)
+        elif encoding == 'br':
+            self._brotli = brotli.Compressor(quality=4)
+
+    def write(self, data: bytes):
+        if self.encoding == 'gzip':
+            self._gzip.write(data)
+        elif self.encoding == 'br':
+            self.buffer.write(self._brotli.process(data))
+        else:
+            self.buffer.write(data)
+
+    def finish(self) -> bytes:
+        if self.encoding == 'gzip':
+            self._gzip.close()
+        elif self.encoding == 'br':
+            self.buffer.write(self._brotli.finish())
+        return self.buffer.getvalue()
+
+def ndjson_response(rows, event: dict = None, headers: dict = None) -> dict:
+    """
+    200 response with one JSON document per line (application/x-ndjson).
+    Rows are pulled from the iterable (e.g. a DatabaseService.iter_* generator)
+    and encoded straight into the compressed body, so neither the result set
+    nor the uncompressed JSON is ever held in memory as a whole.
+    """
+    response_headers = _base_headers()
+    response_headers["Content-Type"] = "application/x-ndjson"
+    response_headers["Cache-Control"] = "private, no-store"
+    response_headers["Vary"] = "Accept-Encoding"
+    if headers:
+        response_headers.update(headers)
+
+    accepted = _accepted_encodings(event)
+    if brotli is not None and accepted.get('br', 0) > 0:
+        encoding = 'br'
+    elif accepted.get('gzip', 0) > 0:
+        encoding = 'gzip'
+    else:
+        encoding = None
+
+    writer = _Compressor(encoding)
+    for row in rows:
+        writer.write(dumps(row) + b"\n")
+    body = writer.finish()
+
+    if encoding is None:
+        return {"statusCode": 200, "headers": response_headers, "body": body.decode('utf-8')}
+
+    response_headers["Content-Encoding"] = encoding
+    return {
+        "statusCode": 200,
+        "headers": response_headers,
+        "body": base64.b64encode(body).decode('ascii'),
+        "isBase64Encoded": True
+    }
+
+def encode_cursor(*parts) -> str:
+    """Opaque, URL-safe keyset cursor"""
+    return base64.urlsafe_b64encode(json.dumps(list(parts)).encode('utf-8')).decode('ascii')
+
+def decode_cursor(cursor: str) -> tuple:
+    """Inverse of encode_cursor; raises ValueError on malformed input"""
+    try:
+        parts = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+    except (ValueError, TypeError, UnicodeEncodeError) as e:
+        raise ValueError("Invalid cursor") from e
+    if not isinstance(parts, list):
+        raise ValueError("Invalid cursor")
+    return tuple(parts)
+
 def error_response(status_code: int, message: str) -> dict:
     """Create a standardized error response"""
     return api_response(status_code, {"error": message})
@@ -0,0 +1,187 @@
+"""
+Row formatters compiled per query shape.
+
+Queries run on plain tuple cursors. The first time a (kind, columns) shape
+is seen, a formatter is generated that maps a row tuple straight to the
+Azure-compatible dict by column index, and it is reused for every later row
+of that shape. This avoids building an intermediate dict per row.
+"""
+
+from typing import Any, Callable, Dict, Tuple
+
+# Spec entries: (output key, column, converter, default when the column is absent).
+# A list in place of the column builds a nested dict; OPTIONAL fields are only
+# set when the value is truthy.
+OPTIONAL = 'optional'
+
+_CONVERTERS = {
+    None: '{v}',
+    'str': 'str({v})',
+    'iso': '({v}.isoformat() if {v} else None)',
+    'float': '(float({v}) if {v} is not None else None)',
+}
+
+_USER_RENAMES = {
+    'emergency_contact': 'emergencyContact',
+    'uploaded_images': 'uploadedImages',
+    'password_hash': 'password',
+}
+
+
+def _user_fields(columns):
+    # Every column passes through (snake_case mapped back to Azure camelCase)
+    fields = [(_USER_RENAMES.get(column, column), column, None, None) for column in columns]
+    fields += [('_id', 'id', 'str', None), ('userId', 'id', 'str', None)]
+    return fields
+
+
+_DEVICE_FIELDS = [
+    ('deviceId', 'device_id', None, None),
+    ('deviceName', 'device_name', None, None),
+    ('sensorType', 'sensor_type', None, None),
+    ('location', [
+        ('name', 'location_name', None, None),
+        ('longitude', 'location_longitude', None, ''),
+        ('latitude', 'location_latitude', None, ''),
+    ], None, None),
+    ('registrationDate', 'registration_date', 'iso', None),
+    ('status', 'status', None, []),
+    ('user_id', 'user_id', 'str', None),
+    ('lastSeen', 'last_seen_at', 'iso', OPTIONAL),
+]
+
+_TELEMETRY_FIELDS = [
+    ('eventId', 'event_id', 'str', None),
+    ('deviceId', 'device_id', None, None),
+    ('userId', 'user_id', 'str', None),
+    ('event_date', 'event_date', 'iso', None),
+    ('values', 'values', None, []),
+    ('imageUrl', 'image_url', None, None),
+]
+
+_CONDITION_FIELDS = [
+    ('_id', 'id', 'str', None),
+    ('type', 'type', None, None),
+    ('userId', 'user_id', None, ''),
+    ('deviceId', 'device_id', None, ''),
+    ('valueType', 'value_type', None, None),
+    ('minValue', 'min_value', 'float', None),
+    ('maxValue', 'max_value', 'float', None),
+    ('exactValue', 'exact_value', 'float', None),
+    ('unit', 'unit', None, None),
+    ('scope', 'scope', None, 'general'),
+    ('notificationMethods', 'notification_methods', None, ['Log']),
+    ('aggregate', 'aggregate', None, None),
+    ('windowSeconds', 'window_seconds', None, None),
+    ('cooldownSeconds', 'cooldown_seconds', None, None),
+    ('hysteresis', 'hysteresis', 'float', None),
+]
+
+_ALERT_LOG_FIELDS = [
+    ('_id', 'id', 'str', None),
+    ('deviceId', 'device_id', None, None),
+    ('user_id', 'user_id', 'str', None),
+    ('message', 'message', None, None),
+    ('condition', 'condition', None, {}),
+    ('telemetry_data', 'telemetry_data', None, []),
+    ('timestamp', 'timestamp', 'iso', None),
+    ('occurrences', 'occurrences', None, 1),
+    ('lastTriggeredAt', 'last_triggered_at', 'iso', OPTIONAL),
+    ('resolvedAt', 'resolved_at', 'iso', OPTIONAL),
+]
+
+
+class ConditionRow:
+    """
+    Compact condition for internal callers (the consumer evaluates thousands
+    per batch). Attributes use the Azure field names; get()/[] make it a
+    drop-in for the condition dicts check_condition expects.
+    """
+    __slots__ = tuple(field[0] for field in _CONDITION_FIELDS)
+
+    def __init__(self, *values):
+        # Fields past the given values (e.g. windowSeconds) default to None
+        values += (None,) * (len(self.__slots__) - len(values))
+        for name, value in zip(self.__slots__, values):
+            setattr(self, name, value)
+
+    def get(self, key: str, default=None):
+        return getattr(self, key, default) if key in self.__slots__ else default
+
+    def __getitem__(self, key: str):
+        if key not in self.__slots__:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {name: getattr(self, name) for name in self.__slots__}
+
+
+# kind -> (fields or fields(columns), factory class or None for dict)
+_KINDS = {
+    'user': (_user_fields, None),
+    'device': (_DEVICE_FIELDS, None),
+    'telemetry': (_TELEMETRY_FIELDS, None),
+    'condition': (_CONDITION_FIELDS, None),
+    'condition_row': (_CONDITION_FIELDS, ConditionRow),
+    'alert_log': (_ALERT_LOG_FIELDS, None),
+}
+
+_compiled: Dict[Tuple[str, Tuple[str, ...]], Callable] = {}
+
+
+def _value_source(columns, column, converter, default):
+    if column not in columns:
+        # Shape lacks the column: fresh literal default, as with dict.get
+        return repr(default)
+    return _CONVERTERS[converter].format(v=f"r[{columns.index(column)}]")
+
+
+def _dict_source(fields, columns):
+    items = []
+    for key, column, converter, default in fields:
+        if default is OPTIONAL:
+            continue
+        if isinstance(column, list):
+            value = _dict_source(column, columns)
+        else:
+            value = _value_source(columns, column, converter, default)
+        items.append(f"{key!r}: {value}")
+    return "{" + ", ".join(items) + "}"
+
+
+def compile_formatter(kind: str, columns: Tuple[str, ...]) -> Callable:
+    """Generate a row-tuple -> dict (or row object) function for one query shape"""
+    fields, factory = _KINDS[kind]
+    if callable(fields):
+        fields = fields(columns)
+
+    if factory is not None:
+        args = ", ".join(
+            _value_source(columns, column, converter, default)
+            for _, column, converter, default in fields
+        )
+        source = f"def fmt(r):\n    return _factory({args})\n"
+    else:
+        lines = ["def fmt(r):", f"    d = {_dict_source(fields, columns)}"]
+        for key, column, converter, default in fields:
+            if default is OPTIONAL and column in columns:
+                value = f"r[{columns.index(column)}]"
+                lines.append(f"    if {value}:")
+                lines.append(f"        d[{key!r}] = {_CONVERTERS[converter].format(v=value)}")
+        lines.append("    return d")
+        source = "\n".join(lines) + "\n"
+
+    namespace = {"_factory": factory}
+    exec(compile(source, f"<row formatter {kind}>", "exec"), namespace)
+    return namespace["fmt"]
+
+
+def formatter(kind: str, description) -> Callable:
+    """Formatter for a cursor.description, compiled on first use of the shape"""
+    columns = tuple(column[0] for column in description)
+    key = (kind, columns)
+    fmt = _compiled.get(key)
+    if fmt is None:
+        fmt = _compiled[key] = compile_formatter(kind, columns)
+    return fmt
@@ -1,7 +1,10 @@
+import os
 import json
 import logging
+import time
 import uuid
-from datetime import datetime, timezone
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
 
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
@@ -11,8 +14,52 @@ sys.path.insert(0, '/opt/python')
 
 from shared.db_service import DatabaseService
 from shared.rabbitmq_service import RabbitMQService
+from shared import cache
 from shared.auth import authenticate_user
-from shared.response import api_response, error_response
+from shared.config import get_config
+from shared.response import api_response, error_response, dumps, encode_cursor, decode_cursor
+from shared.alert_rules import SENSOR_MAPPINGS, might_trigger
+
+# Publish readings that may cross a condition threshold to the priority lane
+TELEMETRY_PRIORITY_LANE = os.environ.get("TELEMETRY_PRIORITY_LANE", "true").lower() == "true"
+
+# Serialized history pages past the processing horizon:
+# (device_id, cursor, limit, filters) -> (payload bytes, etag, expires).
+# Bounded by total payload size; lives as long as the warm container.
+PAGE_CACHE_BYTES = int(os.environ.get("TELEMETRY_PAGE_CACHE_BYTES", str(16 * 1024 * 1024)))
+# Seconds a history page is served without revalidation, by clients and by
+# this container's page cache. A DELETE can still change an old page (and
+# other containers do not see the eviction), so this bounds how stale it gets.
+PAGE_MAX_AGE_SECONDS = int(os.environ.get("TELEMETRY_PAGE_MAX_AGE_SECONDS", "300"))
+HISTORY_CACHE_CONTROL = f"private, max-age={PAGE_MAX_AGE_SECONDS}"
+_page_cache = OrderedDict()
+_page_cache_size = [0]
+
+def _cached_page(key):
+    entry = _page_cache.get(key)
+    if entry is None:
+        return None
+    if entry[2] <= time.monotonic():
+        _page_cache_size[0] -= len(_page_cache.pop(key)[0])
+        return None
+    _page_cache.move_to_end(key)
+    return entry[:2]
+
+def _cache_page(key, payload: bytes, etag: str):
+    if len(payload) > PAGE_CACHE_BYTES:
+        return
+    previous = _page_cache.pop(key, None)
+    if previous:
+        _page_cache_size[0] -= len(previous[0])
+    _page_cache[key] = (payload, etag, time.monotonic() + PAGE_MAX_AGE_SECONDS)
+    _page_cache_size[0] += len(payload)
+    while _page_cache_size[0] > PAGE_CACHE_BYTES:
+        _, (evicted, _, _) = _page_cache.popitem(last=False)
+        _page_cache_size[0] -= len(evicted)
+
+def _evict_device_pages(device_id: str):
+    for key in [k for k in _page_cache if k[0] == device_id]:
+        _page_cache_size[0] -= len(_page_cache.pop(key)[0])
 
 def main(event, context):
     """Main handler for telemetry endpoints"""
@@ -46,7 +93,7 @@ def post_telemetry(event):
         db = DatabaseService()
 
         # Validate device exists and get owner
-        device_owner = db.find_user_by_device(device_id)
+        device_owner = cache.device_owner(db, device_id)
         if not device_owner:
             return error_response(404, "Device not found")
 
@@ -71,11 +118,12 @@ def post_telemetry(event):
 
         # Send to RabbitMQ for async processing (condition evaluation, storage)
         rabbitmq = RabbitMQService()
+        queue = rabbitmq.priority_queue_name if is_priority(db, telemetry_data) else None
         rabbitmq.send_message({
             "type": "telemetry",
             "data": telemetry_data,
-            "userId": device_owner
-        })
+            "userId": device_owner['userId']
+        }, queue)
 
         return api_response(202, {
             "message": "Telemetry queued for processing",
@@ -87,6 +135,35 @@ def post_telemetry(event):
         logger.exception(f"Post telemetry error: {e}")
         return error_response(500, f"Failed to process telemetry: {str(e)}")
 
+def is_priority(db: DatabaseService, telemetry_data: dict) -> bool:
+    """
+    Whether a reading may trigger a single-reading condition, checked
+    against the cached threshold summary of its value types. Errors fall
+    back to the normal lane: the pre-check must never fail ingestion.
+
+    The lane overtakes older readings of the same device on the main
+    queue. Windowed, anomaly and debounced conditions drop or release on
+    readings older than the last applied one, so a reading with any
+    stateful condition on its value types stays on the main queue.
+    """
+    if not TELEMETRY_PRIORITY_LANE:
+        return False
+    readings = {
+        value_type: telemetry_data[field]
+        for field, value_type in SENSOR_MAPPINGS.items()
+        if telemetry_data.get(field) is not None
+    }
+    if not readings:
+        return False
+    try:
+        bounds = cache.condition_bounds(db, readings)
+    except Exception as e:
+        logger.warning(f"Priority pre-check failed: {e}")
+        return False
+    if any(bounds.get(value_type) and bounds[value_type][3] for value_type in readings):
+        return False
+    return any(might_trigger(bounds.get(value_type), value_type, value) for value_type, value in readings.items())
+
 def get_telemetry(event):
     """GET /api/telemetry - Get telemetry history"""
     auth = authenticate_user(event)
@@ -100,25 +177,75 @@ def get_telemetry(event):
         if not device_id:
             return error_response(400, "deviceId required")
 
-        db = DatabaseService()
-
-        # Verify device ownership
-        device_owner = db.find_user_by_device(device_id)
-        if not device_owner or device_owner != auth['userId']:
-            return error_response(403, "Device not found or not owned by user")
-
-        # Pagination
-        limit = int(params.get('limit', 100))
+        # Pagination: keyset `cursor` (preferred) or legacy `offset`
+        limit = min(int(params.get('limit', 100)), 1000)
         offset = int(params.get('offset', 0))
+        sensor_type = params.get('sensorType')
+        event_date = params.get('eventDate')
+
+        before = None
+        if params.get('cursor'):
+            try:
+                before = decode_cursor(params['cursor'])
+                if len(before) != 2:
+                    raise ValueError("Invalid cursor")
+                anchor = datetime.fromisoformat(before[0])
+            except (ValueError, TypeError, IndexError):
+                return error_response(400, "Invalid cursor")
+            if anchor.tzinfo is None:
+                anchor = anchor.replace(tzinfo=timezone.utc)
+            offset = 0
+
+        # A page anchored before the processing horizon only changes on DELETE
+        historical = False
+        if before:
+            horizon = timedelta(seconds=get_config()["TELEMETRY_IMMUTABLE_AFTER_SECONDS"])
+            historical = anchor < datetime.now(timezone.utc) - horizon
 
-        telemetry = db.get_device_telemetry(device_id, limit, offset)
+        db = DatabaseService()
 
-        return api_response(200, {
+        with db.transaction(read_only=True):
+            # Verify device ownership
+            device_owner = cache.device_owner(db, device_id)
+            if not device_owner or device_owner['userId'] != auth['userId']:
+                return error_response(403, "Device not found or not owned by user")
+
+            cache_key = (device_id, params.get('cursor'), limit, sensor_type, event_date)
+            cached = _cached_page(cache_key) if historical else None
+            if cached:
+                payload, etag = cached
+                return api_response(200, payload, {"Cache-Control": HISTORY_CACHE_CONTROL},
+                                    event=event, etag=etag)
+
+            telemetry = db.get_device_telemetry(
+                device_id,
+                sensor_type=sensor_type,
+                event_date=event_date,
+                limit=limit,
+                offset=offset,
+                before=before
+            )
+
+        next_cursor = None
+        if len(telemetry) == limit:
+            last = telemetry[-1]
+            next_cursor = encode_cursor(last['event_date'], last['eventId'])
+
+        body = {
             "telemetry": telemetry,
             "count": len(telemetry),
             "limit": limit,
-            "offset": offset
-        })
+            "offset": offset,
+            "nextCursor": next_cursor
+        }
+
+        if not historical:
+            return api_response(200, body, event=event)
+
+        payload = dumps(body)
+        response = api_response(200, payload, {"Cache-Control": HISTORY_CACHE_CONTROL}, event=event)
+        _cache_page(cache_key, payload, response["headers"]["ETag"])
+        return response
 
     except Exception as e:
         logger.exception(f"Get telemetry error: {e}")
@@ -152,15 +279,14 @@ def delete_telemetry(event):
 
         db = DatabaseService()
 
-        # Verify device ownership
-        device_owner = db.find_user_by_device(device_id)
-        if not device_owner or device_owner != auth['userId']:
-            return error_response(403, "Device not found or not owned by user")
-
-        success = db.delete_telemetry(telemetry_id, device_id)
+        # Ownership check and delete in one statement
+        device_owned, success = db.delete_telemetry_owned(telemetry_id, device_id, auth['userId'])
 
         if success:
+            _evict_device_pages(device_id)
             return api_response(200, {"message": "Telemetry deleted successfully"})
+        elif not device_owned:
+            return error_response(403, "Device not found or not owned by user")
         else:
             return error_response(404, "Telemetry not found")
 
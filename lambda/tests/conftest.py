@@ -0,0 +1,40 @@
+"""
+Test setup: puts lambda/ on the path (the layer's /opt/python in Lambda)
+and serves config from a stub Secrets Manager client.
+"""
+
+import os
+import sys
+import json
+import importlib.util
+
+LAMBDA_DIR = os.path.join(os.path.dirname(__file__), '..')
+sys.path.insert(0, LAMBDA_DIR)
+os.environ.setdefault('SECRETS_ARN', 'arn:aws:secretsmanager:local:000000000000:secret:test')
+
+from shared import config
+
+
+class StubSecrets:
+    def get_secret_value(self, SecretId):
+        return {
+            'SecretString': json.dumps({
+                'db_username': 'test',
+                'db_password': 'test',
+                'jwt_secret': 'test-secret',
+            }),
+            'VersionId': 'test',
+        }
+
+
+config.set_secrets_client(StubSecrets())
+
+
+def load_handler(function: str):
+    """Import <function>/handler.py under a unique module name"""
+    spec = importlib.util.spec_from_file_location(
+        f"{function}_handler", os.path.join(LAMBDA_DIR, function, "handler.py")
+    )
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
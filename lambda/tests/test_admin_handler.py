@@ -0,0 +1,59 @@
+import json
+from contextlib import contextmanager
+
+import pytest
+
+from conftest import load_handler
+
+handler = load_handler("admin")
+
+ADMIN_ID = "00000000-0000-0000-0000-000000000001"
+USER_ID = "00000000-0000-0000-0000-000000000002"
+
+
+class FakeDatabaseService:
+    """One user; records update_user calls"""
+    updates = []
+
+    @contextmanager
+    def transaction(self, read_only=False):
+        yield self
+
+    def find_user_by_id(self, user_id):
+        return {"userId": USER_ID, "type": "Standard", "password": "hash"} if user_id == USER_ID else None
+
+    def update_user(self, user_id, updates):
+        FakeDatabaseService.updates.append((user_id, updates))
+        return {"userId": user_id, "type": updates.get("type", "Standard"), "password": "hash"}
+
+
+@pytest.fixture(autouse=True)
+def stub_services(monkeypatch):
+    FakeDatabaseService.updates = []
+    monkeypatch.setattr(handler, "DatabaseService", FakeDatabaseService)
+    monkeypatch.setattr(handler, "authenticate_user", lambda event: {"userId": ADMIN_ID, "userType": "Admin"})
+
+
+def change_user_type(body):
+    return handler.main({
+        "requestContext": {"http": {"method": "PUT"}},
+        "rawPath": "/api/manage/change-user-type",
+        "body": json.dumps(body),
+    }, None)
+
+
+def test_change_user_type_writes_type_and_hides_password():
+    response = change_user_type({"userId": USER_ID, "userType": "Admin"})
+
+    assert response["statusCode"] == 200
+    assert FakeDatabaseService.updates == [(USER_ID, {"type": "Admin"})]
+    user = json.loads(response["body"])["user"]
+    assert user["type"] == "Admin"
+    assert "password" not in user
+
+
+def test_change_user_type_of_unknown_user():
+    response = change_user_type({"userId": "missing", "userType": "Admin"})
+
+    assert response["statusCode"] == 404
+    assert FakeDatabaseService.updates == []
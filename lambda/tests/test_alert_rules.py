@@ -0,0 +1,100 @@
+import random
+import logging
+
+import pytest
+
+from shared import alert_rules
+from shared.row_format import ConditionRow
+
+VALUE_TYPES = list(alert_rules.SENSOR_MAPPINGS.values())
+DEVICES = [f"device-{i:03d}" for i in range(20)]
+THRESHOLDS = [0.0, 5.0, 10.5, 30.0, -3.25, 100.0]
+
+
+def random_value(value_type: str):
+    if value_type == 'motion':
+        return random.choice([True, False, 0, 1, 1.0, "1", "true"])
+    return random.choice([
+        random.choice(THRESHOLDS),                      # exactly on a threshold
+        round(random.uniform(-10, 110), random.choice([0, 1, 2])),
+        random.randint(-10, 110),
+        str(random.choice(THRESHOLDS)),                 # numeric string
+        " 12.5 ",
+        "n/a",
+        True,
+        float('nan'),
+        1e300,
+    ])
+
+
+def random_condition(value_type: str) -> ConditionRow:
+    def bound():
+        return random.choice(THRESHOLDS) if random.random() < 0.5 else None
+    return ConditionRow(
+        "cond", "condition", "user", random.choice(DEVICES + ["", None]), value_type,
+        bound(), bound(), bound(), None, random.choice(["device", "general", "user", None]), ["Log"],
+    )
+
+
+def random_batch(readings: int, conditions: int):
+    batch = [
+        (random.choice(DEVICES), value_type, random_value(value_type))
+        for value_type in random.choices(VALUE_TYPES, k=readings)
+    ]
+    by_type = {
+        value_type: [random_condition(value_type) for _ in range(conditions)]
+        for value_type in VALUE_TYPES
+    }
+    return batch, by_type
+
+
+def test_vectorized_matches_scalar(caplog):
+    """Same (reading, condition, message) triples on randomized batches with edge values"""
+    if alert_rules._load_numpy() is None:
+        pytest.skip("numpy is not installed")
+    # check_condition warns on every unparseable reading
+    caplog.set_level(logging.ERROR)
+    random.seed(42)
+
+    for trial in range(500):
+        batch, by_type = random_batch(random.randint(1, 200), random.randint(0, 12))
+        scalar = alert_rules.evaluate_batch(batch, by_type, vectorized=False)
+        vector = alert_rules.evaluate_batch(batch, by_type)
+        as_ids = lambda result: [(i, id(c), message) for i, c, message in result]
+        assert as_ids(vector) == as_ids(scalar), f"trial {trial}"
+
+
+def test_baselines_rollback_restores_uncommitted_updates():
+    condition = {'_id': 'c', 'valueType': 'temperature', 'aggregate': 'zscore', 'windowSeconds': 60,
+                 'maxValue': 3, 'scope': 'general'}
+    baselines = alert_rules.Baselines({
+        ('device-1', 'temperature', 60): {'mean': 20.0, 'variance': 1.0, 'readings': 50, 'last': 0.0}
+    })
+    baselines.evaluate([condition], 'device-1', 'temperature', 21.0, '1970-01-01T00:00:10Z')
+    baselines.commit()
+    committed = dict(baselines.states)
+
+    baselines.evaluate([condition], 'device-1', 'temperature', 40.0, '1970-01-01T00:00:20Z')
+    baselines.evaluate([condition], 'device-2', 'temperature', 40.0, '1970-01-01T00:00:20Z')
+    baselines.rollback()
+
+    assert baselines.states == committed
+    assert [row['device_id'] for row in baselines.pending()] == ['device-1']
+
+
+def test_baselines_rollback_of_a_detached_message_keeps_later_readings():
+    condition = {'_id': 'c', 'valueType': 'temperature', 'aggregate': 'zscore', 'windowSeconds': 60,
+                 'maxValue': 3, 'scope': 'general'}
+    before = {'mean': 20.0, 'variance': 1.0, 'readings': 50, 'last': 0.0}
+    baselines = alert_rules.Baselines({('device-1', 'temperature', 60): before, ('device-2', 'temperature', 60): before})
+
+    baselines.evaluate([condition], 'device-1', 'temperature', 21.0, '1970-01-01T00:00:10Z')
+    baselines.evaluate([condition], 'device-2', 'temperature', 21.0, '1970-01-01T00:00:10Z')
+    failed = baselines.detach()
+    baselines.evaluate([condition], 'device-1', 'temperature', 22.0, '1970-01-01T00:00:20Z')
+    later = baselines.states[('device-1', 'temperature', 60)]
+    baselines.rollback(failed)
+
+    assert baselines.states[('device-1', 'temperature', 60)] is later
+    assert baselines.states[('device-2', 'temperature', 60)] is before
+    assert [row['device_id'] for row in baselines.pending()] == ['device-1']
@@ -0,0 +1,69 @@
+import time
+from contextlib import contextmanager
+
+import pytest
+
+from conftest import load_handler
+from shared.response import encode_cursor
+
+handler = load_handler("alertlogs")
+
+USER_ID = "00000000-0000-0000-0000-000000000001"
+
+
+class FakeDatabaseService:
+    """An empty feed; `slots` long-poll slots are free"""
+    slots = 0
+
+    def __init__(self):
+        self.queries = 0
+
+    @contextmanager
+    def session_slot(self, application_name, limit):
+        yield FakeDatabaseService.slots > 0
+
+    def wait_for_notify(self, payload, timeout):
+        time.sleep(timeout)
+        return False
+
+    def get_alert_feed(self, user_id, after, limit, device_id):
+        self.queries += 1
+        return [], after, False
+
+
+@pytest.fixture(autouse=True)
+def stub_services(monkeypatch):
+    monkeypatch.setattr(handler, "DatabaseService", FakeDatabaseService)
+    monkeypatch.setattr(handler, "authenticate_user", lambda event: {"userId": USER_ID})
+    monkeypatch.setattr(handler, "FEED_LISTEN", False)
+    monkeypatch.setattr(handler, "FEED_POLL_SECONDS", 0.05)
+
+
+def feed_request(wait):
+    return {
+        "requestContext": {"http": {"method": "GET"}},
+        "rawPath": "/api/alertlogs/feed",
+        "queryStringParameters": {"cursor": encode_cursor(100, "alert-1"), "wait": str(wait)},
+    }
+
+
+def test_feed_waits_while_a_slot_is_free(monkeypatch):
+    monkeypatch.setattr(FakeDatabaseService, "slots", 1)
+    started = time.monotonic()
+
+    response = handler.main(feed_request(0.2), None)
+
+    assert response["statusCode"] == 200
+    assert time.monotonic() - started >= 0.2
+    assert "Retry-After" not in response["headers"]
+
+
+def test_feed_short_polls_when_waiters_are_at_the_limit(monkeypatch):
+    monkeypatch.setattr(FakeDatabaseService, "slots", 0)
+    started = time.monotonic()
+
+    response = handler.main(feed_request(10), None)
+
+    assert response["statusCode"] == 200
+    assert time.monotonic() - started < 1
+    assert response["headers"]["Retry-After"] == "1"
@@ -0,0 +1,144 @@
+import json
+import asyncio
+from contextlib import asynccontextmanager
+
+from shared import async_consumer
+
+
+class Message:
+    def __init__(self, payload, broken_channel=False):
+        self.body = json.dumps(payload).encode()
+        self.broken_channel = broken_channel
+        self.acked = False
+
+    async def ack(self):
+        if self.broken_channel:
+            raise ConnectionError("channel closed")
+        self.acked = True
+
+    async def nack(self, requeue=False):
+        if self.broken_channel:
+            raise ConnectionError("channel closed")
+
+
+class Queue:
+    def __init__(self, messages):
+        self.messages = list(messages)
+
+    async def get(self, no_ack=False, fail=False):
+        return self.messages.pop(0) if self.messages else None
+
+
+def telemetry(device_id, seq):
+    return {"type": "telemetry", "data": {"device_id": device_id, "seq": seq}}
+
+
+def consumer_for(messages):
+    consumer = async_consumer.AsyncConsumer(Queue(messages), None, workers=2)
+
+    async def store(message, payload):
+        return payload['data'], None
+
+    async def evaluate(message, item):
+        return item[0]['device_id'], [], {}, {}, []
+
+    async def flush():
+        pass
+
+    consumer._store = store
+    consumer._evaluate = evaluate
+    consumer._flush_baselines = flush
+    return consumer
+
+
+def test_run_finishes_when_nack_fails():
+    messages = [Message(telemetry("device-1", i), broken_channel=(i == 1)) for i in range(4)]
+    consumer = consumer_for(messages)
+
+    result = asyncio.run(asyncio.wait_for(consumer.run(10), timeout=5))
+
+    assert result["processed"] == 3
+    assert len(result["errors"]) == 1
+    assert [m.acked for m in messages] == [True, False, True, True]
+
+
+WINDOWED = {'_id': 'c-window', 'valueType': 'temperature', 'aggregate': 'avg', 'windowSeconds': 60,
+            'maxValue': 30, 'scope': 'general'}
+
+
+class Connection:
+    def __init__(self, pool):
+        self.pool = pool
+
+    async def fetch(self, query, *args):
+        return []
+
+    async def execute(self, query, *args):
+        self.pool.statements.append(query)
+
+    async def executemany(self, query, rows):
+        self.pool.statements.append(query)
+        if query == async_consumer.NUMBERED_STATEMENTS['insert_alert_log'] and self.pool.fail_inserts:
+            raise ConnectionError("connection lost")
+
+    @asynccontextmanager
+    async def transaction(self):
+        self.pool.transactions += 1
+        yield
+
+
+class Pool:
+    def __init__(self, fail_inserts=False):
+        self.fail_inserts = fail_inserts
+        self.statements = []
+        self.transactions = 0
+
+    @asynccontextmanager
+    async def acquire(self):
+        yield Connection(self)
+
+
+def windowed_consumer(pool):
+    consumer = async_consumer.AsyncConsumer(Queue([]), pool, workers=1)
+
+    async def conditions_for(value_type):
+        return ([], [WINDOWED], []) if value_type == 'temperature' else ([], [], [])
+
+    consumer._conditions_for = conditions_for
+    return consumer
+
+
+def reading(temperature):
+    return {'device_id': 'device-1', 'timestamp': '2026-10-19T12:00:00Z', 'temperature': temperature}, 'user-1'
+
+
+def test_write_saves_windows_and_alerts_in_one_transaction():
+    pool = Pool()
+    consumer = windowed_consumer(pool)
+    message = Message(telemetry("device-1", 0))
+
+    async def go():
+        await consumer._write(message, await consumer._evaluate(message, reading(35.0)))
+    asyncio.run(go())
+
+    assert pool.transactions == 1
+    assert pool.statements == [
+        async_consumer.NUMBERED_STATEMENTS['save_condition_window'],
+        async_consumer.NUMBERED_STATEMENTS['insert_alert_log'],
+    ]
+    assert message.acked and consumer.alerts_triggered == 1
+
+
+def test_failed_write_undoes_the_message_window_state():
+    consumer = windowed_consumer(Pool(fail_inserts=True))
+    message = Message(telemetry("device-1", 0))
+
+    async def go():
+        await consumer._write(message, await consumer._evaluate(message, reading(35.0)))
+    try:
+        asyncio.run(go())
+    except ConnectionError:
+        pass
+
+    assert consumer._windows == {}
+    assert not message.acked
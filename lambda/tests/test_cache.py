@@ -0,0 +1,53 @@
+import json
+
+import pytest
+
+from shared import cache
+
+
+class FakeDatabaseService:
+    def __init__(self):
+        self.lookups = 0
+
+    def get_cache_versions(self):
+        return {"conditions": 1, "device_owners": 1}
+
+    def find_user_by_device(self, device_id):
+        self.lookups += 1
+        return {"userId": "user-1", "username": "user", "email": "user@example.com"}
+
+
+@pytest.fixture(autouse=True)
+def empty_caches():
+    for caches in cache.CACHES.values():
+        for versioned in caches:
+            versioned.clear()
+    yield
+
+
+def test_device_owner_caches_only_the_user_id():
+    db = FakeDatabaseService()
+
+    assert cache.device_owner(db, "device-1") == {"userId": "user-1"}
+    assert cache.device_owner(db, "device-1") == {"userId": "user-1"}
+    assert db.lookups == 1
+
+
+def test_invalidate_evicts_listed_keys():
+    generation = cache.device_owners.lookup("device-1")[1]
+    cache.device_owners.store("device-1", "user-1", generation)
+    cache.device_owners.store("device-2", "user-2", generation)
+
+    cache.invalidate(json.dumps({"cache": "device_owners", "table": "devices", "keys": ["device-1"]}))
+
+    assert cache.device_owners.lookup("device-1")[0] is cache.MISS
+    assert cache.device_owners.lookup("device-2")[0] == "user-2"
+
+
+def test_invalidate_without_keys_clears_the_cache():
+    generation = cache.conditions.lookup("temperature")[1]
+    cache.conditions.store("temperature", ([], [], []), generation)
+
+    cache.invalidate(json.dumps({"cache": "conditions", "table": "conditions", "keys": None}))
+
+    assert cache.conditions.lookup("temperature")[0] is cache.MISS
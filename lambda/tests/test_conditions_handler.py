@@ -0,0 +1,124 @@
+import json
+from contextlib import contextmanager
+
+import pytest
+
+from conftest import load_handler
+
+handler = load_handler("conditions")
+
+USER_ID = "00000000-0000-0000-0000-000000000001"
+
+
+class FakeDatabaseService:
+    """Records the create/update calls the handler makes"""
+    instances = []
+
+    def __init__(self):
+        self.created = []
+        self.updated = []
+        FakeDatabaseService.instances.append(self)
+
+    @contextmanager
+    def transaction(self, read_only=False):
+        yield self
+
+    def find_user_by_device(self, device_id):
+        return {"userId": USER_ID if device_id == "device-1" else "someone-else"}
+
+    def create_condition(self, condition_data):
+        self.created.append(condition_data)
+        return {"_id": condition_data["id"], **condition_data}
+
+    def update_condition_owned(self, condition_id, user_id, updates):
+        self.updated.append((condition_id, user_id, updates))
+        return True, {"_id": condition_id, **updates}
+
+
+@pytest.fixture(autouse=True)
+def stub_services(monkeypatch):
+    FakeDatabaseService.instances = []
+    monkeypatch.setattr(handler, "DatabaseService", FakeDatabaseService)
+    monkeypatch.setattr(handler, "authenticate_user", lambda event: {"userId": USER_ID})
+
+
+def request(method, body):
+    return {"requestContext": {"http": {"method": method}}, "body": json.dumps(body)}
+
+
+def calls(attribute):
+    return [call for db in FakeDatabaseService.instances for call in getattr(db, attribute)]
+
+
+def test_create_maps_azure_fields():
+    response = handler.main(request("POST", {
+        "deviceId": "device-1", "valueType": "temperature", "maxValue": 30, "unit": "C",
+        "scope": "device", "aggregate": "avg", "windowSeconds": 600,
+        "cooldownSeconds": 300, "hysteresis": 1.5,
+    }), None)
+
+    assert response["statusCode"] == 201
+    (created,) = calls("created")
+    assert created["userId"] == USER_ID
+    assert created["deviceId"] == "device-1"
+    assert created["valueType"] == "temperature"
+    assert created["maxValue"] == 30
+    assert (created["aggregate"], created["windowSeconds"]) == ("avg", 600)
+    assert (created["cooldownSeconds"], created["hysteresis"]) == (300, 1.5)
+    assert "minValue" not in created
+
+
+def test_create_zscore_condition():
+    response = handler.main(request("POST", {
+        "valueType": "humidity", "maxValue": 3, "aggregate": "zscore", "windowSeconds": 3600,
+    }), None)
+
+    assert response["statusCode"] == 201
+    (created,) = calls("created")
+    assert created["deviceId"] == ""
+    assert created["aggregate"] == "zscore"
+
+
+def test_create_rejects_device_of_another_user():
+    response = handler.main(request("POST", {"deviceId": "device-2", "valueType": "temperature"}), None)
+
+    assert response["statusCode"] == 403
+    assert calls("created") == []
+
+
+@pytest.mark.parametrize("body", [
+    {"maxValue": 30},
+    {"valueType": "temperature", "aggregate": "median", "windowSeconds": 60},
+    {"valueType": "temperature", "aggregate": "avg"},
+    {"valueType": "temperature", "aggregate": "avg", "windowSeconds": 0},
+    {"valueType": "temperature", "aggregate": "change", "windowSeconds": "60"},
+    {"valueType": "temperature", "cooldownSeconds": -1},
+    {"valueType": "temperature", "hysteresis": -0.5},
+    {"valueType": "temperature", "maxValue": "hot"},
+])
+def test_create_rejects_invalid_fields(body):
+    response = handler.main(request("POST", body), None)
+
+    assert response["statusCode"] == 400
+    assert calls("created") == []
+
+
+@pytest.mark.parametrize("body", [
+    {"conditionId": "c1", "aggregate": "median"},
+    {"conditionId": "c1", "aggregate": "avg", "windowSeconds": None},
+    {"conditionId": "c1", "windowSeconds": -5},
+    {"conditionId": "c1", "cooldownSeconds": -1},
+    {"conditionId": "c1", "hysteresis": -2},
+])
+def test_update_rejects_invalid_fields(body):
+    response = handler.main(request("PUT", body), None)
+
+    assert response["statusCode"] == 400
+    assert calls("updated") == []
+
+
+def test_update_passes_debounce_fields():
+    response = handler.main(request("PUT", {"conditionId": "c1", "cooldownSeconds": 0, "hysteresis": 2}), None)
+
+    assert response["statusCode"] == 200
+    assert calls("updated") == [("c1", USER_ID, {"cooldownSeconds": 0, "hysteresis": 2})]
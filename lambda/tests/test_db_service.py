@@ -0,0 +1,133 @@
+import json
+from contextlib import contextmanager
+
+import pytest
+
+from shared import db_service
+from shared.db_service import DatabaseService
+
+
+class RecordingCursor:
+    description = None
+
+    def __init__(self):
+        self.executed = []
+
+    def execute(self, query, params=None):
+        self.executed.append((query, params))
+
+    def fetchall(self):
+        return []
+
+
+def recording_db():
+    db = DatabaseService()
+    cursor = RecordingCursor()
+
+    @contextmanager
+    def get_cursor(name=None, read_only=False):
+        yield cursor
+
+    db.get_cursor = get_cursor
+    return db, cursor
+
+
+def reading(event_id, temperature):
+    return {
+        'eventId': event_id,
+        'deviceId': 'device-1',
+        'userId': '00000000-0000-0000-0000-000000000001',
+        'event_date': '2026-10-19T00:00:00+00:00',
+        'values': [{'valueType': 'temperature', 'value': temperature}],
+        'imageUrl': None,
+        'timestamp': '2026-10-19T00:00:00Z',
+    }
+
+
+def test_store_and_evaluate_batch_dedupes_event_ids():
+    db, cursor = recording_db()
+    first = '00000000-0000-0000-0000-00000000000a'
+    other = '00000000-0000-0000-0000-00000000000b'
+
+    db.store_and_evaluate_batch([reading(first, 30), reading(other, 20), reading(first, 31)])
+
+    (_, (batch,)), = cursor.executed
+    rows = json.loads(batch)
+    assert [row['event_id'] for row in rows] == [first, other]
+    # The first delivery wins
+    assert rows[0]['values'] == [{'valueType': 'temperature', 'value': 30}]
+
+
+class SlotCursor:
+    def __init__(self, conn):
+        self.conn = conn
+
+    def execute(self, query, params=None):
+        self.conn.executed.append(query.split()[0])
+
+    def fetchone(self):
+        return ('alert-feed-wait',) if self.conn.slot_free else None
+
+    def close(self):
+        pass
+
+
+class SlotConnection:
+    def __init__(self, slot_free):
+        self.slot_free = slot_free
+        self.executed = []
+        self.reusable = True
+        self.closed = False
+        self.released = False
+
+    def cursor(self, name=None):
+        return SlotCursor(self)
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+
+def slot_db(monkeypatch, slot_free):
+    monkeypatch.setattr(db_service, "DB_REUSE_CONNECTIONS", False)
+    db = DatabaseService()
+    conn = SlotConnection(slot_free)
+    db._checkout = lambda role='primary': conn
+
+    def release(released):
+        released.released = True
+    db._release = release
+    return db, conn
+
+
+def test_session_slot_holds_its_connection_for_the_block(monkeypatch):
+    db, conn = slot_db(monkeypatch, slot_free=True)
+
+    with db.session_slot('alert-feed-wait', 20) as taken:
+        assert taken
+        assert db._conn is conn and not conn.released
+
+    assert conn.executed == ['SELECT', 'RESET']
+    assert conn.released and conn.reusable
+
+
+def test_session_slot_drops_a_tagged_connection_when_the_block_fails(monkeypatch):
+    db, conn = slot_db(monkeypatch, slot_free=True)
+
+    with pytest.raises(ValueError):
+        with db.session_slot('alert-feed-wait', 20):
+            raise ValueError("query failed")
+
+    assert conn.executed == ['SELECT']
+    assert conn.released and not conn.reusable
+
+
+def test_session_slot_reports_a_full_budget(monkeypatch):
+    db, conn = slot_db(monkeypatch, slot_free=False)
+
+    with db.session_slot('alert-feed-wait', 20) as taken:
+        assert not taken
+
+    assert conn.executed == ['SELECT']
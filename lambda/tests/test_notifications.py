@@ -0,0 +1,66 @@
+import pytest
+
+from shared import notifications
+
+
+class FakeDatabaseService:
+    """Hands out claimed batches in order; an Exception in the list is raised instead"""
+
+    def __init__(self, batches):
+        self.batches = list(batches)
+        self.released = []
+
+    def claim_pending_notifications(self, limit, max_attempts):
+        batch = self.batches.pop(0) if self.batches else []
+        if isinstance(batch, Exception):
+            raise batch
+        return batch
+
+    def release_notifications(self, alert_ids):
+        self.released.append(list(alert_ids))
+
+
+class FailingSink(notifications.NotificationSink):
+    def send(self, digest):
+        raise RuntimeError("unreachable")
+
+
+def claimed(alert_id, channel):
+    alert = {
+        '_id': alert_id, 'deviceId': 'device-1', 'message': 'hot', 'timestamp': '2026-10-19T00:00:00Z',
+        'condition': {'notificationMethods': [channel]},
+    }
+    return alert, {'userId': 'user-1', 'username': 'user', 'email': None, 'phone': None}
+
+
+@pytest.fixture(autouse=True)
+def sinks(monkeypatch):
+    monkeypatch.setattr(notifications, "NOTIFY_BATCH_SIZE", 1)
+    monkeypatch.setattr(notifications, "NOTIFY_RETRY_SECONDS", 0)
+    monkeypatch.setattr(notifications, "_sinks", {"log": notifications.LogSink(), "sms": FailingSink()})
+
+
+def test_sink_must_implement_send():
+    class Incomplete(notifications.NotificationSink):
+        pass
+
+    with pytest.raises(TypeError):
+        Incomplete()
+
+
+def test_dispatch_releases_failed_alerts():
+    db = FakeDatabaseService([[claimed('a1', 'Log')], [claimed('a2', 'SMS')]])
+
+    totals = notifications.dispatch(db)
+
+    assert totals == {"alerts": 2, "digests_sent": 1, "digests_failed": 1}
+    assert db.released == [['a2']]
+
+
+def test_dispatch_releases_failed_alerts_when_a_later_claim_fails():
+    db = FakeDatabaseService([[claimed('a1', 'SMS')], RuntimeError("connection lost")])
+
+    with pytest.raises(RuntimeError):
+        notifications.dispatch(db)
+
+    assert db.released == [['a1']]
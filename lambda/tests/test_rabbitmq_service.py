@@ -0,0 +1,24 @@
+from shared import rabbitmq_service
+
+
+class RecordingChannel:
+    def __init__(self):
+        self.declared = []
+
+    def queue_declare(self, queue, durable, arguments=None):
+        self.declared.append((queue, durable, arguments))
+
+
+def test_declare_sets_up_the_dead_letter_queue_first():
+    channel = RecordingChannel()
+
+    rabbitmq_service._declare(channel, "telemetry-priority-queue")
+
+    assert channel.declared == [
+        ("telemetry-priority-queue-dlq", True, None),
+        ("telemetry-priority-queue", True, {
+            'x-dead-letter-exchange': '',
+            'x-dead-letter-routing-key': 'telemetry-priority-queue-dlq',
+            'x-message-ttl': 86400000,
+        }),
+    ]
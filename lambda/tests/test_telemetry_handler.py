@@ -0,0 +1,55 @@
+from conftest import load_handler
+from shared import alert_rules
+
+handler = load_handler("telemetry")
+
+WINDOWED = {'_id': 'c-avg', 'valueType': 'temperature', 'aggregate': 'avg', 'windowSeconds': 300,
+            'maxValue': 30, 'scope': 'general'}
+
+
+def stream():
+    """One device's readings, oldest first; the third crosses THRESHOLD"""
+    return [
+        {'device_id': 'device-1', 'timestamp': f'2026-10-19T12:00:{second:02d}Z', 'temperature': temperature}
+        for second, temperature in [(0, 20.0), (10, 21.0), (20, 45.0), (30, 22.0)]
+    ]
+
+
+def delivered(readings):
+    """Consumer order: the priority lane is drained before the main queue"""
+    lanes = {True: [], False: []}
+    for reading in readings:
+        lanes[handler.is_priority(None, reading)].append(reading)
+    return lanes[True] + lanes[False]
+
+
+def window_readings(readings) -> int:
+    state = None
+    for reading in readings:
+        _, updated = alert_rules.evaluate_windows(
+            [WINDOWED], {300: state} if state else {}, 'device-1', 'temperature',
+            reading['temperature'], reading['timestamp']
+        )
+        state = updated.get(300, state)
+    return sum(bucket[1] for bucket in state['buckets'])
+
+
+def test_threshold_crossings_take_the_priority_lane(monkeypatch):
+    monkeypatch.setattr(handler.cache, "condition_bounds",
+                        lambda db, value_types: {'temperature': (None, 40.0, frozenset(), False)})
+
+    order = delivered(stream())
+
+    assert [reading['temperature'] for reading in order] == [45.0, 20.0, 21.0, 22.0]
+
+
+def test_readings_with_stateful_conditions_keep_their_order(monkeypatch):
+    monkeypatch.setattr(handler.cache, "condition_bounds",
+                        lambda db, value_types: {'temperature': (None, 40.0, frozenset(), True)})
+
+    order = delivered(stream())
+
+    assert order == stream()
+    # Reordered, the window would have dropped the readings older than 45.0
+    assert window_readings(order) == 4
+    assert window_readings(stream()[2:] + stream()[:2]) < 4
@@ -10,7 +10,7 @@ sys.path.insert(0, '/opt/python')
 
 from shared.db_service import DatabaseService
 from shared.auth import authenticate_user, create_token, hash_password, verify_password
-from shared.response import api_response, error_response
+from shared.response import api_response, error_response, make_etag, etag_matches, not_modified_response
 
 def main(event, context):
     """Main handler - routes to appropriate function based on path and method"""
@@ -50,16 +50,7 @@ def register(event):
         if not all([username, email, password]):
             return error_response(400, "Missing required fields: username, email, password")
 
-        db = DatabaseService()
-
-        # Check for duplicates
-        if db.find_user_by_email(email):
-            return error_response(409, "Email already registered")
-
-        if db.find_user_by_username(username):
-            return error_response(409, "Username already taken")
-
-        # Create user
+        # Create user (hash before opening the transaction - bcrypt is slow)
         user_data = {
             "id": str(uuid.uuid4()),
             "username": username,
@@ -71,7 +62,18 @@ def register(event):
             "notification_methods": body.get('notificationMethods', ['email'])
         }
 
-        user = db.create_user(user_data)
+        db = DatabaseService()
+
+        with db.transaction():
+            # Check for duplicates
+            if db.find_user_by_email(email):
+                return error_response(409, "Email already registered")
+
+            if db.find_user_by_username(username):
+                return error_response(409, "Username already taken")
+
+            user = db.create_user(user_data)
+
         token = create_token(user['id'], user['user_type'])
 
         return api_response(201, {
@@ -124,20 +126,31 @@ def get_profile(event):
         return error_response(401, "Authentication required")
 
     try:
+        params = event.get('queryStringParameters', {}) or {}
+        include_latest = params.get('includeLatest', '').lower() == 'true'
+
         db = DatabaseService()
-        user = db.find_user_by_id(auth['userId'])
+
+        with db.transaction():
+            # Answer unchanged polls from the version query alone
+            version = db.get_user_profile_version(auth['userId'])
+            if not version:
+                return error_response(404, "User not found")
+
+            etag = make_etag('profile', include_latest, *version)
+            if etag_matches(event, etag):
+                return not_modified_response(etag)
+
+            # User and devices in a single query
+            user = db.get_user_profile(auth['userId'], include_latest)
 
         if not user:
             return error_response(404, "User not found")
 
-        # Remove sensitive fields
-        del user['password_hash']
-
-        # Get user's devices
-        devices = db.get_user_devices(auth['userId'])
-        user['devices'] = devices
+        # Remove sensitive fields (the user formatter maps password_hash -> password)
+        del user['password']
 
-        return api_response(200, user)
+        return api_response(200, user, event=event, etag=etag)
 
     except Exception as e:
         logger.exception(f"Get profile error: {e}")
@@ -0,0 +1,73 @@
+"""Device last-seen tracking
+
+Revision ID: 002
+Revises: 001
+Create Date: 2026-10-19
+
+Adds a per-device last-seen timestamp maintained during telemetry
+ingestion, so silent devices can be found without scanning telemetry.
+
+Columns:
+- devices.last_seen_at: event_date of the newest reading stored
+- devices.silence_alerted_at: set by the silent-device sweep, cleared
+  when the device reports again
+"""
+from typing import Sequence, Union
+from alembic import op
+import sqlalchemy as sa
+
+revision: str = '002'
+down_revision: Union[str, None] = '001'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('devices', sa.Column('last_seen_at', sa.TIMESTAMP(timezone=True), nullable=True))
+    op.add_column('devices', sa.Column('silence_alerted_at', sa.TIMESTAMP(timezone=True), nullable=True))
+
+    # Backfill from existing telemetry (one pass, uses idx_telemetry_device_date)
+    op.execute('''
+        UPDATE devices d
+        SET last_seen_at = t.last_seen
+        FROM (
+            SELECT device_id, MAX(event_date) AS last_seen
+            FROM telemetry
+            GROUP BY device_id
+        ) t
+        WHERE d.device_id = t.device_id
+    ''')
+
+    # Keyset paging for the admin listing: ORDER BY last_seen_at, device_id
+    op.create_index('idx_devices_last_seen', 'devices', ['last_seen_at', 'device_id'],
+                    postgresql_where=sa.text('last_seen_at IS NOT NULL'))
+    # Sweep candidates only: devices not yet alerted for the current silence
+    op.create_index('idx_devices_silence_pending', 'devices', ['last_seen_at', 'device_id'],
+                    postgresql_where=sa.text('last_seen_at IS NOT NULL AND silence_alerted_at IS NULL'))
+
+    # Ingestion and the sweep only touch the tracking columns; keep them
+    # from bumping updated_at on every reading
+    op.execute('DROP TRIGGER IF EXISTS update_devices_updated_at ON devices')
+    op.execute('''
+        CREATE TRIGGER update_devices_updated_at
+            BEFORE UPDATE ON devices
+            FOR EACH ROW
+            WHEN (OLD.last_seen_at IS NOT DISTINCT FROM NEW.last_seen_at
+                  AND OLD.silence_alerted_at IS NOT DISTINCT FROM NEW.silence_alerted_at)
+            EXECUTE FUNCTION update_updated_at_column()
+    ''')
+
+
+def downgrade() -> None:
+    op.execute('DROP TRIGGER IF EXISTS update_devices_updated_at ON devices')
+    op.execute('''
+        CREATE TRIGGER update_devices_updated_at
+            BEFORE UPDATE ON devices
+            FOR EACH ROW
+            EXECUTE FUNCTION update_updated_at_column()
+    ''')
+
+    op.drop_index('idx_devices_silence_pending', table_name='devices')
+    op.drop_index('idx_devices_last_seen', table_name='devices')
+    op.drop_column('devices', 'silence_alerted_at')
+    op.drop_column('devices', 'last_seen_at')
@@ -0,0 +1,57 @@
+"""Windowed and rate-of-change conditions
+
+Revision ID: 003
+Revises: 002
+Create Date: 2026-10-19
+
+Lets a condition compare an aggregate over a sliding time window instead
+of a single reading, evaluated incrementally by the consumer.
+
+Columns:
+- conditions.aggregate: NULL (single reading, as before), 'avg' (mean
+  over the window), 'change' (newest minus oldest reading in the window)
+  or 'pct_change' (that change as a percentage of the oldest reading)
+- conditions.window_seconds: window length for aggregate conditions
+
+Tables:
+- condition_windows: compact per device/valueType/window state (a fixed
+  number of time buckets with count, sum, first and last value), so
+  evaluation never rescans telemetry
+"""
+from typing import Sequence, Union
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+revision: str = '003'
+down_revision: Union[str, None] = '002'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('conditions', sa.Column('aggregate', sa.String(20), nullable=True))
+    op.add_column('conditions', sa.Column('window_seconds', sa.Integer, nullable=True))
+    op.create_check_constraint(
+        'chk_conditions_aggregate', 'conditions',
+        "aggregate IS NULL OR (aggregate IN ('avg', 'change', 'pct_change') AND window_seconds > 0)"
+    )
+
+    # ==================== CONDITION_WINDOWS TABLE ====================
+    # Shared by every condition with the same device, valueType and window
+    op.create_table(
+        'condition_windows',
+        sa.Column('device_id', sa.String(255), nullable=False),
+        sa.Column('value_type', sa.String(100), nullable=False),
+        sa.Column('window_seconds', sa.Integer, nullable=False),
+        sa.Column('state', postgresql.JSONB, nullable=False),
+        sa.Column('updated_at', sa.TIMESTAMP(timezone=True), server_default=sa.text('NOW()')),
+        sa.PrimaryKeyConstraint('device_id', 'value_type', 'window_seconds')
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('condition_windows')
+    op.drop_constraint('chk_conditions_aggregate', 'conditions', type_='check')
+    op.drop_column('conditions', 'window_seconds')
+    op.drop_column('conditions', 'aggregate')
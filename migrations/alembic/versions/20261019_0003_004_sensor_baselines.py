@@ -0,0 +1,55 @@
+"""Streaming anomaly detection baselines
+
+Revision ID: 004
+Revises: 003
+Create Date: 2026-10-19
+
+Adds the 'zscore' condition aggregate: the condition fires on a reading's
+z-score against the sensor's exponentially weighted mean and variance
+(conditions.window_seconds is the EWMA time constant).
+
+Tables:
+- sensor_baselines: one row per device/valueType/time constant with the
+  running mean, variance and reading count, flushed by the consumer once
+  per batch
+"""
+from typing import Sequence, Union
+from alembic import op
+import sqlalchemy as sa
+
+revision: str = '004'
+down_revision: Union[str, None] = '003'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.drop_constraint('chk_conditions_aggregate', 'conditions', type_='check')
+    op.create_check_constraint(
+        'chk_conditions_aggregate', 'conditions',
+        "aggregate IS NULL OR (aggregate IN ('avg', 'change', 'pct_change', 'zscore') AND window_seconds > 0)"
+    )
+
+    # ==================== SENSOR_BASELINES TABLE ====================
+    op.create_table(
+        'sensor_baselines',
+        sa.Column('device_id', sa.String(255), nullable=False),
+        sa.Column('value_type', sa.String(100), nullable=False),
+        sa.Column('window_seconds', sa.Integer, nullable=False),
+        sa.Column('mean', sa.Float, nullable=False),
+        sa.Column('variance', sa.Float, nullable=False),
+        sa.Column('readings', sa.BigInteger, nullable=False),
+        sa.Column('last_reading_at', sa.TIMESTAMP(timezone=True), nullable=False),
+        sa.Column('updated_at', sa.TIMESTAMP(timezone=True), server_default=sa.text('NOW()')),
+        sa.PrimaryKeyConstraint('device_id', 'value_type', 'window_seconds')
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('sensor_baselines')
+    op.execute("DELETE FROM conditions WHERE aggregate = 'zscore'")
+    op.drop_constraint('chk_conditions_aggregate', 'conditions', type_='check')
+    op.create_check_constraint(
+        'chk_conditions_aggregate', 'conditions',
+        "aggregate IS NULL OR (aggregate IN ('avg', 'change', 'pct_change') AND window_seconds > 0)"
+    )
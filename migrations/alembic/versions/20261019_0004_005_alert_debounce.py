@@ -0,0 +1,59 @@
+"""Alert debounce, hysteresis and cooldown
+
+Revision ID: 005
+Revises: 004
+Create Date: 2026-10-19
+
+Lets a condition coalesce repeated triggers into one alert_logs row
+instead of writing a row per reading.
+
+Columns:
+- conditions.cooldown_seconds: triggers within this long of the previous
+  one update the existing alert row
+- conditions.hysteresis: an alert stays active until the value moves back
+  past the threshold by this much; triggers meanwhile update its row
+- alert_logs.condition_id: condition that triggered the alert
+- alert_logs.occurrences: triggers coalesced into the row
+- alert_logs.last_triggered_at: newest of them (timestamp is the first)
+- alert_logs.resolved_at: when the value cleared the hysteresis band
+"""
+from typing import Sequence, Union
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+revision: str = '005'
+down_revision: Union[str, None] = '004'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('conditions', sa.Column('cooldown_seconds', sa.Integer, nullable=True))
+    op.add_column('conditions', sa.Column('hysteresis', sa.Numeric(10, 2), nullable=True))
+    op.create_check_constraint(
+        'chk_conditions_debounce', 'conditions',
+        "(cooldown_seconds IS NULL OR cooldown_seconds >= 0) AND (hysteresis IS NULL OR hysteresis >= 0)"
+    )
+
+    op.add_column('alert_logs', sa.Column('condition_id', postgresql.UUID(as_uuid=True), nullable=True))
+    op.add_column('alert_logs', sa.Column('occurrences', sa.Integer, nullable=False, server_default='1'))
+    op.add_column('alert_logs', sa.Column('last_triggered_at', sa.TIMESTAMP(timezone=True), nullable=True))
+    op.add_column('alert_logs', sa.Column('resolved_at', sa.TIMESTAMP(timezone=True), nullable=True))
+
+    # Latest alert of a condition on a device (the episode new triggers coalesce into)
+    op.create_index('idx_alert_logs_condition_episode', 'alert_logs',
+                    ['condition_id', 'device_id', 'last_triggered_at'],
+                    postgresql_where=sa.text('condition_id IS NOT NULL'))
+
+
+def downgrade() -> None:
+    op.drop_index('idx_alert_logs_condition_episode', table_name='alert_logs')
+    op.drop_column('alert_logs', 'resolved_at')
+    op.drop_column('alert_logs', 'last_triggered_at')
+    op.drop_column('alert_logs', 'occurrences')
+    op.drop_column('alert_logs', 'condition_id')
+
+    op.drop_constraint('chk_conditions_debounce', 'conditions', type_='check')
+    op.drop_column('conditions', 'hysteresis')
+    op.drop_column('conditions', 'cooldown_seconds')
@@ -0,0 +1,41 @@
+"""Alert notification dispatch tracking
+
+Revision ID: 006
+Revises: 005
+Create Date: 2026-10-19
+
+Lets the notification dispatcher (lambda/notifications) pick up newly
+created alert logs without the consumer doing any notification I/O.
+
+Columns:
+- alert_logs.notified_at: set when the dispatcher claims the alert; NULL
+  while pending (existing alerts are marked as already notified)
+- alert_logs.notify_attempts: dispatcher runs that failed to deliver it
+"""
+from typing import Sequence, Union
+from alembic import op
+import sqlalchemy as sa
+
+revision: str = '006'
+down_revision: Union[str, None] = '005'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Default fills existing rows without a table rewrite, then is dropped
+    # so new alerts start out pending
+    op.add_column('alert_logs', sa.Column('notified_at', sa.TIMESTAMP(timezone=True), nullable=True,
+                                          server_default=sa.text('NOW()')))
+    op.alter_column('alert_logs', 'notified_at', server_default=None)
+    op.add_column('alert_logs', sa.Column('notify_attempts', sa.Integer, nullable=False, server_default='0'))
+
+    # Pending alerts only: stays small however large alert_logs grows
+    op.create_index('idx_alert_logs_notify_pending', 'alert_logs', ['created_at'],
+                    postgresql_where=sa.text('notified_at IS NULL'))
+
+
+def downgrade() -> None:
+    op.drop_index('idx_alert_logs_notify_pending', table_name='alert_logs')
+    op.drop_column('alert_logs', 'notify_attempts')
+    op.drop_column('alert_logs', 'notified_at')
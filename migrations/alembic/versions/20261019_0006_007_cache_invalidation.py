@@ -0,0 +1,97 @@
+"""Cache invalidation triggers for conditions and device owners
+
+Revision ID: 007
+Revises: 006
+Create Date: 2026-10-19
+
+Lets containers cache conditions and device owners across invocations
+(lambda/shared/cache.py). Every change bumps a version counter and sends
+the changed keys on the 'cache_invalidation' NOTIFY channel as
+{"cache", "table", "keys"}; notifications are delivered on commit.
+
+Tables:
+- cache_versions: one counter per cache ('conditions', 'device_owners')
+
+Triggers:
+- conditions (any change): cache 'conditions', keyed by value_type
+- devices (insert, delete, change of device_id or user_id): cache
+  'device_owners', keyed by device_id. last_seen_at updates from every
+  telemetry insert do not fire it.
+- users (update): cache 'device_owners', keyed by user id (the cached
+  owner row changed)
+"""
+from typing import Sequence, Union
+from alembic import op
+import sqlalchemy as sa
+
+revision: str = '007'
+down_revision: Union[str, None] = '006'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'cache_versions',
+        sa.Column('name', sa.String(50), primary_key=True),
+        sa.Column('version', sa.BigInteger, nullable=False, server_default='0'),
+    )
+    op.execute("INSERT INTO cache_versions (name) VALUES ('conditions'), ('device_owners')")
+
+    # TG_ARGV: cache name, key column of the changed row (old and new key on update)
+    op.execute('''
+        CREATE OR REPLACE FUNCTION notify_cache_invalidation()
+        RETURNS TRIGGER AS $$
+        DECLARE
+            keys text[] := '{}';
+        BEGIN
+            IF TG_OP <> 'INSERT' THEN
+                keys := keys || (to_jsonb(OLD) ->> TG_ARGV[1]);
+            END IF;
+            IF TG_OP <> 'DELETE' AND (to_jsonb(NEW) ->> TG_ARGV[1]) IS DISTINCT FROM keys[1] THEN
+                keys := keys || (to_jsonb(NEW) ->> TG_ARGV[1]);
+            END IF;
+            UPDATE cache_versions SET version = version + 1 WHERE name = TG_ARGV[0];
+            PERFORM pg_notify('cache_invalidation', json_build_object(
+                'cache', TG_ARGV[0], 'table', TG_TABLE_NAME, 'keys', keys
+            )::text);
+            RETURN NULL;
+        END;
+        $$ language 'plpgsql';
+    ''')
+
+    op.execute('''
+        CREATE TRIGGER conditions_cache_invalidation
+            AFTER INSERT OR UPDATE OR DELETE ON conditions
+            FOR EACH ROW
+            EXECUTE FUNCTION notify_cache_invalidation('conditions', 'value_type')
+    ''')
+    op.execute('''
+        CREATE TRIGGER devices_cache_invalidation
+            AFTER INSERT OR DELETE ON devices
+            FOR EACH ROW
+            EXECUTE FUNCTION notify_cache_invalidation('device_owners', 'device_id')
+    ''')
+    op.execute('''
+        CREATE TRIGGER devices_owner_cache_invalidation
+            AFTER UPDATE OF device_id, user_id ON devices
+            FOR EACH ROW
+            WHEN (OLD.device_id IS DISTINCT FROM NEW.device_id
+                  OR OLD.user_id IS DISTINCT FROM NEW.user_id)
+            EXECUTE FUNCTION notify_cache_invalidation('device_owners', 'device_id')
+    ''')
+    op.execute('''
+        CREATE TRIGGER users_cache_invalidation
+            AFTER UPDATE ON users
+            FOR EACH ROW
+            EXECUTE FUNCTION notify_cache_invalidation('device_owners', 'id')
+    ''')
+
+
+def downgrade() -> None:
+    op.execute('DROP TRIGGER IF EXISTS users_cache_invalidation ON users')
+    op.execute('DROP TRIGGER IF EXISTS devices_owner_cache_invalidation ON devices')
+    op.execute('DROP TRIGGER IF EXISTS devices_cache_invalidation ON devices')
+    op.execute('DROP TRIGGER IF EXISTS conditions_cache_invalidation ON conditions')
+    op.execute('DROP FUNCTION IF EXISTS notify_cache_invalidation()')
+    op.drop_table('cache_versions')
@@ -0,0 +1,90 @@
+"""Alert change feed position
+
+Revision ID: 008
+Revises: 007
+Create Date: 2026-10-19
+
+Lets GET /api/alertlogs/feed return only the alert logs a client has not
+seen yet. Reading timestamps arrive out of order and transactions commit
+out of order, so the feed is ordered by the id of the transaction that
+last wrote each row: every row written by a transaction older than the
+oldest one still running is visible, so nothing is skipped.
+
+Columns:
+- alert_logs.feed_xid: transaction id of the insert, or of the last update
+  that changed what a client shows (occurrences, message, resolved_at).
+  NULL on rows from before this migration.
+
+Triggers:
+- alert_logs (insert, update): NOTIFY 'alert_feed' with the user id, to
+  wake long-polling clients
+"""
+from typing import Sequence, Union
+from alembic import op
+import sqlalchemy as sa
+
+revision: str = '008'
+down_revision: Union[str, None] = '007'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Added without a default (a volatile default would rewrite the table), then set
+    op.add_column('alert_logs', sa.Column('feed_xid', sa.BigInteger, nullable=True))
+    op.alter_column('alert_logs', 'feed_xid', server_default=sa.text('pg_current_xact_id()::text::bigint'))
+    op.create_index('idx_alert_logs_user_feed', 'alert_logs', ['user_id', 'feed_xid', 'id'])
+
+    op.execute('''
+        CREATE OR REPLACE FUNCTION touch_alert_feed()
+        RETURNS TRIGGER AS $$
+        BEGIN
+            NEW.feed_xid = pg_current_xact_id()::text::bigint;
+            RETURN NEW;
+        END;
+        $$ language 'plpgsql';
+    ''')
+    op.execute('''
+        CREATE TRIGGER alert_logs_feed_touch
+            BEFORE UPDATE ON alert_logs
+            FOR EACH ROW
+            WHEN (OLD.occurrences IS DISTINCT FROM NEW.occurrences
+                  OR OLD.message IS DISTINCT FROM NEW.message
+                  OR OLD.resolved_at IS DISTINCT FROM NEW.resolved_at)
+            EXECUTE FUNCTION touch_alert_feed()
+    ''')
+
+    # Identical payloads are sent once per transaction, so a batch of alerts
+    # wakes each user's clients once
+    op.execute('''
+        CREATE OR REPLACE FUNCTION notify_alert_feed()
+        RETURNS TRIGGER AS $$
+        BEGIN
+            PERFORM pg_notify('alert_feed', NEW.user_id::text);
+            RETURN NULL;
+        END;
+        $$ language 'plpgsql';
+    ''')
+    op.execute('''
+        CREATE TRIGGER alert_logs_feed_notify
+            AFTER INSERT ON alert_logs
+            FOR EACH ROW
+            EXECUTE FUNCTION notify_alert_feed()
+    ''')
+    op.execute('''
+        CREATE TRIGGER alert_logs_feed_notify_update
+            AFTER UPDATE ON alert_logs
+            FOR EACH ROW
+            WHEN (OLD.feed_xid IS DISTINCT FROM NEW.feed_xid)
+            EXECUTE FUNCTION notify_alert_feed()
+    ''')
+
+
+def downgrade() -> None:
+    op.execute('DROP TRIGGER IF EXISTS alert_logs_feed_notify_update ON alert_logs')
+    op.execute('DROP TRIGGER IF EXISTS alert_logs_feed_notify ON alert_logs')
+    op.execute('DROP TRIGGER IF EXISTS alert_logs_feed_touch ON alert_logs')
+    op.execute('DROP FUNCTION IF EXISTS notify_alert_feed()')
+    op.execute('DROP FUNCTION IF EXISTS touch_alert_feed()')
+    op.drop_index('idx_alert_logs_user_feed', table_name='alert_logs')
+    op.drop_column('alert_logs', 'feed_xid')
@@ -0,0 +1,120 @@
+"""Statement-level cache invalidation triggers
+
+Revision ID: 009
+Revises: 008
+Create Date: 2026-10-19
+
+The row-level triggers of migration 007 bumped the cache_versions counter
+(and sent a NOTIFY) once per changed row, so a statement touching many
+conditions or devices locked the counter row N times and queued N
+notifications. These triggers run once per statement instead, reading the
+changed keys from the statement's transition tables.
+
+Triggers:
+- conditions (insert, update, delete): cache 'conditions', keyed by
+  value_type, once per statement
+- devices (insert, delete): cache 'device_owners', keyed by device_id,
+  once per statement. Changes of device_id or user_id keep the row-level,
+  column-filtered trigger of 007 (a statement-level trigger cannot skip
+  the last_seen_at updates every telemetry insert makes).
+- users: dropped. The owner cache only keeps the user id, which a users
+  update cannot change; deleting a user cascades to its devices, which
+  fires the devices trigger.
+
+A notification whose key list would exceed the 8000-byte NOTIFY limit is
+sent with "keys": null, which clears the whole cache.
+"""
+from typing import Sequence, Union
+from alembic import op
+
+revision: str = '009'
+down_revision: Union[str, None] = '008'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# (trigger, table, event, REFERENCING clause, cache, key column)
+STATEMENT_TRIGGERS = [
+    ('conditions_cache_invalidation_insert', 'conditions', 'INSERT',
+     'NEW TABLE AS new_rows', 'conditions', 'value_type'),
+    ('conditions_cache_invalidation_update', 'conditions', 'UPDATE',
+     'OLD TABLE AS old_rows NEW TABLE AS new_rows', 'conditions', 'value_type'),
+    ('conditions_cache_invalidation_delete', 'conditions', 'DELETE',
+     'OLD TABLE AS old_rows', 'conditions', 'value_type'),
+    ('devices_cache_invalidation_insert', 'devices', 'INSERT',
+     'NEW TABLE AS new_rows', 'device_owners', 'device_id'),
+    ('devices_cache_invalidation_delete', 'devices', 'DELETE',
+     'OLD TABLE AS old_rows', 'device_owners', 'device_id'),
+]
+
+
+def upgrade() -> None:
+    # TG_ARGV: cache name, key column
+    op.execute('''
+        CREATE OR REPLACE FUNCTION notify_cache_invalidation_statement()
+        RETURNS TRIGGER AS $$
+        DECLARE
+            key_column text := quote_ident(TG_ARGV[1]);
+            keys text[];
+            payload text;
+        BEGIN
+            IF TG_OP = 'INSERT' THEN
+                EXECUTE 'SELECT array_agg(DISTINCT ' || key_column || '::text) FROM new_rows' INTO keys;
+            ELSIF TG_OP = 'DELETE' THEN
+                EXECUTE 'SELECT array_agg(DISTINCT ' || key_column || '::text) FROM old_rows' INTO keys;
+            ELSE
+                EXECUTE 'SELECT array_agg(DISTINCT k) FROM (SELECT ' || key_column || '::text AS k FROM old_rows'
+                     || ' UNION SELECT ' || key_column || '::text FROM new_rows) changed' INTO keys;
+            END IF;
+            IF keys IS NULL THEN
+                -- The statement changed no rows
+                RETURN NULL;
+            END IF;
+
+            UPDATE cache_versions SET version = version + 1 WHERE name = TG_ARGV[0];
+            payload := json_build_object('cache', TG_ARGV[0], 'table', TG_TABLE_NAME, 'keys', keys)::text;
+            IF octet_length(payload) > 7900 THEN
+                payload := json_build_object('cache', TG_ARGV[0], 'table', TG_TABLE_NAME, 'keys', NULL)::text;
+            END IF;
+            PERFORM pg_notify('cache_invalidation', payload);
+            RETURN NULL;
+        END;
+        $$ language 'plpgsql';
+    ''')
+
+    op.execute('DROP TRIGGER IF EXISTS conditions_cache_invalidation ON conditions')
+    op.execute('DROP TRIGGER IF EXISTS devices_cache_invalidation ON devices')
+    op.execute('DROP TRIGGER IF EXISTS users_cache_invalidation ON users')
+
+    for name, table, event, referencing, cache, column in STATEMENT_TRIGGERS:
+        op.execute(f'''
+            CREATE TRIGGER {name}
+                AFTER {event} ON {table}
+                REFERENCING {referencing}
+                FOR EACH STATEMENT
+                EXECUTE FUNCTION notify_cache_invalidation_statement('{cache}', '{column}')
+        ''')
+
+
+def downgrade() -> None:
+    for name, table, *_ in STATEMENT_TRIGGERS:
+        op.execute(f'DROP TRIGGER IF EXISTS {name} ON {table}')
+    op.execute('DROP FUNCTION IF EXISTS notify_cache_invalidation_statement()')
+
+    op.execute('''
+        CREATE TRIGGER conditions_cache_invalidation
+            AFTER INSERT OR UPDATE OR DELETE ON conditions
+            FOR EACH ROW
+            EXECUTE FUNCTION notify_cache_invalidation('conditions', 'value_type')
+    ''')
+    op.execute('''
+        CREATE TRIGGER devices_cache_invalidation
+            AFTER INSERT OR DELETE ON devices
+            FOR EACH ROW
+            EXECUTE FUNCTION notify_cache_invalidation('device_owners', 'device_id')
+    ''')
+    op.execute('''
+        CREATE TRIGGER users_cache_invalidation
+            AFTER UPDATE ON users
+            FOR EACH ROW
+            EXECUTE FUNCTION notify_cache_invalidation('device_owners', 'id')
+    ''')
@@ -42,6 +42,7 @@ module "rds" {
   db_password        = var.db_password
   db_name            = var.db_name
   allowed_sg_ids     = [module.lambda.security_group_id]
+  create_replica     = var.enable_read_replica
 }
 
 module "rabbitmq" {
@@ -56,17 +57,18 @@ module "rabbitmq" {
 }
 
 module "lambda" {
-  source             = "./modules/lambda"
-  project_name       = var.project_name
-  environment        = var.environment
-  vpc_id             = module.vpc.vpc_id
-  private_subnet_ids = module.vpc.private_subnet_ids
-  secrets_arn        = module.secrets.secret_arn
-  s3_bucket_name     = module.s3.bucket_name
-  s3_bucket_arn      = module.s3.bucket_arn
-  rds_endpoint       = module.rds.endpoint
-  rds_db_name        = var.db_name
-  rabbitmq_endpoint  = module.rabbitmq.broker_endpoint
+  source              = "./modules/lambda"
+  project_name        = var.project_name
+  environment         = var.environment
+  vpc_id              = module.vpc.vpc_id
+  private_subnet_ids  = module.vpc.private_subnet_ids
+  secrets_arn         = module.secrets.secret_arn
+  s3_bucket_name      = module.s3.bucket_name
+  s3_bucket_arn       = module.s3.bucket_arn
+  rds_endpoint        = module.rds.endpoint
+  rds_reader_endpoint = module.rds.reader_endpoint
+  rds_db_name         = var.db_name
+  rabbitmq_endpoint   = module.rabbitmq.broker_endpoint
 }
 
 module "monitoring" {
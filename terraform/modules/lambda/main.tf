@@ -79,6 +79,14 @@ resource "aws_iam_role_policy" "lambda_custom" {
           "sqs:GetQueueAttributes"
         ]
         Resource = "*"
+      },
+      {
+        Effect = "Allow"
+        Action = [
+          "ses:SendEmail",
+          "sns:Publish"
+        ]
+        Resource = "*"
       }
     ]
   })
@@ -101,7 +109,7 @@ locals {
   # API-triggered functions
   lambda_functions = ["users", "devices", "telemetry", "conditions", "alertlogs", "admin"]
   # Background consumer functions (triggered by CloudWatch Events)
-  consumer_functions = ["consumers"]
+  consumer_functions = ["consumers", "notifications"]
 }
 
 resource "aws_lambda_function" "functions" {
@@ -132,6 +140,10 @@ resource "aws_lambda_function" "functions" {
       S3_BUCKET     = var.s3_bucket_name
       QUEUE_NAME    = "telemetry-queue"
       ENVIRONMENT   = var.environment
+
+      DB_READER_HOST        = var.rds_reader_endpoint
+      SILENT_DEVICE_MINUTES = "60"
+      PRIORITY_QUEUE_NAME   = "telemetry-priority-queue" # readings that may trigger an alert
     }
   }
 
@@ -150,9 +162,10 @@ resource "aws_apigatewayv2_api" "main" {
   protocol_type = "HTTP"
 
   cors_configuration {
-    allow_origins = ["*"]
-    allow_methods = ["GET", "POST", "PUT", "PATCH", "DELETE", "OPTIONS"]
-    allow_headers = ["Content-Type", "Authorization", "X-Requested-With"]
+    allow_origins  = ["*"]
+    allow_methods  = ["GET", "POST", "PUT", "PATCH", "DELETE", "OPTIONS"]
+    allow_headers  = ["Content-Type", "Authorization", "X-Requested-With", "If-None-Match"]
+    expose_headers = ["ETag"]
   }
 }
 
@@ -232,6 +245,7 @@ locals {
     ]
     alertlogs = [
       "GET /api/alertlogs",
+      "GET /api/alertlogs/feed",
       "DELETE /api/alertlogs"
     ]
     admin = [
@@ -239,7 +253,8 @@ locals {
       "PUT /api/manage/change-user-type",
       "POST /api/manage/create-admin",
       "GET /api/manage/processed-images",
-      "POST /api/manage/transfer-device"
+      "POST /api/manage/transfer-device",
+      "GET /api/manage/silent-devices"
     ]
   }
 }
@@ -292,6 +307,13 @@ resource "aws_lambda_function" "consumer" {
       S3_BUCKET     = var.s3_bucket_name
       QUEUE_NAME    = "telemetry-queue"
       ENVIRONMENT   = var.environment
+
+      CONSUMER_MODE                = "sync" # "threads": per-device thread pool; "async": asyncio pipeline
+      CONSUMER_BATCH_SIZE          = "10"
+      PRIORITY_QUEUE_NAME          = "telemetry-priority-queue" # drained before QUEUE_NAME
+      CONSUMER_THREADS             = "4"
+      CONSUMER_VECTORIZE_MIN_BATCH = "50" # evaluate larger batches with numpy
+      DB_MAX_IDLE_CONNECTIONS      = "4"  # one pooled connection per consumer thread
     }
   }
 
@@ -329,3 +351,103 @@ resource "aws_lambda_permission" "allow_cloudwatch" {
   principal     = "events.amazonaws.com"
   source_arn    = aws_cloudwatch_event_rule.consumer_schedule.arn
 }
+
+# ============================================
+# NOTIFICATION DISPATCHER
+# ============================================
+# Sends digests for new alert logs (email via SES, SMS via SNS);
+# the schedule interval is the digest window
+
+resource "aws_lambda_function" "notifications" {
+  filename         = "${path.module}/../../../lambda/build/notifications.zip"
+  function_name    = "${var.project_name}-${var.environment}-notifications"
+  role             = aws_iam_role.lambda_exec.arn
+  handler          = "handler.main"
+  source_code_hash = fileexists("${path.module}/../../../lambda/build/notifications.zip") ? filebase64sha256("${path.module}/../../../lambda/build/notifications.zip") : ""
+  runtime          = "python3.10"
+  timeout          = 60
+  memory_size      = 256
+
+  layers = [aws_lambda_layer_version.shared.arn]
+
+  vpc_config {
+    subnet_ids         = var.private_subnet_ids
+    security_group_ids = [aws_security_group.lambda.id]
+  }
+
+  environment {
+    variables = {
+      SECRETS_ARN = var.secrets_arn
+      DB_HOST     = var.rds_endpoint
+      DB_NAME     = var.rds_db_name
+      ENVIRONMENT = var.environment
+
+      NOTIFY_CONCURRENCY = "8" # digests delivered at once
+      NOTIFY_EMAIL_FROM  = ""  # verified SES sender; email is skipped while empty
+    }
+  }
+
+  lifecycle {
+    ignore_changes = [source_code_hash]
+  }
+
+  tags = {
+    Name    = "${var.project_name}-${var.environment}-notifications"
+    Purpose = "Alert notification dispatcher"
+  }
+}
+
+resource "aws_cloudwatch_event_rule" "notifications_schedule" {
+  name                = "${var.project_name}-${var.environment}-notifications-schedule"
+  description         = "Triggers alert notification dispatch every minute"
+  schedule_expression = "rate(1 minute)"
+
+  tags = {
+    Name = "${var.project_name}-${var.environment}-notifications-schedule"
+  }
+}
+
+resource "aws_cloudwatch_event_target" "notifications_target" {
+  rule      = aws_cloudwatch_event_rule.notifications_schedule.name
+  target_id = "NotificationsLambda"
+  arn       = aws_lambda_function.notifications.arn
+}
+
+resource "aws_lambda_permission" "allow_cloudwatch_notifications" {
+  statement_id  = "AllowExecutionFromCloudWatch"
+  action        = "lambda:InvokeFunction"
+  function_name = aws_lambda_function.notifications.function_name
+  principal     = "events.amazonaws.com"
+  source_arn    = aws_cloudwatch_event_rule.notifications_schedule.arn
+}
+
+# ============================================
+# SILENT DEVICE SWEEP
+# ============================================
+# Invokes the admin Lambda with a scheduled payload that creates
+# alert logs for devices that stopped reporting
+
+resource "aws_cloudwatch_event_rule" "silent_device_sweep" {
+  name                = "${var.project_name}-${var.environment}-silent-device-sweep"
+  description         = "Triggers silent device sweep every 5 minutes"
+  schedule_expression = "rate(5 minutes)"
+
+  tags = {
+    Name = "${var.project_name}-${var.environment}-silent-device-sweep"
+  }
+}
+
+resource "aws_cloudwatch_event_target" "silent_device_sweep_target" {
+  rule      = aws_cloudwatch_event_rule.silent_device_sweep.name
+  target_id = "AdminSilentDeviceSweep"
+  arn       = aws_lambda_function.functions["admin"].arn
+  input     = jsonencode({ action = "silent-device-sweep" })
+}
+
+resource "aws_lambda_permission" "allow_silent_device_sweep" {
+  statement_id  = "AllowSilentDeviceSweepFromCloudWatch"
+  action        = "lambda:InvokeFunction"
+  function_name = aws_lambda_function.functions["admin"].function_name
+  principal     = "events.amazonaws.com"
+  source_arn    = aws_cloudwatch_event_rule.silent_device_sweep.arn
+}
@@ -5,7 +5,7 @@ output "api_gateway_url" {
 output "function_names" {
   value = concat(
     [for f in aws_lambda_function.functions : f.function_name],
-    [aws_lambda_function.consumer.function_name]
+    [aws_lambda_function.consumer.function_name, aws_lambda_function.notifications.function_name]
   )
 }
 
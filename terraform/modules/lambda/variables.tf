@@ -6,5 +6,9 @@ variable "secrets_arn" { type = string }
 variable "s3_bucket_name" { type = string }
 variable "s3_bucket_arn" { type = string }
 variable "rds_endpoint" { type = string }
+variable "rds_reader_endpoint" {
+  type    = string
+  default = ""
+}
 variable "rds_db_name" { type = string }
 variable "rabbitmq_endpoint" { type = string }
@@ -108,3 +108,28 @@ resource "aws_db_instance" "postgres" {
 
   tags = { Name = "${var.project_name}-${var.environment}-postgres" }
 }
+
+# ============================================
+# READ REPLICA (optional)
+# ============================================
+# Serves the Lambda GET endpoints (telemetry history, alert logs, device
+# lists) so dashboard reads don't compete with telemetry ingestion.
+resource "aws_db_instance" "replica" {
+  count = var.create_replica ? 1 : 0
+
+  identifier          = "${var.project_name}-${var.environment}-postgres-replica"
+  replicate_source_db = aws_db_instance.postgres.identifier
+  instance_class      = "db.t3.micro"
+  storage_encrypted   = true
+
+  vpc_security_group_ids = [aws_security_group.rds.id]
+  parameter_group_name   = aws_db_parameter_group.postgres.name
+
+  publicly_accessible = false
+  skip_final_snapshot = true
+
+  performance_insights_enabled          = true
+  performance_insights_retention_period = 7
+
+  tags = { Name = "${var.project_name}-${var.environment}-postgres-replica" }
+}
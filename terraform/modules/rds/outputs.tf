@@ -1,4 +1,7 @@
 output "endpoint" { value = aws_db_instance.postgres.endpoint }
+output "reader_endpoint" {
+  value = var.create_replica ? aws_db_instance.replica[0].endpoint : ""
+}
 output "address" { value = aws_db_instance.postgres.address }
 output "port" { value = aws_db_instance.postgres.port }
 output "instance_id" { value = aws_db_instance.postgres.id }
@@ -9,3 +9,7 @@ variable "db_password" {
 }
 variable "db_name" { type = string }
 variable "allowed_sg_ids" { type = list(string) }
+variable "create_replica" {
+  type    = bool
+  default = false
+}
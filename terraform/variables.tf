@@ -80,3 +80,9 @@ variable "enable_eks" {
   default     = false
 }
 
+variable "enable_read_replica" {
+  description = "Create an RDS read replica and route read-only Lambda queries to it"
+  type        = bool
+  default     = false
+}
+